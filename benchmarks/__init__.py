@@ -0,0 +1 @@
+"""Micro-benchmarks for the python-cookbook recipes."""
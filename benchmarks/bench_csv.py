@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Benchmark for the parallel CSV ingestion mode of iotools.
+
+Compares the sequential read_csv_to_array against the parallel byte-range
+mode. Run with: python -m benchmarks.bench_csv
+"""
+
+import os
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+import click
+
+from recipes import iotools
+
+
+def write_test_file(csv_path, rows):
+    """Write a CSV - file with the given number of rows."""
+    iotools.write_list_to_file(
+        (f'{i};"name {i}";{i / 3};"quoted ""field"" {i}";{i % 7}'
+         for i in range(rows)), csv_path)
+
+
+@click.command()
+@click.option('--rows', '-r', default=2000000, show_default=True,
+              help='Number of rows in the test file')
+@click.option('--processes', '-p', default=os.cpu_count(), show_default=True,
+              help='Number of worker processes')
+def main(rows, processes):  # noqa: D103
+    with TemporaryDirectory() as tmp_dir:
+        csv_path = os.path.join(tmp_dir, 'bench.csv')
+        write_test_file(csv_path, rows)
+        start = perf_counter()
+        sequential = iotools.read_csv_to_array(csv_path)
+        sequential_time = perf_counter() - start
+        start = perf_counter()
+        parallel = iotools.read_csv_to_array(csv_path, processes=processes)
+        parallel_time = perf_counter() - start
+        start = perf_counter()
+        projected = [row for chunk in iotools.iter_csv_chunks_parallel(
+            csv_path, processes=processes, columns=[0, 4],
+            converters={0: int, 4: int}) for row in chunk]
+        projected_time = perf_counter() - start
+    assert sequential == parallel
+    assert len(projected) == rows
+    print(f'sequential {sequential_time:8.3f} sec')
+    print(f'parallel   {parallel_time:8.3f} sec ({processes} processes)')
+    print(f'projected  {projected_time:8.3f} sec (2 of 5 columns)')
+    print(f'speed-up = {sequential_time / parallel_time:.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Benchmark for hosting many periodic jobs with recipes.daemon.
+
+Registers increasing numbers of no-op jobs with random intervals in one
+DaemonHost and reports the CPU time spent per tick and the lag of the
+ticks behind their deadlines. Then does the same for AsyncDaemons sharing
+one event loop.
+Run with: python -m benchmarks.bench_daemon
+"""
+
+import asyncio
+from random import Random
+from time import process_time, sleep
+
+import click
+
+from recipes.daemon import AsyncDaemon, DaemonHost
+
+
+def noop():
+    """Do nothing, i.e. a tick with no cost of its own."""
+
+
+class NoopDaemon(AsyncDaemon):
+    """Asynchronous daemon doing nothing but yielding to the loop."""
+
+    async def _run_daemon_process(self):
+        await asyncio.sleep(0)
+
+
+async def run_async_daemons(daemons, runtime):
+    """Run the daemons in the current event loop for the given time."""
+    tasks = [asyncio.ensure_future(instance.run()) for instance in daemons]
+    await asyncio.sleep(runtime)
+    for instance in daemons:
+        instance.request_stop()
+    await asyncio.gather(*tasks)
+
+
+def report(kind, count, cpu, metrics):
+    """Print the tick statistics of a benchmark run."""
+    ticks = sum(job.ticks for job in metrics)
+    mean_lag = sum(job.mean_lag * job.ticks for job in metrics) / ticks
+    max_lag = max(job.max_lag for job in metrics)
+    print(f'{kind:<6} {count:>6} {ticks:>8} {cpu / ticks * 1e6:>8.1f}us '
+          + f'{mean_lag * 1e3:>8.2f}ms {max_lag * 1e3:>8.1f}ms')
+
+
+@click.command()
+@click.option('--jobs', '-j', default=[100, 1000, 10000], multiple=True,
+              show_default=True, help='Numbers of jobs to benchmark')
+@click.option('--runtime', '-r', default=10.0, show_default=True,
+              help='Seconds to run each host')
+def main(jobs, runtime):  # noqa: D103
+    print(f'{"kind":<6} {"jobs":>6} {"ticks":>8} {"cpu/tick":>10} '
+          + f'{"mean lag":>10} {"max lag":>10}')
+    for count in jobs:
+        random = Random(count)
+        host = DaemonHost(max_workers=8)
+        scheduled = [host.add_job(noop, interval=random.uniform(1, 5))
+                     for _ in range(count)]
+        start = process_time()
+        host.start()
+        sleep(runtime)
+        host.stop()
+        cpu = process_time() - start
+        report('host', count, cpu, [job.metrics() for job in scheduled])
+    for count in jobs:
+        random = Random(count)
+        daemons = [NoopDaemon(random.uniform(1, 5)) for _ in range(count)]
+        start = process_time()
+        asyncio.run(run_async_daemons(daemons, runtime))
+        cpu = process_time() - start
+        report('async', count, cpu, [instance.metrics()
+                                     for instance in daemons])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Benchmark for the batch conversion functions of date_tools.
+
+Compares the per-item cost of the scalar conversion functions against
+their batch variants, with and without NumPy.
+Run with: python -m benchmarks.bench_date_tools
+"""
+
+from datetime import datetime
+from random import uniform
+from time import perf_counter
+from unittest.mock import patch
+from zoneinfo import ZoneInfo
+
+import click
+
+from recipes import date_tools
+
+
+def per_item_ns(func, values, count):
+    """Return the cost of func(values) in nanoseconds per item."""
+    start = perf_counter()
+    func(values)
+    return (perf_counter() - start) / count * 1e9
+
+
+@click.command()
+@click.option('--count', '-c', default=500000, show_default=True,
+              help='Number of values to convert')
+def main(count):  # noqa: D103
+    # One day of log timestamps, i.e. many values per distinct minute
+    epochs = [uniform(1.6e9, 1.6e9 + 86400) for _ in range(count)]
+    timestamps = date_tools.epochs_to_timestamps(epochs)
+    numpy = date_tools._import_numpy()
+    scenarios = [
+        ('epoch_to_timestamp', epochs, lambda values: [
+            date_tools.epoch_to_timestamp(value) for value in values],
+         date_tools.epochs_to_timestamps),
+        ('timestamp_to_epoch', timestamps, lambda values: [
+            date_tools.timestamp_to_epoch(value) for value in values],
+         date_tools.timestamps_to_epochs),
+    ]
+    print(f'{"function":<20} {"scalar":>10} {"python":>10} {"numpy":>10}'
+          + '  (ns per item)')
+    for name, values, scalar, batch in scenarios:
+        scalar_ns = per_item_ns(scalar, values, count)
+        with patch.object(date_tools, '_import_numpy', lambda: None):
+            python_ns = per_item_ns(batch, values, count)
+        numpy_ns = '-'
+        if numpy is not None:
+            numpy_ns = f'{per_item_ns(batch, numpy.array(values), count):.0f}'
+        print(f'{name:<20} {scalar_ns:>10.0f} {python_ns:>10.0f} '
+              + f'{numpy_ns:>10}')
+    strptime_ns = per_item_ns(lambda values: [datetime.strptime(
+        value, date_tools.DEFAULT_CONVERT_FORMAT) for value in values],
+        timestamps, count)
+    compiled_ns = per_item_ns(lambda values: [
+        date_tools.timestamp_to_dto(value) for value in values],
+        timestamps, count)
+    print(f'timestamp_to_dto: strptime {strptime_ns:.0f} ns, '
+          + f'compiled parser {compiled_ns:.0f} ns per item')
+    zone = ZoneInfo('Europe/Berlin')
+    converter = date_tools.TimezoneConverter(zone)
+    dtos = converter.epochs_to_dtos(epochs)
+    wall_times = [dto.replace(tzinfo=None) for dto in dtos]
+    zoneinfo_ns = per_item_ns(lambda values: [
+        value.replace(tzinfo=zone).timestamp() for value in values],
+        wall_times, count)
+    converter_ns = per_item_ns(converter.dtos_to_epochs, wall_times, count)
+    print(f'wall time to epoch: zoneinfo {zoneinfo_ns:.0f} ns, '
+          + f'TimezoneConverter {converter_ns:.0f} ns per item')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Micro-benchmark for the file hashing engine of iotools.
+
+Compares the throughput of iotools.md5sum against the former 8 KiB
+read-loop implementation. Run with: python -m benchmarks.bench_filehash
+"""
+
+import hashlib
+import os
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+import click
+
+from recipes import iotools
+
+
+def legacy_md5sum(filename):
+    """Hash a file like md5sum did before the mmap/readinto engine."""
+    md5 = hashlib.md5()
+    with open(filename, 'rb') as input_file_handle:
+        for chunk in iter(lambda: input_file_handle.read(
+                128 * md5.block_size), b''):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+def write_test_file(filename, size_mb):
+    """Write a file of the given size filled with random data."""
+    block = os.urandom(1024 * 1024)
+    with open(filename, 'wb') as output_file_handle:
+        for _ in range(size_mb):
+            output_file_handle.write(block)
+
+
+def measure(func, *args, **kwargs):
+    """Return result and duration of the best of three runs."""
+    durations = []
+    for _ in range(3):
+        start = perf_counter()
+        result = func(*args, **kwargs)
+        durations.append(perf_counter() - start)
+    return result, min(durations)
+
+
+@click.command()
+@click.option('--size-mb', '-s', default=2048, show_default=True,
+              help='Size of the test file in MiB')
+@click.option('--chunk-size', '-c', default=iotools.HASH_CHUNK_SIZE,
+              show_default=True, help='Chunk size of the new engine')
+def main(size_mb, chunk_size):  # noqa: D103
+    with TemporaryDirectory() as tmp_dir:
+        filename = os.path.join(tmp_dir, 'bench.bin')
+        write_test_file(filename, size_mb)
+        legacy_digest, legacy_time = measure(legacy_md5sum, filename)
+        digest, engine_time = measure(
+            iotools.filehash, filename, 'md5', chunk_size)
+    assert digest == legacy_digest
+    for name, duration in [('legacy', legacy_time), ('engine', engine_time)]:
+        print(f'{name:<8} {duration:8.3f} sec  '
+              + f'{size_mb / duration:8.1f} MiB/s')
+    print(f'speed-up = {legacy_time / engine_time:.2f}')
+
+
+if __name__ == '__main__':
+    main()
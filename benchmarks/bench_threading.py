@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Benchmark for the pools of recipes.threading.
+
+Pushes many tiny tasks through ThreadPool.map and reports the throughput
+and the peak memory allocated while doing so. Compares the queue-based
+ThreadPool with the WorkStealingPool for uniform, skewed and very
+fine-grained workloads. Then compares the thread and process pools for
+CPU-bound tasks, and returning large arrays from processes by pickling
+and through shared memory.
+Run with: python -m benchmarks.bench_threading
+"""
+
+import tracemalloc
+from time import perf_counter, sleep
+
+import click
+
+from recipes.threading import (ProcessPool, ThreadPool, WorkStealingPool,
+                               get_cpus)
+
+
+def noop(value):
+    """Return the value, i.e. a task with no cost of its own."""
+    return value
+
+
+def spin(iterations):
+    """Burn CPU in pure Python, i.e. while holding the GIL."""
+    total = 0
+    for value in range(iterations):
+        total += value * value
+    return total
+
+
+def make_array(size):
+    """Return a float array of the given size."""
+    import numpy
+    return numpy.ones(size)
+
+
+def scheduled(pool, func, items):
+    """Return the seconds it takes to run func for all items as tasks."""
+    start = perf_counter()
+    for item in items:
+        pool.add_task(func, item)
+    pool.wait_completion()
+    return perf_counter() - start
+
+
+def timed(pool, func, items):
+    """Return the seconds it takes to map func over the items."""
+    start = perf_counter()
+    for _ in pool.map(func, items):
+        pass
+    return perf_counter() - start
+
+
+@click.command()
+@click.option('--count', '-c', default=200000, show_default=True,
+              help='Number of tasks')
+@click.option('--threads', '-t', default=8, show_default=True,
+              help='Number of threads')
+@click.option('--window', '-w', default=64, show_default=True,
+              help='Tasks in flight for map')
+def main(count, threads, window):  # noqa: D103
+    with ThreadPool(threads) as pool:
+        tracemalloc.start()
+        start = perf_counter()
+        total = sum(pool.map(noop, range(count), window=window))
+        elapsed = perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        stats = pool.stats()
+    assert total == count * (count - 1) // 2
+    print(f'map: {count / elapsed:.0f} tasks/s, peak memory '
+          + f'{peak / 1024:.0f} KiB, mean wait '
+          + f'{stats.wait_time / stats.completed * 1e6:.0f} us, '
+          + f'mean run {stats.run_time / stats.completed * 1e6:.1f} us')
+    workloads = [
+        ('uniform', sleep, [0.002] * 1000),
+        ('skewed', sleep, [0.2] * threads + [0.0005] * 2000),
+        ('fine-grained', noop, range(count)),
+    ]
+    print(f'{"workload":<14} {"queue":>8} {"stealing":>9}  (seconds)')
+    for name, func, items in workloads:
+        with ThreadPool(threads) as pool:
+            queue_time = scheduled(pool, func, items)
+        with WorkStealingPool(threads) as pool:
+            stealing_time = scheduled(pool, func, items)
+        print(f'{name:<14} {queue_time:>8.2f} {stealing_time:>9.2f}')
+    cpus = get_cpus()
+    spins = [20000] * 400
+    with ThreadPool(cpus) as pool:
+        thread_time = timed(pool, spin, spins)
+    with ProcessPool(cpus) as pool:
+        process_time = timed(pool, spin, spins)
+    print(f'CPU-bound on {cpus} cpus: threads {thread_time:.2f} s, '
+          + f'processes {process_time:.2f} s')
+    sizes = [1000000] * 50
+    with ProcessPool(cpus, chunk_size=1) as pool:
+        pickled_time = timed(pool, make_array, sizes)
+    with ProcessPool(cpus, chunk_size=1, shared_results=True) as pool:
+        shared_time = timed(pool, make_array, sizes)
+    print(f'8 MB array results: pickled {pickled_time:.2f} s, '
+          + f'shared memory {shared_time:.2f} s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Benchmark for downloading files with recipes.web.
+
+Serves a file from a local HTTP server and compares reading the whole
+response into memory with streaming it through download_file, by time and
+peak memory. Then compares single and parallel ranged downloads and many
+small downloads with fresh and pooled connections.
+Run with: python -m benchmarks.bench_web
+"""
+
+import os
+import tracemalloc
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from tempfile import TemporaryDirectory
+from threading import Thread
+from time import perf_counter
+from urllib.request import urlopen
+
+import click
+
+from recipes import web
+
+
+class Handler(SimpleHTTPRequestHandler):
+    """Serve files with keep-alive and single byte ranges."""
+
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def send_head(self):  # noqa: D102
+        header = self.headers.get('Range', '')
+        if not header.startswith('bytes='):
+            return super().send_head()
+        handle = open(self.translate_path(self.path), 'rb')
+        size = os.fstat(handle.fileno()).st_size
+        first, _, last = header[6:].partition('-')
+        first, last = int(first), min(int(last or size - 1), size - 1)
+        handle.seek(first)
+        self.send_response(206)
+        self.send_header('Content-Range', f'bytes {first}-{last}/{size}')
+        self.send_header('Content-Length', str(last - first + 1))
+        self.end_headers()
+        return _Limited(handle, last - first + 1)
+
+    def log_message(self, *_):  # noqa: D102
+        pass
+
+
+class _Limited():
+
+    def __init__(self, handle, size):
+        self.handle = handle
+        self.size = size
+
+    def read(self, size):
+        data = self.handle.read(min(size, self.size))
+        self.size -= len(data)
+        return data
+
+    def close(self):
+        self.handle.close()
+
+
+def read_all(url, target):
+    """Download a file the old way, holding the whole body in memory."""
+    with urlopen(url) as remote_file, open(target, 'wb') as output:
+        output.write(remote_file.read())
+
+
+def measured(func, *args, **kargs):
+    """Return the seconds and peak memory in MiB of running func."""
+    tracemalloc.start()
+    start = perf_counter()
+    func(*args, **kargs)
+    elapsed = perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak / 1024 / 1024
+
+
+@click.command()
+@click.option('--size', '-s', default=256, show_default=True,
+              help='Size of the large file in MiB')
+@click.option('--small', '-n', default=500, show_default=True,
+              help='Number of small downloads')
+def main(size, small):  # noqa: D103
+    with TemporaryDirectory() as tmp:
+        with open(os.path.join(tmp, 'large'), 'wb') as handle:
+            for _ in range(size):
+                handle.write(os.urandom(1024 * 1024))
+        with open(os.path.join(tmp, 'small'), 'wb') as handle:
+            handle.write(os.urandom(16 * 1024))
+        server = ThreadingHTTPServer(
+            ('127.0.0.1', 0), partial(Handler, directory=tmp))
+        Thread(target=server.serve_forever, daemon=True).start()
+        url = f'http://127.0.0.1:{server.server_port}'
+        target = os.path.join(tmp, 'target')
+        print(f'{"method":<22} {"seconds":>8} {"peak MiB":>9}')
+        runs = [
+            ('read whole body', read_all, {}),
+            ('stream', web.download_file, {}),
+            ('stream, 4 ranges', web.download_file, {'connections': 4}),
+        ]
+        for name, func, kargs in runs:
+            elapsed, peak = measured(func, f'{url}/large', target, **kargs)
+            print(f'{name:<22} {elapsed:>8.2f} {peak:>9.1f}')
+        start = perf_counter()
+        for _ in range(small):
+            read_all(f'{url}/small', target)
+        fresh_time = perf_counter() - start
+        start = perf_counter()
+        with web.ConnectionPool() as pool:
+            for _ in range(small):
+                web.download_file(f'{url}/small', target, pool=pool)
+        pooled_time = perf_counter() - start
+        print(f'{small} small files: fresh connections {fresh_time:.2f} s, '
+              + f'pooled {pooled_time:.2f} s')
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -2,76 +2,581 @@
 # -*- coding: utf-8 -*-
 """An extendable daemon implementation."""
 
+import asyncio
 import logging
-from datetime import datetime
-from threading import Lock, Thread
-from time import sleep
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from heapq import heappop, heappush
+from itertools import count
+from threading import Condition, Event, Lock, Thread
+from time import monotonic, sleep
 
+DaemonMetrics = namedtuple('DaemonMetrics', [
+    'ticks', 'failed', 'skipped', 'coalesced', 'last_lag', 'mean_lag',
+    'max_lag', 'last_latency', 'mean_latency', 'max_latency'])
+"""Tick counters and lag/latency statistics in seconds of a daemon."""
+OVERRUN_POLICIES = ('skip', 'queue', 'coalesce')
+"""What a daemon does with ticks due while all of its workers are busy."""
+MAX_BACKLOG = 10
+"""Default number of overrun ticks waiting with the ``'queue'`` policy."""
 
-class Daemon():
-    """An extendable daemon implementation."""
 
-    interval = 30.0
-    stopped = False
-    lock = Lock()
-    daemon_locked = False
-    main_thread = None
+class _TickMetrics():
+    """Lag and latency bookkeeping of periodically run ticks."""
 
-    def __init__(self, interval):
+    def metrics(self):
+        """Return the tick counters and statistics as ``DaemonMetrics``."""
+        with self._lock:
+            metrics = dict(self._metrics)
+        ran = metrics['ticks'] + metrics['failed']
+        if ran:
+            metrics['mean_lag'] /= ran
+            metrics['mean_latency'] /= ran
+        return DaemonMetrics(**metrics)
+
+    def _overrun(self, deadline):
+        """Handle a tick due while no further one can run."""
+        if self.overrun == 'skip':
+            logging.debug('Daemon already processing')
+            self._metrics['skipped'] += 1
+        elif self.overrun == 'coalesce' and self._backlog:
+            self._metrics['coalesced'] += 1
+        else:
+            if len(self._backlog) >= self.max_backlog:
+                # keep the most recent deadlines to catch up with
+                self._backlog.popleft()
+                self._metrics['skipped'] += 1
+            self._backlog.append(deadline)
+
+    def _run_tick(self, func, deadline):
+        started = monotonic()
+        try:
+            func()
+            failed = False
+        except Exception:
+            logging.exception('Daemon process failed')
+            failed = True
+        self._record(started - deadline, monotonic() - started, failed)
+
+    def _record(self, lag, latency, failed):
+        with self._lock:
+            metrics = self._metrics
+            metrics['failed' if failed else 'ticks'] += 1
+            metrics['last_lag'] = lag
+            metrics['mean_lag'] += lag
+            metrics['max_lag'] = max(metrics['max_lag'], lag)
+            metrics['last_latency'] = latency
+            metrics['mean_latency'] += latency
+            metrics['max_latency'] = max(metrics['max_latency'], latency)
+
+
+class Daemon(_TickMetrics):
+    """An extendable daemon implementation.
+
+    Ticks are due on deadlines of the monotonic clock, the n-th one at
+    ``n * interval`` seconds after the start, so the schedule does not
+    drift with the time spent in ticks. They run on a pool of
+    ``max_workers`` threads that is reused for the lifetime of the daemon.
+    A tick due while all workers are busy is dropped with the ``'skip'``
+    overrun policy, run as soon as a worker is free with ``'queue'``, or
+    merged with other waiting ticks into a single one with ``'coalesce'``.
+    Queued ticks run back to back once a worker is free, their lag still
+    counts from their own deadline. At most ``max_backlog`` of them wait,
+    beyond that the oldest one is dropped and counted as skipped.
+    ``stop`` returns without waiting for the next deadline. ``metrics``
+    reports the lag of every tick behind its deadline and its latency,
+    i.e. how long it ran.
+    """
+
+    def __init__(self, interval, overrun='skip', max_workers=1,
+                 max_backlog=MAX_BACKLOG):
         """Construct a new daemon instance."""
+        _validate_overrun(overrun, max_backlog)
         self.interval = float(interval)
+        self.overrun = overrun
+        self.max_backlog = max_backlog
+        self.max_workers = max_workers
         self.main_thread = Thread(target=self._main_loop)
+        self._stop_event = Event()
+        self._lock = Lock()
+        self._executor = None
+        self._active = 0
+        self._backlog = deque()
+        self._metrics = dict.fromkeys(DaemonMetrics._fields, 0)
+
+    @property
+    def stopped(self):
+        """Return whether the daemon has been asked to stop."""
+        return self._stop_event.is_set()
+
+    @stopped.setter
+    def stopped(self, value):
+        """Ask the daemon to stop, or clear a pending request to stop."""
+        if value:
+            self._stop_event.set()
+        else:
+            self._stop_event.clear()
 
     def start(self):
         """Start the daemon."""
+        self._executor = ThreadPoolExecutor(self.max_workers)
         self.main_thread.start()
 
     def stop(self):
-        """Stop the daemon."""
-        self.stopped = True
+        """Stop the daemon and wait for running ticks to finish."""
+        self._stop_event.set()
         self.main_thread.join()
+        with self._lock:
+            self._backlog.clear()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
 
     def _main_loop(self):
         # single-run mode
         if self.interval <= 0:
-            self._invoke_process()
+            self._dispatch(monotonic())
             return
         # interval mode
-        while not self.stopped:
-            thr = Thread(target=self._invoke_process)
-            thr.start()
-            sleep(self.interval)
+        start = monotonic()
+        tick = 0
+        while True:
+            deadline = start + tick * self.interval
+            if self._stop_event.wait(max(0, deadline - monotonic())):
+                return
+            self._dispatch(deadline)
+            tick += 1
+
+    def _dispatch(self, deadline):
+        with self._lock:
+            if self._active >= self.max_workers:
+                self._overrun(deadline)
+                return
+            self._active += 1
+        self._executor.submit(self._run_ticks, deadline)
+
+    def _run_ticks(self, deadline):
+        # keeps the worker busy with the backlog before returning it
+        while True:
+            self._run_tick(self._invoke_process, deadline)
+            with self._lock:
+                if not self._backlog or self._stop_event.is_set():
+                    self._active -= 1
+                    return
+                deadline = self._backlog.popleft()
 
     def _invoke_process(self):
-        if self.daemon_locked:
-            logging.debug('Daemon already processing')
-            return
-        self._lock_daemon()
         self._run_daemon_process()
-        self._unlock_daemon()
 
     def _run_daemon_process(self):
         """Override with your implementation."""
         pass
 
-    def _lock_daemon(self):
-        self.lock.acquire()
-        self.daemon_locked = True
-        self.lock.release()
 
-    def _unlock_daemon(self):
-        self.lock.acquire()
-        self.daemon_locked = False
-        self.lock.release()
+class CronSpec():
+    """A cron-like schedule parsed from ``minute hour day month weekday``.
+
+    Fields take ``*``, numbers, ranges like ``1-5``, steps like ``*/15`` or
+    ``10-50/20`` and comma-separated lists of those. Weekdays count from 0
+    (or 7) for Sunday. Like in cron, a time matches if the day of month or
+    the weekday matches in case both are restricted. The macros
+    ``@hourly``, ``@daily``, ``@weekly``, ``@monthly`` and ``@yearly`` are
+    supported as well.
+    """
+
+    MACROS = {
+        '@hourly': '0 * * * *',
+        '@daily': '0 0 * * *',
+        '@weekly': '0 0 * * 0',
+        '@monthly': '0 0 1 * *',
+        '@yearly': '0 0 1 1 *',
+    }
+    RANGES = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+    def __init__(self, spec):
+        """Construct a new schedule from a cron-like spec string."""
+        self.spec = spec
+        fields = self.MACROS.get(spec, spec).split()
+        if len(fields) != 5:
+            raise ValueError(f'Invalid cron spec "{spec}".')
+        (self.minutes, self.hours, self.days, self.months,
+         weekdays) = [self._parse_field(field, low, high)
+                      for field, (low, high) in zip(fields, self.RANGES)]
+        self.weekdays = {weekday % 7 for weekday in weekdays}
+        self.any_day = fields[2].startswith('*')
+        self.any_weekday = fields[4].startswith('*')
+
+    def __repr__(self):  # noqa: D105
+        return f'CronSpec({self.spec!r})'
+
+    def next_after(self, dto):
+        """Return the first matching minute after the given datetime."""
+        dto = dto.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = dto + timedelta(days=366 * 5)
+        while dto < limit:
+            if dto.month not in self.months:
+                dto = (dto.replace(day=1, hour=0, minute=0)
+                       + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(dto):
+                dto = dto.replace(hour=0, minute=0) + timedelta(days=1)
+            elif dto.hour not in self.hours:
+                dto = dto.replace(minute=0) + timedelta(hours=1)
+            elif dto.minute not in self.minutes:
+                dto += timedelta(minutes=1)
+            else:
+                return dto
+        raise ValueError(f'Cron spec "{self.spec}" never matches.')
+
+    def _day_matches(self, dto):
+        day = dto.day in self.days
+        weekday = dto.isoweekday() % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return day and weekday
+        return day or weekday
+
+    def _parse_field(self, field, low, high):
+        values = set()
+        for part in field.split(','):
+            part, _, step = part.partition('/')
+            if part == '*':
+                first, last = low, high
+            elif '-' in part:
+                first, last = (int(value) for value in part.split('-', 1))
+            else:
+                first = last = int(part)
+            if not low <= first <= last <= high:
+                raise ValueError(f'Invalid cron spec "{self.spec}".')
+            values.update(range(first, last + 1, int(step or 1)))
+        return values
+
+
+class ScheduledJob(_TickMetrics):
+    """A job of a ``DaemonHost``, returned by ``DaemonHost.add_job``."""
+
+    def __init__(self, host, func, interval, cron, overrun, max_backlog,
+                 name):
+        """Construct a new job, use ``DaemonHost.add_job`` instead."""
+        self.func = func
+        self.interval = interval
+        self.cron = cron
+        self.overrun = overrun
+        self.max_backlog = max_backlog
+        self.name = name
+        self.cancelled = False
+        self.next_wall_time = None
+        self._lock = host._lock
+        self._running = False
+        self._backlog = deque()
+        self._metrics = dict.fromkeys(DaemonMetrics._fields, 0)
+
+    def __repr__(self):  # noqa: D105
+        return f'ScheduledJob({self.name!r})'
+
+    def cancel(self):
+        """Remove the job from its host, a running tick is not stopped."""
+        self.cancelled = True
+
+    def _next_deadline(self, deadline):
+        if self.cron is None:
+            return deadline + self.interval
+        last = self.next_wall_time or datetime.now()
+        self.next_wall_time = self.cron.next_after(last)
+        return monotonic() \
+            + (self.next_wall_time - datetime.now()).total_seconds()
+
+
+class DaemonHost():
+    """Runs many periodic jobs from a single scheduler thread.
+
+    Jobs are plain callables or ``Daemon`` instances, scheduled with an
+    interval in seconds or a ``CronSpec``. Their deadlines are kept in a
+    heap, so the scheduler only ever looks at the next due job and its
+    overhead per tick grows with the logarithm of the number of jobs.
+    Due ticks are dispatched to a pool of ``max_workers`` threads. Every
+    job runs at most one tick at a time, overrun ticks are handled by the
+    job's overrun policy like for ``Daemon``. Each job keeps its own
+    ``metrics``.
+    """
+
+    def __init__(self, max_workers=8):
+        """Construct a new host for jobs."""
+        self.max_workers = max_workers
+        self.jobs = []
+        self.main_thread = Thread(target=self._main_loop)
+        self._lock = Lock()
+        self._wakeup = Condition(self._lock)
+        self._heap = []
+        self._sequence = count()
+        self._stopped = False
+        self._executor = None
+
+    def add_job(self, job, interval=None, cron=None, overrun='skip',
+                name=None, max_backlog=MAX_BACKLOG):
+        """Add a callable or ``Daemon`` as job and return a ScheduledJob.
+
+        Either ``interval`` in seconds or a ``cron`` spec (a string or
+        ``CronSpec``) is required, a Daemon's interval is used by default.
+        Interval jobs are due right away, cron jobs at their next match.
+        """
+        if isinstance(job, Daemon):
+            interval = job.interval if interval is None else interval
+            func = job._invoke_process
+        else:
+            func = job
+        if (interval is None) == (cron is None):
+            raise ValueError('Either an interval or a cron spec is needed.')
+        if interval is not None and interval <= 0:
+            raise ValueError('The interval must be positive.')
+        _validate_overrun(overrun, max_backlog)
+        if isinstance(cron, str):
+            cron = CronSpec(cron)
+        scheduled = ScheduledJob(self, func, interval, cron, overrun,
+                                 max_backlog,
+                                 name or getattr(job, '__name__', repr(job)))
+        with self._wakeup:
+            deadline = monotonic()
+            if cron is not None:
+                deadline = scheduled._next_deadline(deadline)
+            self.jobs.append(scheduled)
+            heappush(self._heap, (deadline, next(self._sequence), scheduled))
+            self._wakeup.notify()
+        return scheduled
+
+    def start(self):
+        """Start the host."""
+        self._executor = ThreadPoolExecutor(self.max_workers)
+        self.main_thread.start()
+
+    def stop(self):
+        """Stop the host and wait for running ticks to finish."""
+        with self._wakeup:
+            self._stopped = True
+            for job in self.jobs:
+                job._backlog.clear()
+            self._wakeup.notify()
+        self.main_thread.join()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+
+    def _main_loop(self):
+        heap = self._heap
+        with self._wakeup:
+            while not self._stopped:
+                if not heap:
+                    self._wakeup.wait()
+                    continue
+                deadline = heap[0][0]
+                delay = deadline - monotonic()
+                if delay > 0:
+                    self._wakeup.wait(delay)
+                    continue
+                job = heappop(heap)[2]
+                if job.cancelled:
+                    self.jobs.remove(job)
+                    continue
+                heappush(heap, (job._next_deadline(deadline),
+                                next(self._sequence), job))
+                self._dispatch(job, deadline)
+
+    def _dispatch(self, job, deadline):
+        if job._running:
+            job._overrun(deadline)
+            return
+        job._running = True
+        self._executor.submit(self._run_ticks, job, deadline)
+
+    def _run_ticks(self, job, deadline):
+        while True:
+            job._run_tick(job.func, deadline)
+            with self._lock:
+                if not job._backlog or job.cancelled or self._stopped:
+                    job._running = False
+                    return
+                deadline = job._backlog.popleft()
+
+
+class AsyncDaemon(_TickMetrics):
+    """An extendable daemon running its ticks as asyncio tasks.
+
+    Meant for I/O-bound jobs, ``_run_daemon_process`` can be a coroutine
+    function, other ones are run in the loop's default executor. Ticks are
+    scheduled like for ``Daemon``, but instead of a thread pool up to
+    ``max_concurrent`` tasks of the same event loop run them, so a single
+    loop can host thousands of daemons. A tick running longer than
+    ``timeout`` seconds is cancelled and counted as failed. As threads
+    cannot be interrupted, a timed out or cancelled process that is not a
+    coroutine function keeps its slot until its thread returns.
+
+    ``start`` runs the daemon in a new event loop in a thread, or in the
+    given running loop. Within a loop ``await daemon.run()`` can be used
+    as well. ``stop`` (from other threads) and ``request_stop`` (from the
+    loop) end the daemon, optionally cancelling the running ticks.
+    """
+
+    def __init__(self, interval, overrun='skip', max_concurrent=1,
+                 timeout=None, max_backlog=MAX_BACKLOG):
+        """Construct a new daemon instance."""
+        _validate_overrun(overrun, max_backlog)
+        self.interval = float(interval)
+        self.overrun = overrun
+        self.max_backlog = max_backlog
+        self.max_concurrent = max_concurrent
+        self.timeout = timeout
+        self.main_thread = None
+        self.stopped = False
+        self._lock = Lock()
+        self._metrics = dict.fromkeys(DaemonMetrics._fields, 0)
+        self._backlog = deque()
+        self._ticks = set()
+        self._loop = None
+        self._waiter = None
+        self._running = Event()
+        self._finished = False
+        self._done = None
+
+    def start(self, loop=None):
+        """Start the daemon in a running event loop or a new thread."""
+        if loop is None:
+            self.main_thread = Thread(target=asyncio.run, args=(self.run(),))
+            self.main_thread.start()
+        else:
+            self._done = asyncio.run_coroutine_threadsafe(self.run(), loop)
+
+    def stop(self, cancel=False):
+        """Stop the daemon from another thread and wait for it to finish."""
+        self._running.wait()
+        if not self._finished:
+            try:
+                self._loop.call_soon_threadsafe(self.request_stop, cancel)
+            except RuntimeError:
+                pass  # run returned and closed its loop in the meantime
+        if self.main_thread is not None:
+            self.main_thread.join()
+        elif self._done is not None:
+            self._done.result()
+
+    def request_stop(self, cancel=False):
+        """Let ``run`` return once the running ticks are done or cancelled.
+
+        Must be called from within the daemon's event loop.
+        """
+        self.stopped = True
+        self._backlog.clear()
+        if cancel:
+            for tick in self._ticks:
+                tick.cancel()
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    async def run(self):
+        """Run the daemon in the current event loop until it is stopped."""
+        loop = self._loop = asyncio.get_running_loop()
+        self._running.set()
+        try:
+            # single-run mode
+            if self.interval <= 0:
+                self._dispatch(loop.time())
+                return
+            # interval mode
+            start = loop.time()
+            tick = 0
+            while not self.stopped:
+                deadline = start + tick * self.interval
+                if deadline > loop.time():
+                    await self._sleep_until(deadline)
+                    if self.stopped:
+                        return
+                self._dispatch(deadline)
+                tick += 1
+        except asyncio.CancelledError:
+            self.request_stop(cancel=True)
+            raise
+        finally:
+            if self._ticks:
+                await asyncio.wait(list(self._ticks))
+            self._finished = True
+
+    async def _sleep_until(self, deadline):
+        waiter = self._waiter = self._loop.create_future()
+        handle = self._loop.call_at(deadline, _resolve, waiter)
+        try:
+            await waiter
+        finally:
+            handle.cancel()
+            self._waiter = None
+
+    def _dispatch(self, deadline):
+        if len(self._ticks) >= self.max_concurrent:
+            self._overrun(deadline)
+            return
+        tick = self._loop.create_task(self._run_ticks(deadline))
+        self._ticks.add(tick)
+        tick.add_done_callback(self._ticks.discard)
+
+    async def _run_ticks(self, deadline):
+        loop = self._loop
+        while True:
+            started = loop.time()
+            try:
+                await asyncio.wait_for(self._invoke_process(), self.timeout)
+                failed = False
+            except asyncio.TimeoutError:
+                logging.warning('Daemon process timed out after %s seconds',
+                                self.timeout)
+                failed = True
+            except asyncio.CancelledError:
+                self._record(started - deadline, loop.time() - started, True)
+                raise
+            except Exception:
+                logging.exception('Daemon process failed')
+                failed = True
+            self._record(started - deadline, loop.time() - started, failed)
+            if not self._backlog or self.stopped:
+                return
+            deadline = self._backlog.popleft()
+
+    async def _invoke_process(self):
+        if asyncio.iscoroutinefunction(self._run_daemon_process):
+            await self._run_daemon_process()
+        else:
+            future = self._loop.run_in_executor(
+                None, self._run_daemon_process)
+            try:
+                await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # threads cannot be interrupted, keep the slot until it ends
+                await asyncio.wait([future])
+                if not future.cancelled():
+                    future.exception()
+                raise
+
+    async def _run_daemon_process(self):
+        """Override with your implementation."""
+        pass
+
+
+def _validate_overrun(overrun, max_backlog):
+    if overrun not in OVERRUN_POLICIES:
+        raise ValueError(
+            f'Unsupported overrun policy "{overrun}". '
+            + f'Allowed values: {", ".join(OVERRUN_POLICIES)}')
+    if max_backlog < 1:
+        raise ValueError('The backlog must hold at least one tick.')
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
 
 
 if __name__ == '__main__':
     class MyDaemon(Daemon):  # noqa: D101
 
-        def _invoke_process(self):
+        def _run_daemon_process(self):
             print(datetime.now().timestamp())
 
     my_daemon = MyDaemon(1)
     my_daemon.start()
     sleep(5)
     my_daemon.stop()
+    print(my_daemon.metrics())
@@ -4,14 +4,26 @@ References for format strings:
 https://docs.python.org/3/library/datetime.html#strftime-and-strptime-behavior
 """
 
+import math
+import re
 import time
+from bisect import bisect_right
 from datetime import date, datetime, timedelta
+from functools import lru_cache
 
 from dateutil.relativedelta import relativedelta
 
 DEFAULT_CONVERT_FORMAT = r'%Y-%m-%d %H:%M:%S.%f'
 DEFAULT_CONVERT_FORMAT_BOD = r'%Y-%m-%d 00:00:00.000'
 DEFAULT_CONVERT_FORMAT_EOD = r'%Y-%m-%d 23:59:59.999'
+PARSER_CACHE_SIZE = 64
+"""Number of compiled timestamp parsers kept by compile_timestamp_parser."""
+ZONE_SCAN_STEP = 7 * 86400
+"""Step in seconds in which TimezoneConverter searches for transitions."""
+ZONE_SCAN_HORIZON = 366 * 86400
+"""Seconds TimezoneConverter searches for transitions around an epoch."""
+ZONE_FOLD_MARGIN = 86400
+"""Seconds after a transition in which wall times may be ambiguous."""
 
 
 def epoch_to_timestamp(epoch, formatstring=DEFAULT_CONVERT_FORMAT):
@@ -31,7 +43,32 @@ def epoch_to_dto(epoch):
 def timestamp_to_dto(timestamp, formatstring=DEFAULT_CONVERT_FORMAT):
     """Convert a human-readable timestamp to a python datetime object."""
     __validate_input(timestamp)
-    return datetime.strptime(timestamp, formatstring)
+    return compile_timestamp_parser(formatstring)(timestamp)
+
+
+@lru_cache(maxsize=PARSER_CACHE_SIZE)
+def compile_timestamp_parser(formatstring):
+    """Compile a format string into a function parsing timestamps to dtos.
+
+    Formats made of zero-padded numeric directives (%Y, %m, %d, %H, %M, %S,
+    a trailing %f) and literals are parsed by slicing at fixed offsets,
+    ISO formats by ``datetime.fromisoformat``. Anything else, as well as
+    any timestamp not matching the expected layout, is left to
+    ``datetime.strptime``, so results and errors stay the same.
+    """
+    fast_parse = _compile_fixed_width_parser(formatstring)
+    if fast_parse is None:
+        return lambda timestamp: datetime.strptime(timestamp, formatstring)
+
+    def parse(timestamp):
+        try:
+            dto = fast_parse(timestamp)
+        except (TypeError, ValueError):
+            dto = None
+        if dto is None:
+            return datetime.strptime(timestamp, formatstring)
+        return dto
+    return parse
 
 
 def timestamp_to_epoch(timestamp, formatstring=DEFAULT_CONVERT_FORMAT):
@@ -49,7 +86,92 @@ def dto_to_timestamp(dto, formatstring=DEFAULT_CONVERT_FORMAT):
 def dto_to_epoch(dto):
     """Convert a python datetime object to an epoch."""
     __validate_input(dto)
-    return int(dto.strftime('%s'))
+    if dto.tzinfo is not None:
+        return int(dto.replace(microsecond=0).timestamp())
+    return int(time.mktime(dto.timetuple()))
+
+
+def epochs_to_timestamps(epochs, formatstring=DEFAULT_CONVERT_FORMAT):
+    """Convert many epochs to human-readable timestamps.
+
+    Accepts any iterable of epochs and returns a list, or a NumPy array for
+    NumPy input. Local time offsets are looked up once per distinct minute.
+    For the default format the conversion is vectorized using NumPy's
+    ``datetime64`` if available, other formats fall back to
+    ``epoch_to_timestamp`` per item.
+    """
+    if formatstring != DEFAULT_CONVERT_FORMAT:
+        return _map_batch(epochs, epoch_to_timestamp, formatstring)
+    numpy = _import_numpy()
+    if numpy is not None:
+        epochs = _as_sequence(epochs)
+        return _mirror_input(epochs, _epochs_to_timestamps_numpy(
+            numpy, numpy.asarray(epochs, dtype='float64')))
+    offsets = {}
+    prefixes = {}
+    timestamps = []
+    for epoch in epochs:
+        __validate_input(epoch)
+        seconds, micros = divmod(_epoch_to_micros(float(epoch)), 1000000)
+        minute, second = divmod(
+            seconds + _local_offset(seconds, offsets), 60)
+        prefix = prefixes.get(minute)
+        if prefix is None:
+            prefix = time.strftime('%Y-%m-%d %H:%M', time.gmtime(minute * 60))
+            prefixes[minute] = prefix
+        timestamps.append(f'{prefix}:{second:02d}.{micros:06d}')
+    return timestamps
+
+
+def timestamps_to_epochs(timestamps, formatstring=DEFAULT_CONVERT_FORMAT):
+    """Convert many human-readable timestamps to epochs.
+
+    Accepts any iterable of timestamps and returns a list, or a NumPy array
+    for NumPy input. For the default format every distinct minute is parsed
+    and converted only once, vectorized using NumPy's ``datetime64`` if
+    available. Other formats fall back to ``timestamp_to_epoch`` per item.
+    """
+    if formatstring != DEFAULT_CONVERT_FORMAT:
+        return _map_batch(timestamps, timestamp_to_epoch, formatstring)
+    numpy = _import_numpy()
+    if numpy is not None:
+        timestamps = _as_sequence(timestamps)
+        wall = numpy.asarray(timestamps, dtype='datetime64[us]')
+        return _mirror_input(timestamps, _wall_seconds_to_epochs(
+            numpy, wall.astype('datetime64[s]').astype('int64')))
+    minutes = {}
+    epochs = []
+    for timestamp in timestamps:
+        __validate_input(timestamp)
+        minute = minutes.get(timestamp[:16])
+        if minute is None:
+            minute = int(time.mktime(
+                time.strptime(timestamp[:16], '%Y-%m-%d %H:%M')))
+            minutes[timestamp[:16]] = minute
+        epochs.append(minute + int(timestamp[17:19]))
+    return epochs
+
+
+def dtos_to_epochs(dtos):
+    """Convert many python datetime objects to epochs.
+
+    Naive datetimes are converted with one local time lookup per distinct
+    minute, aware ones by their ``timestamp``.
+    """
+    minutes = {}
+    epochs = []
+    for dto in dtos:
+        __validate_input(dto)
+        if dto.tzinfo is not None:
+            epochs.append(dto_to_epoch(dto))
+            continue
+        key = (dto.year, dto.month, dto.day, dto.hour, dto.minute)
+        minute = minutes.get(key)
+        if minute is None:
+            minute = int(time.mktime(key + (0, 0, 0, -1)))
+            minutes[key] = minute
+        epochs.append(minute + dto.second)
+    return epochs
 
 
 def get_current_datetime_for_filename():
@@ -73,23 +195,394 @@ def get_intervals_for_epochs(start_epoch, end_epoch, interval='week',
 def get_intervals_for_dtos(start, end, interval='week',
                            output_format=DEFAULT_CONVERT_FORMAT):
     """Return a list of tuples for the intervals between two datetimes."""
-    interval_sec = _get_interval_sec(interval)
-    if not interval_sec:
-        raise ValueError(
-            f'Unsupported interval "{interval}". '
-            + 'Allowed values: week, day, month'
-        )
-    start_iv = start
-    intervals = []
-    while True:
-        start_iv_ep = dto_to_timestamp(start_iv, output_format)
-        end_iv = start_iv + interval_sec
-        end_iv_out = end_iv - timedelta(seconds=1)
-        end_iv_ep = dto_to_timestamp(end_iv_out, output_format)
-        intervals.append((start_iv, end_iv_out, start_iv_ep, end_iv_ep))
-        if end_iv >= end:
-            return intervals
-        start_iv = end_iv
+    return list(IntervalRange(start, end, interval, output_format))
+
+
+class IntervalRange():
+    """A lazy, range-like sequence of intervals between two datetimes.
+
+    Items are ``(start, end, start_str, end_str)`` tuples like the ones of
+    ``get_intervals_for_dtos``, where ``end`` is one second before the start
+    of the next interval. The strings are only formatted when an item is
+    accessed, with ``output_format=None`` items are ``(start, end)`` tuples.
+    Minute, hour, day and week intervals use ``timedelta`` arithmetic, month
+    and year intervals ``relativedelta``. Both support ``len`` and indexing
+    in O(1).
+    """
+
+    def __init__(self, start, end, interval='week',
+                 output_format=DEFAULT_CONVERT_FORMAT):
+        """Construct a new range of intervals from start until end."""
+        self.step = _INTERVAL_TIMEDELTAS.get(interval)
+        self.months = _INTERVAL_MONTHS.get(interval)
+        if self.step is None and self.months is None:
+            allowed = list(_INTERVAL_TIMEDELTAS) + list(_INTERVAL_MONTHS)
+            raise ValueError(
+                f'Unsupported interval "{interval}". '
+                + f'Allowed values: {", ".join(allowed)}'
+            )
+        self.start = start
+        self.end = end
+        self.interval = interval
+        self.output_format = output_format
+        if self.step is not None:
+            self.length = max(1, -((start - end) // self.step))
+        else:
+            self.length = self._count_month_intervals()
+
+    def __len__(self):  # noqa: D105
+        return self.length
+
+    def __getitem__(self, index):  # noqa: D105
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError('IntervalRange index out of range')
+        start_iv = self.boundary(index)
+        end_iv_out = self.boundary(index + 1) - timedelta(seconds=1)
+        if self.output_format is None:
+            return (start_iv, end_iv_out)
+        return (start_iv, end_iv_out,
+                dto_to_timestamp(start_iv, self.output_format),
+                dto_to_timestamp(end_iv_out, self.output_format))
+
+    def __iter__(self):  # noqa: D105
+        for index in range(self.length):
+            yield self[index]
+
+    def __repr__(self):  # noqa: D105
+        return (f'IntervalRange({self.start!r}, {self.end!r}, '
+                + f'{self.interval!r}, {self.output_format!r})')
+
+    def boundary(self, index):
+        """Return the start datetime of the interval with the given index."""
+        if self.step is not None:
+            return self.start + self.step * index
+        return self.start + relativedelta(months=self.months * index)
+
+    def _count_month_intervals(self):
+        months = (self.end.year - self.start.year) * 12 \
+            + self.end.month - self.start.month
+        count = max(1, -(-months // self.months))
+        while count > 1 and self.boundary(count - 1) >= self.end:
+            count -= 1
+        while self.boundary(count) < self.end:
+            count += 1
+        return count
+
+
+class IntervalIndex():
+    """An index assigning epochs to the intervals they fall into.
+
+    Built from intervals as returned by ``get_intervals_for_epochs`` or an
+    ``IntervalRange``, where interval ``i`` covers all epochs from its start
+    until the start of interval ``i + 1``. Uniform intervals are looked up
+    arithmetically in O(1), others by bisecting the start epochs. All
+    lookups are batched and vectorized with NumPy if available. Epochs
+    outside of all intervals get the bucket id -1.
+    """
+
+    def __init__(self, intervals):
+        """Construct a new index for the given intervals."""
+        if not len(intervals):
+            raise ValueError('No intervals given.')
+        self.starts = dtos_to_epochs(interval[0] for interval in intervals)
+        self.stop = dto_to_epoch(intervals[-1][1]) + 1
+        widths = {right - left for left, right in zip(
+            self.starts, self.starts[1:] + [self.stop])}
+        self.width = widths.pop() if len(widths) == 1 else None
+
+    def __len__(self):  # noqa: D105
+        return len(self.starts)
+
+    def lookup(self, epochs):
+        """Return the bucket ids for an iterable or array of epochs."""
+        numpy = _import_numpy()
+        if numpy is not None:
+            epochs = _as_sequence(epochs)
+            return _mirror_input(
+                epochs, self._lookup_numpy(numpy, numpy.asarray(epochs)))
+        first = self.starts[0]
+        stop = self.stop
+        if self.width is not None:
+            width = self.width
+            return [int((epoch - first) // width) if first <= epoch < stop
+                    else -1 for epoch in epochs]
+        starts = self.starts
+        return [bisect_right(starts, epoch) - 1 if epoch < stop else -1
+                for epoch in epochs]
+
+    def counts(self, epochs):
+        """Return the number of epochs per bucket."""
+        return self.sums(epochs, None)
+
+    def sums(self, epochs, values):
+        """Return the sum of the values per bucket of their epochs.
+
+        Without ``values`` the number of epochs per bucket is returned.
+        """
+        buckets = self.lookup(epochs)
+        numpy = _import_numpy()
+        if numpy is not None:
+            buckets = numpy.asarray(buckets)
+            valid = buckets >= 0
+            if values is None:
+                totals = numpy.bincount(buckets[valid], minlength=len(self))
+                return _mirror_input(epochs, totals)
+            weights = numpy.asarray(_as_sequence(values))[valid]
+            if weights.dtype.kind == 'f':
+                totals = numpy.bincount(
+                    buckets[valid], weights, minlength=len(self))
+                totals = totals.astype(weights.dtype, copy=False)
+            else:
+                # bincount sums in float64, keep integers exact instead
+                totals = numpy.zeros(
+                    len(self), weights.sum(keepdims=True).dtype)
+                numpy.add.at(totals, buckets[valid], weights)
+            return _mirror_input(epochs, totals)
+        totals = [0] * len(self)
+        for bucket, value in zip(
+                buckets, [1] * len(buckets) if values is None else values):
+            if bucket >= 0:
+                totals[bucket] += value
+        return totals
+
+    def aggregate(self, epochs, values, reducer=sum):
+        """Return ``reducer`` applied to the values of every bucket."""
+        groups = [[] for _ in range(len(self))]
+        for bucket, value in zip(self.lookup(epochs), values):
+            if bucket >= 0:
+                groups[bucket].append(value)
+        return [reducer(group) for group in groups]
+
+    def _lookup_numpy(self, numpy, epochs):
+        if self.width is not None:
+            buckets = ((epochs - self.starts[0]) // self.width).astype('int64')
+        else:
+            buckets = numpy.searchsorted(
+                numpy.asarray(self.starts), epochs, side='right') - 1
+        buckets[(epochs < self.starts[0]) | (epochs >= self.stop)] = -1
+        return buckets
+
+
+class TimezoneConverter():
+    """Conversions between epochs, datetimes and timestamps in a time zone.
+
+    Unlike the module functions, which depend on the host's local time,
+    all conversions are done for an explicit zone and return aware
+    datetimes. UTC offsets are cached per span between two transitions of
+    the zone, so converting wall times and batches within a known span is
+    plain arithmetic without any zone database lookup. Naive wall times
+    that are ambiguous or skipped resolve by their ``fold`` like
+    ``zoneinfo`` does. The batch methods accept iterables or NumPy arrays
+    and are vectorized with NumPy if available.
+
+    Transitions are searched in steps of ``ZONE_SCAN_STEP`` seconds, so two
+    transitions closer than that might go unnoticed.
+    """
+
+    def __init__(self, zone):
+        """Construct a new converter for a zone name or tzinfo object."""
+        if isinstance(zone, str):
+            from zoneinfo import ZoneInfo
+            zone = ZoneInfo(zone)
+        self.zone = zone
+        # replaced as a whole so concurrent readers see consistent lists
+        self._cache = ([], [])
+
+    def __repr__(self):  # noqa: D105
+        return f'TimezoneConverter({self.zone!r})'
+
+    def utcoffset(self, epoch):
+        """Return the UTC offset in seconds at the given epoch."""
+        return self._span(epoch)[2]
+
+    def epoch_to_dto(self, epoch):
+        """Convert an epoch to an aware python datetime object."""
+        return datetime.fromtimestamp(float(epoch), self.zone)
+
+    def epoch_to_timestamp(self, epoch, formatstring=DEFAULT_CONVERT_FORMAT):
+        """Convert an epoch to a human-readable timestamp."""
+        return self.epoch_to_dto(epoch).strftime(formatstring)
+
+    def dto_to_epoch(self, dto):
+        """Convert a python datetime object to an epoch.
+
+        Naive datetimes are taken as wall time of the zone.
+        """
+        if dto.tzinfo is not None:
+            return int(dto.replace(microsecond=0).timestamp())
+        return self._wall_to_epoch(_wall_seconds(dto), dto.fold)
+
+    def timestamp_to_epoch(self, timestamp,
+                           formatstring=DEFAULT_CONVERT_FORMAT):
+        """Convert a human-readable timestamp to an epoch."""
+        return self.dto_to_epoch(
+            compile_timestamp_parser(formatstring)(timestamp))
+
+    def epochs_to_dtos(self, epochs):
+        """Convert many epochs to a list of aware python datetime objects."""
+        zone = self.zone
+        return [datetime.fromtimestamp(float(epoch), zone) for epoch in epochs]
+
+    def epochs_to_timestamps(self, epochs,
+                             formatstring=DEFAULT_CONVERT_FORMAT):
+        """Convert many epochs to human-readable timestamps.
+
+        For the default format the conversion is vectorized using NumPy's
+        ``datetime64`` if available, other formats are formatted per item.
+        """
+        numpy = _import_numpy()
+        if numpy is None or formatstring != DEFAULT_CONVERT_FORMAT:
+            converted = [dto.strftime(formatstring)
+                         for dto in self.epochs_to_dtos(epochs)]
+            if numpy is not None and isinstance(epochs, numpy.ndarray):
+                return numpy.array(converted)
+            return converted
+        epochs = _as_sequence(epochs)
+        micros = _epochs_to_micros_numpy(
+            numpy, numpy.asarray(epochs, dtype='float64'))
+        seconds = micros // 1000000
+        wall = micros + self._offsets_numpy(numpy, seconds) * 1000000
+        timestamps = numpy.datetime_as_string(
+            wall.astype('datetime64[us]'), unit='us')
+        return _mirror_input(epochs, numpy.char.replace(timestamps, 'T', ' '))
+
+    def dtos_to_epochs(self, dtos):
+        """Convert many python datetime objects to epochs."""
+        # epochs this far from the span edges can't be ambiguous
+        first = last = offset = 0
+        epochs = []
+        for dto in dtos:
+            if dto.tzinfo is not None:
+                epochs.append(self.dto_to_epoch(dto))
+                continue
+            epoch = (dto - _EPOCH_DTO) // _SECOND - offset
+            if not first <= epoch < last:
+                epoch = self._wall_to_epoch(epoch + offset, dto.fold)
+                first, last, offset = self._span(epoch)
+                first += ZONE_FOLD_MARGIN
+                last -= ZONE_FOLD_MARGIN
+            epochs.append(epoch)
+        return epochs
+
+    def timestamps_to_epochs(self, timestamps,
+                             formatstring=DEFAULT_CONVERT_FORMAT):
+        """Convert many human-readable timestamps to epochs.
+
+        For the default format the timestamps are parsed and converted
+        using NumPy's ``datetime64`` if available, ambiguous wall times
+        resolve to the earlier epoch then.
+        """
+        numpy = _import_numpy()
+        if numpy is None or formatstring != DEFAULT_CONVERT_FORMAT:
+            parse = compile_timestamp_parser(formatstring)
+            converted = self.dtos_to_epochs(
+                parse(timestamp) for timestamp in timestamps)
+            if numpy is not None and isinstance(timestamps, numpy.ndarray):
+                return numpy.array(converted)
+            return converted
+        timestamps = _as_sequence(timestamps)
+        wall = numpy.asarray(timestamps, dtype='datetime64[us]').astype(
+            'datetime64[s]').astype('int64')
+        return _mirror_input(timestamps, self._wall_to_epochs_numpy(
+            numpy, wall))
+
+    def _wall_to_epoch(self, wall, fold=0):
+        spans = self._spans_between(wall - 2 * ZONE_FOLD_MARGIN,
+                                    wall + 2 * ZONE_FOLD_MARGIN)
+        wall_ends = [end + offset for _, end, offset in spans]
+        index = bisect_right(wall_ends, wall)
+        start, _, offset = spans[index]
+        if fold:
+            if index and wall < start + offset:
+                pass  # skipped wall time, use the offset after the gap
+            elif index + 1 < len(spans) \
+                    and wall >= spans[index + 1][0] + spans[index + 1][2]:
+                index += 1  # repeated wall time, use the later epoch
+        elif wall < start + offset:
+            index -= 1  # skipped wall time, use the offset before the gap
+        return wall - spans[index][2]
+
+    def _wall_to_epochs_numpy(self, numpy, wall):
+        if not wall.size:
+            return wall
+        spans = self._spans_between(int(wall.min()) - 2 * ZONE_FOLD_MARGIN,
+                                    int(wall.max()) + 2 * ZONE_FOLD_MARGIN)
+        offsets = numpy.array([offset for _, _, offset in spans])
+        wall_starts = numpy.array([start for start, _, _ in spans]) + offsets
+        wall_ends = numpy.array([end for _, end, _ in spans]) + offsets
+        index = numpy.searchsorted(wall_ends, wall, side='right')
+        index -= wall < wall_starts[index]
+        return wall - offsets[index]
+
+    def _offsets_numpy(self, numpy, epochs):
+        if not epochs.size:
+            return epochs
+        spans = self._spans_between(int(epochs.min()), int(epochs.max()))
+        starts = numpy.array([start for start, _, _ in spans])
+        offsets = numpy.array([offset for _, _, offset in spans])
+        return offsets[numpy.searchsorted(starts, epochs, side='right') - 1]
+
+    def _spans_between(self, first, last):
+        spans = [self._span(first)]
+        while spans[-1][1] <= last:
+            spans.append(self._span(spans[-1][1]))
+        return spans
+
+    def _span(self, epoch):
+        starts, spans = self._cache
+        index = bisect_right(starts, epoch) - 1
+        if index >= 0 and epoch < spans[index][1]:
+            return spans[index]
+        index += 1
+        epoch = int(epoch // 1)
+        offset = self._offset(epoch)
+        low = spans[index - 1][1] if index else epoch - ZONE_SCAN_HORIZON
+        high = starts[index] if index < len(starts) \
+            else epoch + ZONE_SCAN_HORIZON
+        span = (self._scan_start(epoch, low, offset),
+                self._scan_end(epoch, high, offset), offset)
+        self._cache = (starts[:index] + [span[0]] + starts[index:],
+                       spans[:index] + [span] + spans[index:])
+        return span
+
+    def _scan_start(self, epoch, limit, offset):
+        same = epoch
+        while same > limit:
+            probe = max(same - ZONE_SCAN_STEP, limit)
+            if self._offset(probe) != offset:
+                return self._find_transition(same, probe, offset)[0]
+            same = probe
+        return limit
+
+    def _scan_end(self, epoch, limit, offset):
+        same = epoch
+        while same < limit - 1:
+            probe = min(same + ZONE_SCAN_STEP, limit - 1)
+            if self._offset(probe) != offset:
+                return self._find_transition(same, probe, offset)[1]
+            same = probe
+        return limit
+
+    def _find_transition(self, same, other, offset):
+        while abs(other - same) > 1:
+            middle = (same + other) // 2
+            if self._offset(middle) == offset:
+                same = middle
+            else:
+                other = middle
+        return same, other
+
+    def _offset(self, epoch):
+        dto = datetime.fromtimestamp(epoch, self.zone)
+        return int(dto.utcoffset().total_seconds())
+
+
+@lru_cache(maxsize=None)
+def get_timezone_converter(zone):
+    """Return a shared TimezoneConverter for a zone name or tzinfo object."""
+    return TimezoneConverter(zone)
 
 
 def now():
@@ -142,15 +635,169 @@ def get_week_number_from_epoch(epoch):
     return epoch_to_dto(epoch).isocalendar()[1]
 
 
+_FIXED_WIDTH_DIRECTIVES = [('Y', 4, '1900'), ('m', 2, '1'), ('d', 2, '1'),
+                           ('H', 2, '0'), ('M', 2, '0'), ('S', 2, '0')]
+_ISO_FORMATS = {'%Y-%m-%d', '%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S',
+                '%Y-%m-%d %H:%M:%S.%f', '%Y-%m-%dT%H:%M:%S.%f'}
+
+
+def _compile_fixed_width_parser(formatstring):
+    widths = {name: width for name, width, _ in _FIXED_WIDTH_DIRECTIVES}
+    tokens = re.findall(r'%.?|[^%]+', formatstring)
+    pattern = []
+    fields = []
+    position = 0
+    fraction = False
+    for index, token in enumerate(tokens):
+        if token == '%f' and index == len(tokens) - 1:
+            fraction = True
+            pattern.append(r'(\d{1,6})')
+        elif token[0] == '%' and token[1:] in widths \
+                and token[1:] not in fields:
+            fields.append(token[1:])
+            pattern.append(f'(\\d{{{widths[token[1:]]}}})')
+            position += widths[token[1:]]
+        elif token[0] == '%' and token != '%%':
+            return None  # not a fixed-width format
+        else:
+            literal = '%' if token == '%%' else token
+            pattern.append(re.escape(literal))
+            position += len(literal)
+    if not fields:
+        return None
+    match = re.compile(''.join(pattern)).fullmatch
+    # group index or default value of each datetime argument
+    spec = [(fields.index(name), None) if name in fields
+            else (None, int(default))
+            for name, _, default in _FIXED_WIDTH_DIRECTIVES]
+    iso_length = None
+    if formatstring in _ISO_FORMATS:
+        iso_length = position + 6 if fraction else position
+    fromisoformat = datetime.fromisoformat
+
+    def parse(value):
+        found = match(value)
+        if found is None:
+            return None
+        if len(value) == iso_length:
+            # the layout is checked, fromisoformat validates the digits
+            return fromisoformat(value)
+        values = found.groups()
+        args = [default if group is None else int(values[group])
+                for group, default in spec]
+        if fraction:
+            args.append(int(values[-1].ljust(6, '0')))
+        return datetime(*args)
+    return parse
+
+
+def _import_numpy():
+    try:
+        import numpy
+        return numpy
+    except ImportError:
+        return None
+
+
+def _map_batch(values, convert, formatstring):
+    converted = [convert(value, formatstring) for value in values]
+    numpy = _import_numpy()
+    if numpy is not None and isinstance(values, numpy.ndarray):
+        return numpy.array(converted)
+    return converted
+
+
+def _as_sequence(values):
+    return values if hasattr(values, '__len__') else list(values)
+
+
+def _mirror_input(values, result):
+    if isinstance(values, type(result)):
+        return result
+    return result.tolist()
+
+
+def _local_minute_epoch(wall_minute):
+    wall_time = time.gmtime(wall_minute * 60)[:8] + (-1,)
+    return int(time.mktime(wall_time))
+
+
+def _wall_seconds_to_epochs(numpy, wall_seconds):
+    minutes, inverse = numpy.unique(wall_seconds // 60, return_inverse=True)
+    minute_epochs = numpy.array(
+        [_local_minute_epoch(minute) for minute in minutes.tolist()],
+        dtype='int64')
+    return minute_epochs[inverse.reshape(-1)].reshape(wall_seconds.shape) \
+        + wall_seconds % 60
+
+
+def _epochs_to_timestamps_numpy(numpy, epochs):
+    micros = _epochs_to_micros_numpy(numpy, epochs)
+    wall = micros + _local_offsets_numpy(numpy, micros // 1000000) * 1000000
+    timestamps = numpy.datetime_as_string(
+        wall.astype('datetime64[us]'), unit='us')
+    return numpy.char.replace(timestamps, 'T', ' ')
+
+
+def _epoch_to_micros(epoch):
+    """Return the epoch in microseconds, rounded like ``fromtimestamp``."""
+    fraction, seconds = math.modf(epoch)
+    return int(seconds) * 1000000 + round(fraction * 1000000)
+
+
+def _epochs_to_micros_numpy(numpy, epochs):
+    fractions, seconds = numpy.modf(epochs)
+    return seconds.astype('int64') * 1000000 \
+        + numpy.rint(fractions * 1000000).astype('int64')
+
+
+def _local_offset(seconds, minute_offsets):
+    """Return the local UTC offset at the epoch, cached per minute."""
+    minute = seconds // 60
+    offset = minute_offsets.get(minute)
+    if offset is None:
+        offset = time.localtime(minute * 60).tm_gmtoff
+        if time.localtime(minute * 60 + 59).tm_gmtoff != offset:
+            offset = False  # the offset changes within this minute
+        minute_offsets[minute] = offset
+    if offset is False:
+        return time.localtime(seconds).tm_gmtoff
+    return offset
+
+
+def _local_offsets_numpy(numpy, seconds):
+    minutes, inverse = numpy.unique(seconds // 60, return_inverse=True)
+    inverse = inverse.reshape(seconds.shape)
+    starts = numpy.array([time.localtime(minute * 60).tm_gmtoff
+                          for minute in minutes.tolist()], dtype='int64')
+    ends = numpy.array([time.localtime(minute * 60 + 59).tm_gmtoff
+                        for minute in minutes.tolist()], dtype='int64')
+    offsets = starts[inverse]
+    changing = (starts != ends)[inverse]
+    if changing.any():
+        offsets[changing] = [time.localtime(second).tm_gmtoff
+                             for second in seconds[changing].tolist()]
+    return offsets
+
+
+def _wall_seconds(dto):
+    return (dto - _EPOCH_DTO) // _SECOND
+
+
 def __validate_input(input_string):
     if input_string is None:
         raise ValueError('None-input is not allowed.')
 
 
-def _get_interval_sec(interval):
-    return {
-        'month': relativedelta(months=+1),
-        'week': relativedelta(weeks=+1),
-        'day': relativedelta(days=+1),
-        'year': relativedelta(months=+12),
-    }.get(interval, None)
+_EPOCH_DTO = datetime(1970, 1, 1)
+_SECOND = timedelta(seconds=1)
+_INTERVAL_TIMEDELTAS = {
+    'minute': timedelta(minutes=1),
+    'hour': timedelta(hours=1),
+    'day': timedelta(days=1),
+    'week': timedelta(weeks=1),
+}
+_INTERVAL_MONTHS = {
+    'month': 1,
+    'year': 12,
+}
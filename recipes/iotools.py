@@ -1,13 +1,64 @@
 """This module contains various tools for recurring I/O operations."""
 
+import bz2
 import csv
 import datetime
+import gzip
 import hashlib
+import io
+import json
+import locale
+import logging
+import lzma
+import mmap
 import os
 import re
+import sqlite3
+import stat
+import struct
+import tempfile
+import time
+import uuid
 import zipfile
+import zlib
+from array import array
+from collections import deque, namedtuple
+from concurrent.futures import (FIRST_COMPLETED, Future, ProcessPoolExecutor,
+                                ThreadPoolExecutor, as_completed, wait)
+from itertools import islice
 from os import path
+from queue import Empty, Queue
 from sys import path as spath
+from threading import Thread
+
+HASH_CHUNK_SIZE = 1024 * 1024
+"""Default chunk size in bytes used to feed file contents to a hasher."""
+HASH_MMAP_THRESHOLD = 64 * 1024 * 1024
+"""File size in bytes from which on files are hashed using mmap."""
+COUNT_CHUNK_SIZE = 4 * 1024 * 1024
+"""Default buffer size in bytes used to count newlines."""
+DECOMPRESS_BUFFER_SIZE = 1024 * 1024
+"""Buffer size in bytes used to read compressed files."""
+DECOMPRESS_QUEUE_DEPTH = 4
+"""Number of chunks a background decompression thread may read ahead."""
+RENAME_JOURNAL_NAME = '.rename-journal'
+"""Default file name of the journal written by ``execute_renames``."""
+WRITE_BATCH_LINES = 10000
+"""Number of lines joined into a single write call by ``write_lines``."""
+CSV_RANGE_SIZE = 16 * 1024 * 1024
+"""Default size in bytes of the ranges a CSV - file is split into."""
+ZIP_STREAM_THRESHOLD = 16 * 1024 * 1024
+"""File size in bytes from which on zip members are compressed in chunks."""
+ZIP_CHUNK_SIZE = 1024 * 1024
+"""Chunk size in bytes used to compress large zip members."""
+ZIP_STORED_SUFFIXES = frozenset([
+    '.7z', '.avi', '.bz2', '.docx', '.flac', '.gif', '.gz', '.jar', '.jpeg',
+    '.jpg', '.mkv', '.mov', '.mp3', '.mp4', '.ogg', '.pdf', '.png', '.rar',
+    '.tgz', '.webm', '.webp', '.xlsx', '.xz', '.zip', '.zst'])
+"""Suffixes of already compressed files that are stored uncompressed."""
+
+ZipUpdate = namedtuple('ZipUpdate', 'added modified removed unchanged')
+"""Member names changed by ``update_zip_dir_recursively``."""
 
 
 def change_to_scriptdir(file):
@@ -37,11 +88,11 @@ def get_immediate_subdirectories(file_path, reverse_order=False,
     if not file_path:
         raise TypeError('file_path not provided.')
 
-    directories = []
-    for name in os.listdir(file_path):
-        if os.path.isdir(os.path.join(file_path, name)):
-            if show_hidden or not str(name).startswith('.'):
-                directories.append(name)
+    directories = [
+        entry.name for entry in scantree(
+            file_path, files=False, dirs=True, recursive=False,
+            onerror=_raise_error)
+        if show_hidden or not entry.name.startswith('.')]
     directories.sort(key=None, reverse=reverse_order)
 
     return directories
@@ -52,19 +103,154 @@ def get_immediate_subfiles(file_path, pattern=None, ignorecase=False):
     if not file_path:
         raise TypeError('file_path not provided.')
 
-    files = []
-    for name in os.listdir(file_path):
-        if os.path.isdir(os.path.join(file_path, name)):
-            continue
-        if pattern:
-            if ignorecase and re.match(pattern, name, re.IGNORECASE):
-                files.append(name)
-            elif re.match(pattern, name):
-                files.append(name)
-            continue
-        files.append(name)
-    files.sort()
-    return files
+    return sorted(entry.name for entry in scantree(
+        file_path, pattern, recursive=False, match_name=True,
+        ignorecase=ignorecase, onerror=_raise_error))
+
+
+DirectoryChanges = namedtuple('DirectoryChanges', 'added removed modified')
+"""Entry names changed between two ``DirectorySnapshot`` states."""
+
+
+class DirectorySnapshot():
+    """A snapshot of the direct entries of a directory and their stats.
+
+    ``diff`` returns what changed since the snapshot was taken or last
+    diffed. By default it rescans the directory with a single ``scandir``
+    pass. With ``use_inotify`` changes are read from an inotify watch
+    instead, so only changed entries are stat'ed. Where inotify is not
+    available, e.g. outside of Linux, the snapshot silently rescans.
+    """
+
+    def __init__(self, directory, use_inotify=False):
+        """Take a snapshot of the given directory."""
+        if not directory:
+            raise TypeError('directory not provided.')
+        self.directory = directory
+        self.watch = None
+        if use_inotify:
+            try:
+                self.watch = _InotifyWatch(directory)
+            except (AttributeError, OSError) as error:
+                logging.debug(f'inotify not available: {error}')
+        try:
+            self.entries = self._scan()
+        except BaseException:
+            self.close()
+            raise
+
+    def __enter__(self):  # noqa: D105
+        return self
+
+    def __exit__(self, *exc_info):  # noqa: D105
+        self.close()
+
+    def close(self):
+        """Release the inotify watch if any."""
+        if self.watch is not None:
+            self.watch.close()
+            self.watch = None
+
+    def subdirectories(self, show_hidden=False):
+        """Return the sorted names of all sub-directories."""
+        return sorted(name for name, entry_stat in self.entries.items()
+                      if stat.S_ISDIR(entry_stat[0])
+                      and (show_hidden or not name.startswith('.')))
+
+    def subfiles(self):
+        """Return the sorted names of all entries but sub-directories."""
+        return sorted(name for name, entry_stat in self.entries.items()
+                      if not stat.S_ISDIR(entry_stat[0]))
+
+    def diff(self):
+        """Update the snapshot and return the ``DirectoryChanges``."""
+        names = None if self.watch is None else self.watch.read_changes()
+        if names is None:
+            entries = self._scan()
+            names = set(entries).union(self.entries)
+        else:
+            entries = {name: self._stat(name) for name in names}
+        changes = DirectoryChanges([], [], [])
+        for name in sorted(names):
+            old_stat = self.entries.get(name)
+            new_stat = entries.get(name)
+            if old_stat == new_stat:
+                continue
+            if new_stat is None:
+                changes.removed.append(name)
+                del self.entries[name]
+                continue
+            if old_stat is None:
+                changes.added.append(name)
+            else:
+                changes.modified.append(name)
+            self.entries[name] = new_stat
+        return changes
+
+    def _scan(self):
+        entries = {}
+        for entry in scantree(self.directory, dirs=True, recursive=False,
+                              onerror=_raise_error):
+            try:
+                entries[entry.name] = _stat_tuple(entry.stat())
+            except FileNotFoundError:  # dangling symlink or just removed
+                pass
+        return entries
+
+    def _stat(self, name):
+        try:
+            return _stat_tuple(os.stat(os.path.join(self.directory, name)))
+        except FileNotFoundError:
+            return None
+
+
+def _stat_tuple(entry_stat):
+    return (entry_stat.st_mode, entry_stat.st_size, entry_stat.st_mtime_ns,
+            entry_stat.st_ino)
+
+
+_INOTIFY_MASK = (0x2 | 0x4 | 0x8 | 0x40 | 0x80 | 0x100 | 0x200)
+"""IN_MODIFY, IN_ATTRIB, IN_CLOSE_WRITE, IN_MOVED_*, IN_CREATE, IN_DELETE."""
+_INOTIFY_Q_OVERFLOW = 0x4000
+
+
+class _InotifyWatch():
+    """A non-blocking inotify watch on a single directory via ctypes."""
+
+    def __init__(self, directory):
+        import ctypes
+        import ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        if libc.inotify_add_watch(
+                self.fd, os.fsencode(directory), _INOTIFY_MASK) < 0:
+            error = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(error, f'inotify_add_watch failed for {directory}')
+
+    def close(self):
+        os.close(self.fd)
+
+    def read_changes(self):
+        """Return the names changed since the last call or None on overflow."""
+        names = set()
+        overflow = False
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return None if overflow else names
+            offset = 0
+            while offset < len(data):
+                _, mask, _, length = struct.unpack_from('iIII', data, offset)
+                offset += 16
+                overflow |= bool(mask & _INOTIFY_Q_OVERFLOW)
+                name = data[offset:offset + length].rstrip(b'\0')
+                offset += length
+                if name:
+                    names.add(os.fsdecode(name))
 
 
 def import_modules_with_check(module_names):
@@ -87,69 +273,335 @@ def import_module_with_check(module):
     return success
 
 
-def appendzeros(directory, directories=False):
+def appendzeros(directory, directories=False, max_workers=8):
     """Append leading zeros to all files or directories.
 
-    Only applied if theses objects have leading numbers.
+    Only applied if theses objects have leading numbers. The renames are
+    executed with ``execute_renames``.
     """
-    # list all directory content
-    dir_contents = os.listdir(directory)
-
-    # create an array of signed integers
-    nos = []
-    directories = []
-
-    for dir_content in dir_contents:
-
-        if os.path.isdir(dir_content) == directories:
-
-            # check if directory starts with number
-            result = re.match('^[0-9]+', dir_content)
-
-            if result is not None:
-
-                # remind number at begin
-                dirname = result.group()
-                directories.append(dir_content)
-                no = int(dirname)
-                nos.append(no)
-
-    # stop if no directory
-    if len(directories) == 0:
+    numbered = _numbered_entries(directory, directories)
+    if not numbered:
         print('No objects available')
         return False
+    execute_renames(directory, _appendzeros_plan(numbered),
+                    max_workers=max_workers)
+    return True
 
-    # find out how many zeros to append
-    maximum = max(nos)
-    zeros = len(str(maximum))
-
-    # go trough lists to rename objects
-    for dir_content in directories:
-        result = re.match('^[0-9]+', dir_content)
-        pattern = result.group()
-        replace = pattern.zfill(zeros)
-        new_name = dir_content.replace(pattern, replace)
 
-        # do the renaming
-        os.rename(dir_content, new_name)
+def plan_appendzeros(directory, directories=False):
+    """Return the (old name, new name) renames done by ``appendzeros``."""
+    return _appendzeros_plan(_numbered_entries(directory, directories))
 
-    return True
 
+def execute_renames(directory, plan, journal_path=None, max_workers=8):
+    """Execute a plan of (old name, new name) renames within a directory.
 
-def md5sum(filename):
+    The plan is validated up-front: sources and targets must be unique and
+    a target may only exist if it is renamed itself. If any target is also
+    a source, e.g. for chains or cycles, all entries are moved to temporary
+    names first. Renames run in a pool of ``max_workers`` threads and are
+    recorded in a journal (default: ``RENAME_JOURNAL_NAME`` inside the
+    directory) that is removed on success. An interrupted run can be
+    completed with ``resume_renames`` or undone with ``rollback_renames``.
+    Returns the number of renamed entries.
+    """
+    directory = os.path.abspath(directory)
+    journal_path = journal_path or os.path.join(
+        directory, RENAME_JOURNAL_NAME)
+    steps = _rename_steps(directory, plan)
+    with open(journal_path, 'w') as journal:
+        journal.write(json.dumps(
+            {'directory': directory, 'steps': steps}) + '\n')
+        _run_rename_steps(directory, steps, set(), journal, max_workers)
+    os.remove(journal_path)
+    return len(steps)
+
+
+def resume_renames(journal_path, max_workers=8):
+    """Complete an interrupted ``execute_renames`` run from its journal."""
+    header, done = _read_rename_journal(journal_path)
+    with open(journal_path, 'a') as journal:
+        _run_rename_steps(header['directory'], header['steps'], done,
+                          journal, max_workers)
+    os.remove(journal_path)
+
+
+def rollback_renames(journal_path):
+    """Undo an interrupted ``execute_renames`` run from its journal.
+
+    Only the renames that actually happened are undone, newest first. An
+    existing entry is never overwritten.
+    """
+    header, done = _read_rename_journal(journal_path)
+    directory = header['directory']
+    phases = _rename_phases(header['steps'])
+    moved = list(done)
+    for phase, moves in enumerate(phases):
+        if phase and not all((0, index) in moved
+                             for index in range(len(phases[0]))):
+            break  # the second phase only starts after the first one
+        for index, (source, target) in enumerate(moves):
+            if (phase, index) not in done and _renamed(
+                    directory, source, target):
+                moved.append((phase, index))  # journal entry not written
+    for phase, index in reversed(moved):
+        source, target = phases[phase][index]
+        _move_entry(os.path.join(directory, target),
+                    os.path.join(directory, source))
+    os.remove(journal_path)
+
+
+_LEADING_NUMBER = re.compile('^[0-9]+')
+
+
+def _numbered_entries(directory, directories):
+    numbered = []
+    for entry in scantree(directory, files=not directories, dirs=directories,
+                          recursive=False, onerror=_raise_error):
+        result = _LEADING_NUMBER.match(entry.name)
+        if result is not None:
+            numbered.append((entry.name, result.group()))
+    return numbered
+
+
+def _appendzeros_plan(numbered):
+    if not numbered:
+        return []
+    zeros = len(str(max(int(number) for _, number in numbered)))
+    plan = []
+    for name, number in numbered:
+        new_name = number.zfill(zeros) + name[len(number):]
+        if new_name != name:
+            plan.append((name, new_name))
+    return plan
+
+
+def _rename_steps(directory, plan):
+    sources = {old for old, _ in plan}
+    targets = {new for _, new in plan}
+    if len(sources) != len(plan) or len(targets) != len(plan):
+        raise ValueError('Rename plan contains duplicate sources or targets.')
+    existing = {entry.name for entry in scantree(
+        directory, dirs=True, recursive=False, onerror=_raise_error)}
+    missing = sources - existing
+    if missing:
+        raise FileNotFoundError(f'Missing rename sources: {sorted(missing)}')
+    collisions = (targets & existing) - sources
+    if collisions:
+        raise FileExistsError(
+            f'Rename targets already exist: {sorted(collisions)}')
+    token = uuid.uuid4().hex[:8] if targets & sources else None
+    moves = [(old, new) for old, new in plan if old != new]
+    # short temporary names stay valid for sources of any length
+    return [[old, f'.{token}.{index}.tmp' if token else None, new]
+            for index, (old, new) in enumerate(moves)]
+
+
+def _rename_phases(steps):
+    phases = [[(old, tmp or new) for old, tmp, new in steps]]
+    if any(tmp for _, tmp, _ in steps):
+        phases.append([(tmp, new) for _, tmp, new in steps])
+    return phases
+
+
+def _run_rename_steps(directory, steps, done, journal, max_workers):
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for phase, moves in enumerate(_rename_phases(steps)):
+            futures = {
+                executor.submit(_rename_entry, directory, *move): index
+                for index, move in enumerate(moves)
+                if (phase, index) not in done}
+            errors = []
+            for future in as_completed(futures):
+                if future.exception() is not None:
+                    errors.append(future.exception())
+                    continue
+                journal.write(json.dumps([phase, futures[future]]) + '\n')
+            journal.flush()
+            os.fsync(journal.fileno())
+            if errors:
+                raise errors[0]
+
+
+def _rename_entry(directory, source, target):
+    source = os.path.join(directory, source)
+    target = os.path.join(directory, target)
+    if not os.path.lexists(source) and os.path.lexists(target):
+        return  # renamed before the journal entry was written
+    _move_entry(source, target)
+
+
+def _renamed(directory, source, target):
+    return (not os.path.lexists(os.path.join(directory, source))
+            and os.path.lexists(os.path.join(directory, target)))
+
+
+def _move_entry(source, target):
+    if os.path.lexists(target):
+        raise FileExistsError(f'Rename target already exists: {target}')
+    os.rename(source, target)
+
+
+def _read_rename_journal(journal_path):
+    with open(journal_path) as journal:
+        header = json.loads(journal.readline())
+        done = {}
+        for line in journal:
+            try:
+                done[tuple(json.loads(line))] = None
+            except ValueError:  # line truncated by the interruption
+                break
+    return header, done
+
+
+def md5sum(filename, decompress=False):
     """Calculate an md5 sum for a given filename."""
+    return filehash(filename, 'md5', decompress=decompress)
+
+
+def filehash(filename, algorithm='md5', chunk_size=HASH_CHUNK_SIZE,
+             decompress=False):
+    """Calculate a hex digest for a given filename.
+
+    ``algorithm`` is any name accepted by ``hashlib.new``, e.g. ``md5``,
+    ``sha256`` or the usually faster ``blake2b``. Files up to ``chunk_size``
+    are read at once, files from ``HASH_MMAP_THRESHOLD`` on are hashed from
+    a memory map and all others are read into a single reused buffer. With
+    ``decompress`` the content of compressed files is hashed instead.
+    """
     if os.path.exists(filename) is False:
         raise IOError('Path does not exist')
 
     if os.path.isdir(filename):
         raise ValueError('Path is a directory')
 
-    md5 = hashlib.md5()
-    with open(filename, 'rb') as input_file_handle:
-        for chunk in iter(lambda: input_file_handle.read(
-                128 * md5.block_size), b''):
-            md5.update(chunk)
-    return md5.hexdigest()
+    hasher = hashlib.new(algorithm)
+    if decompress:
+        with open_compressed(filename) as input_file_handle:
+            _hash_readinto(hasher, input_file_handle, chunk_size)
+        return hasher.hexdigest()
+    with open(filename, 'rb', buffering=0) as input_file_handle:
+        size = os.fstat(input_file_handle.fileno()).st_size
+        if size <= chunk_size:
+            hasher.update(input_file_handle.read())
+        elif size >= HASH_MMAP_THRESHOLD:
+            try:
+                _hash_mmap(hasher, input_file_handle, chunk_size)
+            except (OSError, ValueError):  # e.g. not mappable
+                _hash_readinto(hasher, input_file_handle, chunk_size)
+        else:
+            _hash_readinto(hasher, input_file_handle, chunk_size)
+    return hasher.hexdigest()
+
+
+def _hash_mmap(hasher, file_handle, chunk_size):
+    with mmap.mmap(file_handle.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        with memoryview(mapped) as view:
+            for offset in range(0, len(view), chunk_size):
+                hasher.update(view[offset:offset + chunk_size])
+
+
+def _hash_readinto(hasher, file_handle, chunk_size):
+    buffer = bytearray(chunk_size)
+    with memoryview(buffer) as view:
+        size = file_handle.readinto(buffer)
+        while size:
+            hasher.update(view[:size])
+            size = file_handle.readinto(buffer)
+
+
+class HashIndex():
+    """A persistent SQLite index of file content hashes.
+
+    Digests are stored per path and algorithm together with the inode, size
+    and modification time of the file. A cached digest is only returned if
+    all of them are unchanged, otherwise the file is rehashed.
+    """
+
+    def __init__(self, index_file, algorithm='md5'):
+        """Open or create the index at the given file path."""
+        hashlib.new(algorithm)  # fail early on unsupported algorithms
+        self.algorithm = algorithm
+        self.connection = sqlite3.connect(index_file)
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS hashes ('
+            'path TEXT, algorithm TEXT, inode INTEGER, size INTEGER, '
+            'mtime_ns INTEGER, digest TEXT, PRIMARY KEY (path, algorithm))')
+
+    def __enter__(self):  # noqa: D105
+        return self
+
+    def __exit__(self, *exc_info):  # noqa: D105
+        self.close()
+
+    def close(self):
+        """Commit pending changes and close the index."""
+        self.connection.commit()
+        self.connection.close()
+
+    def get(self, filename):
+        """Return the digest of a file, rehashing it only if it changed."""
+        file_stat = os.stat(filename)
+        digest = self._lookup(filename, file_stat)
+        if digest is None:
+            digest = filehash(filename, self.algorithm)
+            self._store([(filename, file_stat, digest)])
+            self.connection.commit()
+        return digest
+
+    def hash_tree(self, path_string, filter_regex=None, max_workers=None):
+        """Return a dict of file paths to digests for a directory tree.
+
+        Only new or changed files are hashed, in parallel across a process
+        pool of ``max_workers`` processes (default: number of cpus).
+        """
+        digests = {}
+        stale = []
+        for entry in scantree(path_string, filter_regex):
+            file_stat = entry.stat()
+            digest = self._lookup(entry.path, file_stat)
+            if digest is None:
+                stale.append((entry.path, file_stat))
+            else:
+                digests[entry.path] = digest
+        filenames = [filename for filename, _ in stale]
+        if max_workers == 1 or len(stale) < 2:
+            new_digests = [filehash(filename, self.algorithm)
+                           for filename in filenames]
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                new_digests = list(executor.map(
+                    filehash, filenames, [self.algorithm] * len(filenames),
+                    chunksize=max(1, len(filenames) // 64)))
+        self._store([(filename, file_stat, digest) for (
+            filename, file_stat), digest in zip(stale, new_digests)])
+        self.connection.commit()
+        digests.update(zip(filenames, new_digests))
+        return digests
+
+    def _lookup(self, filename, file_stat):
+        row = self.connection.execute(
+            'SELECT inode, size, mtime_ns, digest FROM hashes '
+            'WHERE path = ? AND algorithm = ?',
+            (filename, self.algorithm)).fetchone()
+        if row is None or row[:3] != (file_stat.st_ino, file_stat.st_size,
+                                      file_stat.st_mtime_ns):
+            return None
+        return row[3]
+
+    def _store(self, hashed_files):
+        self.connection.executemany(
+            'INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?, ?)',
+            [(filename, self.algorithm, file_stat.st_ino, file_stat.st_size,
+              file_stat.st_mtime_ns, digest)
+             for filename, file_stat, digest in hashed_files])
+
+
+def hash_tree(path_string, index_file, algorithm='md5', filter_regex=None,
+              max_workers=None):
+    """Hash a directory tree using a persistent hash index file."""
+    with HashIndex(index_file, algorithm) as index:
+        return index.hash_tree(path_string, filter_regex, max_workers)
 
 
 def filedatetime():
@@ -158,41 +610,121 @@ def filedatetime():
     return now.strftime('%Y-%m-%d'), now.strftime('%H-%M-%S')
 
 
-def findfiles(path_string, filter_regex=None, doprint=False, file_limit=0):
+def scantree(path_string, filter_regex=None, files=True, dirs=False,
+             recursive=True, match_name=False, ignorecase=True,
+             max_workers=1, follow_symlinks=False, onerror=None):
+    """Scan a directory tree and yield its ``os.DirEntry`` objects.
+
+    Entries are yielded as soon as they are found. ``filter_regex`` is
+    compiled once and matched against the entry path or, if ``match_name``
+    is set, against the entry name. With ``max_workers`` > 1 sub-directories
+    are scanned in a thread pool and the yield order is not deterministic.
+    The entries carry cached stat information, so callers should use
+    ``entry.stat()`` instead of stat'ing ``entry.path`` again. Like
+    ``os.walk`` scan errors are ignored unless ``onerror`` is given.
+    """
+    options = {
+        'files': files,
+        'dirs': dirs,
+        'recursive': recursive,
+        'accept': _compile_filter(filter_regex, ignorecase),
+        'match_name': match_name,
+        'follow_symlinks': follow_symlinks,
+        'onerror': onerror,
+    }
+    if max_workers > 1:
+        yield from _scantree_parallel(path_string, max_workers, options)
+        return
+    stack = [path_string]
+    while stack:
+        subdirs = []
+        yield from _scan_dir(stack.pop(), subdirs, **options)
+        stack.extend(reversed(subdirs))
+
+
+def findfiles(path_string, filter_regex=None, doprint=False, file_limit=0,
+              max_workers=1):
     """List all files in given directory path recursively."""
     filelist = []
-    for dirname, _, filenames in os.walk(path_string):
-        for filename in filenames:
-            file_path = os.path.join(dirname, filename)
-            if filter_regex is not None:
-                match = re.match(filter_regex, file_path, re.IGNORECASE)
-                if match is not None:
-                    filelist.append(file_path)
-                    if (doprint):
-                        print(file_path)
-                    if file_limit > 0 and len(filelist) >= file_limit:
-                        return filelist
-            else:
-                filelist.append(file_path)
-                if (doprint):
-                    print(file_path)
-                if file_limit > 0 and len(filelist) >= file_limit:
-                    return filelist
+    for entry in scantree(path_string, filter_regex, max_workers=max_workers):
+        filelist.append(entry.path)
+        if doprint:
+            print(entry.path)
+        if file_limit > 0 and len(filelist) >= file_limit:
+            break
     return filelist
 
 
-def finddirs(file_path, doprint=False):
+def finddirs(file_path, doprint=False, max_workers=1):
     """List all directories in given directory path recursively."""
     dirlist = []
-    for dirname, dirnames, _ in os.walk(file_path):
-        for subdirname in dirnames:
-            file_path = os.path.join(dirname, subdirname)
-            dirlist.append(path)
-            if (doprint):
-                print(path)
+    for entry in scantree(file_path, files=False, dirs=True,
+                          max_workers=max_workers):
+        dirlist.append(entry.path)
+        if doprint:
+            print(entry.path)
     return dirlist
 
 
+def _compile_filter(filter_regex, ignorecase):
+    if filter_regex is None:
+        return None
+    if isinstance(filter_regex, str):
+        filter_regex = re.compile(
+            filter_regex, re.IGNORECASE if ignorecase else 0)
+    return filter_regex.match
+
+
+def _scan_dir(directory, subdirs, files, dirs, recursive, accept, match_name,
+              follow_symlinks, onerror):
+    try:
+        with os.scandir(directory) as iterator:
+            for entry in iterator:
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+                if is_dir and recursive and (
+                        follow_symlinks or not entry.is_symlink()):
+                    subdirs.append(entry.path)
+                if not (dirs if is_dir else files):
+                    continue
+                if accept is None or accept(
+                        entry.name if match_name else entry.path):
+                    yield entry
+    except OSError as error:
+        if onerror is not None:
+            onerror(error)
+
+
+def _scan_dir_batch(directory, options):
+    subdirs = []
+    entries = list(_scan_dir(directory, subdirs, **options))
+    return entries, subdirs
+
+
+def _scantree_parallel(path_string, max_workers, options):
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    pending = {executor.submit(_scan_dir_batch, path_string, options)}
+    try:
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                entries, subdirs = future.result()
+                for subdir in subdirs:
+                    pending.add(
+                        executor.submit(_scan_dir_batch, subdir, options))
+                yield from entries
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=False)
+
+
+def _raise_error(error):
+    raise error
+
+
 def insertintofilename(filepath, insertion):
     """Append some text between a filename and the file suffix."""
     newfile = ''
@@ -203,13 +735,70 @@ def insertintofilename(filepath, insertion):
     return newfile
 
 
-def countlines(fname):
-    """Count the lines of the given file."""
-    i = -1
-    with open(fname) as input_file_handle:
-        for i, _ in enumerate(input_file_handle):
-            pass
-    return i + 1
+def countlines(fname, processes=1, chunk_size=COUNT_CHUNK_SIZE):
+    """Count the lines of the given file.
+
+    Newlines are counted in binary chunks read into a reused buffer. A last
+    line without a trailing newline is counted as well. With ``processes``
+    > 1 the file is split into byte ranges that are counted in a process
+    pool. Compressed files are decompressed and counted as a stream.
+    """
+    if _detect_compression(fname) is not None:
+        return _count_stream_lines(fname, chunk_size)
+    size = os.path.getsize(fname)
+    if processes > 1 and size > chunk_size:
+        step = -(-size // processes)
+        starts = range(0, size, step)
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            count = sum(executor.map(
+                _count_newlines, [fname] * len(starts), starts,
+                [min(start + step, size) for start in starts],
+                [chunk_size] * len(starts)))
+    else:
+        count = _count_newlines(fname, 0, size, chunk_size)
+    if size and _count_newlines(fname, size - 1, size, 1) == 0:
+        count += 1
+    return count
+
+
+def countlines_many(fnames, max_workers=None):
+    """Count the lines of many files concurrently.
+
+    Returns a dict of file names to line counts.
+    """
+    fnames = list(fnames)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return dict(zip(fnames, executor.map(countlines, fnames)))
+
+
+def _count_stream_lines(fname, chunk_size):
+    count = 0
+    last_byte = 10  # an empty file has no unterminated last line
+    buffer = bytearray(chunk_size)
+    with open_compressed(fname) as input_file_handle:
+        size = input_file_handle.readinto(buffer)
+        while size:
+            count += buffer.count(b'\n', 0, size)
+            last_byte = buffer[size - 1]
+            size = input_file_handle.readinto(buffer)
+    return count if last_byte == 10 else count + 1
+
+
+def _count_newlines(fname, start, end, chunk_size):
+    count = 0
+    buffer = bytearray(chunk_size)
+    with open(fname, 'rb', buffering=0) as input_file_handle, \
+            memoryview(buffer) as view:
+        input_file_handle.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            size = input_file_handle.readinto(
+                view[:min(chunk_size, remaining)])
+            if not size:
+                break
+            count += buffer.count(b'\n', 0, size)
+            remaining -= size
+    return count
 
 
 def getuidfromfilepath(filename):
@@ -254,18 +843,160 @@ def file_exists(path):
 
 def read_file_to_list(filepath, strip=True, ignore_empty_lines=False):
     """Read a file and writes content to a list."""
-    content = []
     if not file_exists(filepath):
-        return content
-    ofile = open(filepath)
-    for line in ofile:
-        if strip:
-            line = line.strip()
-        if ignore_empty_lines and not line:
-            continue
-        content.append(line)
-    ofile.close()
-    return content
+        return []
+    return list(iter_lines(filepath, strip, ignore_empty_lines))
+
+
+def iter_lines(filepath, strip=True, ignore_empty_lines=False):
+    """Lazily iterate the lines of a file.
+
+    Compressed files are decompressed, see ``open_compressed``.
+    """
+    with open_compressed(filepath, 'rt') as input_file_handle:
+        if not strip and not ignore_empty_lines:
+            yield from input_file_handle
+            return
+        for line in input_file_handle:
+            if strip:
+                line = line.strip()
+            if ignore_empty_lines and not line:
+                continue
+            yield line
+
+
+def write_lines(lines, filepath, batch_size=WRITE_BATCH_LINES):
+    """Write any iterable of lines to a file and return the line count.
+
+    Lines are converted with ``str`` and written in batches of
+    ``batch_size`` lines per write call. Files ending with ``.gz``, ``.bz2``
+    or ``.xz`` are compressed.
+    """
+    lines = iter(lines)
+    count = 0
+    with _open_text(filepath, 'w') as output_file_handle:
+        for batch in iter(lambda: list(islice(lines, batch_size)), []):
+            output_file_handle.write('\n'.join(map(str, batch)) + '\n')
+            count += len(batch)
+    return count
+
+
+def open_compressed(filepath, mode='rb', encoding=None, newline=None,
+                    threaded=True, buffer_size=DECOMPRESS_BUFFER_SIZE):
+    """Open a possibly compressed file for reading.
+
+    gzip, bzip2, xz and zstd compression is detected by the magic bytes of
+    the file, other files are opened as they are. zstd requires the optional
+    ``zstandard`` package. With ``threaded`` the decompression runs in a
+    background thread that reads up to ``DECOMPRESS_QUEUE_DEPTH`` chunks of
+    ``buffer_size`` ahead, so decoding overlaps with the consumer.
+    """
+    if mode not in ('r', 'rb', 'rt'):
+        raise ValueError(f'Unsupported mode "{mode}".')
+    compression = _detect_compression(filepath)
+    if compression is None:
+        if mode == 'rb':
+            return open(filepath, 'rb', buffering=buffer_size)
+        return open(filepath, 'rt', encoding=encoding, newline=newline)
+    fileobj = _DECOMPRESSORS[compression](filepath)
+    if threaded:
+        fileobj = io.BufferedReader(
+            _PrefetchReader(fileobj, buffer_size), buffer_size)
+    if mode == 'rb':
+        return fileobj
+    return io.TextIOWrapper(fileobj, encoding=encoding, newline=newline)
+
+
+def _open_zstd(filepath):
+    import zstandard
+    return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(
+        open(filepath, 'rb'), closefd=True))
+
+
+_DECOMPRESSORS = {
+    'gzip': gzip.open,
+    'bz2': bz2.open,
+    'xz': lzma.open,
+    'zstd': _open_zstd,
+}
+
+
+def _detect_compression(filepath):
+    with open(filepath, 'rb') as input_file_handle:
+        magic = input_file_handle.read(6)
+    if magic.startswith(b'\x1f\x8b'):
+        return 'gzip'
+    if magic.startswith(b'BZh') and magic[3:4].isdigit():
+        return 'bz2'
+    if magic.startswith(b'\xfd7zXZ\x00'):
+        return 'xz'
+    if magic.startswith(b'\x28\xb5\x2f\xfd'):
+        return 'zstd'
+    return None
+
+
+class _PrefetchReader(io.RawIOBase):
+    """Read a file object ahead in a background thread."""
+
+    def __init__(self, fileobj, chunk_size):
+        self.fileobj = fileobj
+        self.chunk_size = chunk_size
+        self.chunks = Queue(DECOMPRESS_QUEUE_DEPTH)
+        self.pending = memoryview(b'')
+        self.eof = False
+        self.stopped = False
+        self.thread = Thread(target=self._read_ahead, daemon=True)
+        self.thread.start()
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if not self.pending:
+            if self.eof:
+                return 0
+            chunk = self.chunks.get()
+            if isinstance(chunk, BaseException):
+                raise chunk
+            if not chunk:
+                self.eof = True
+                return 0
+            self.pending = memoryview(chunk)
+        size = min(len(buffer), len(self.pending))
+        buffer[:size] = self.pending[:size]
+        self.pending = self.pending[size:]
+        return size
+
+    def close(self):
+        if self.closed:
+            return
+        self.stopped = True
+        while self.thread.is_alive():
+            try:
+                self.chunks.get_nowait()
+            except Empty:
+                self.thread.join(0.01)
+        self.fileobj.close()
+        super().close()
+
+    def _read_ahead(self):
+        try:
+            while not self.stopped:
+                chunk = self.fileobj.read(self.chunk_size)
+                self.chunks.put(chunk)
+                if not chunk:
+                    return
+        except Exception as error:
+            self.chunks.put(error)
+
+
+def _open_text(filepath, mode):
+    opener = {
+        '.gz': gzip.open,
+        '.bz2': bz2.open,
+        '.xz': lzma.open,
+    }.get(os.path.splitext(str(filepath))[1].lower(), open)
+    return opener(filepath, mode + 't')
 
 
 def add_to_pythonpath(syspath):
@@ -280,39 +1011,343 @@ def add_to_pythonpath(syspath):
 
 def read_file_to_string(filepath, ignore_empty_lines=False):
     """Read file and write content to a string."""
-    content = []
     if not file_exists(filepath):
-        return content
-    ofile = open(filepath)
-    for line in ofile:
-        line = line.strip()
-        if not line and ignore_empty_lines:
-            continue
-        content.append(line)
-    ofile.close()
-    return '\n'.join(content)
+        return []
+    return '\n'.join(iter_lines(filepath, True, ignore_empty_lines))
 
 
 def write_list_to_file(content, filepath):
     """Write content of a list to a given file."""
-    ofile = open(filepath, 'w')
-    for line in content:
-        ofile.write(str(line) + '\n')
-    ofile.close()
-
-
-def zip_dir_recursively(base_dir, zip_file):
-    """Zip compresses a base_dir recursively."""
-    zip_file = zipfile.ZipFile(zip_file, 'w', compression=zipfile.ZIP_DEFLATED)
-    root_len = len(os.path.abspath(base_dir))
-    for root, _, files in os.walk(base_dir):
-        archive_root = os.path.abspath(root)[root_len:]
-        for f in files:
-            fullpath = os.path.join(root, f)
-            archive_name = os.path.join(archive_root, f)
-            zip_file.write(fullpath, archive_name, zipfile.ZIP_DEFLATED)
-    zip_file.close()
-    return zip_file
+    write_lines(content, filepath)
+
+
+def zip_dir_recursively(base_dir, zip_file, compresslevel=6,
+                        max_workers=None):
+    """Zip compresses a base_dir recursively.
+
+    ``zip_file`` is a path or a writable binary file object, which does not
+    need to be seekable. Members are compressed in a thread pool, ``zlib``
+    releases the GIL while compressing, and written in sorted order. Files
+    with a suffix in ``ZIP_STORED_SUFFIXES`` are stored uncompressed. Files
+    larger than ``ZIP_STREAM_THRESHOLD`` are compressed chunk-wise by the
+    writing thread, so memory stays bounded for very large files.
+    """
+    with ZipArchiveWriter(zip_file) as writer:
+        _zip_tree(writer, base_dir, compresslevel, max_workers)
+    return writer
+
+
+def update_zip_dir_recursively(base_dir, zip_file, compresslevel=6,
+                               max_workers=None):
+    """Update the zip archive of a base_dir, only adding changed files.
+
+    A member is unchanged if size and modification time or, if only the
+    time differs, its CRC match the file in ``base_dir``. Unchanged members
+    are copied over without decompressing them, only new or modified files
+    are compressed like in ``zip_dir_recursively``. The archive is replaced
+    atomically. Returns a ``ZipUpdate`` of the affected member names.
+    """
+    existing = {}
+    source = None
+    if os.path.exists(zip_file):
+        with zipfile.ZipFile(zip_file) as archive:
+            existing = {zinfo.filename: zinfo
+                        for zinfo in archive.infolist()}
+        source = open(zip_file, 'rb')
+    update = ZipUpdate([], [], [], [])
+
+    def reuse(zinfo, file_path):
+        old_zinfo = existing.pop(zinfo.filename, None)
+        if old_zinfo is None:
+            update.added.append(zinfo.filename)
+            return None
+        if not _zip_member_unchanged(old_zinfo, zinfo, file_path):
+            update.modified.append(zinfo.filename)
+            return None
+        update.unchanged.append(zinfo.filename)
+        zinfo.CRC = old_zinfo.CRC
+        zinfo.compress_type = old_zinfo.compress_type
+        zinfo.compress_size = old_zinfo.compress_size
+        return _zip_raw_chunks(source, old_zinfo)
+
+    handle, tmp_path = tempfile.mkstemp(
+        suffix='.tmp', dir=os.path.dirname(os.path.abspath(zip_file)))
+    try:
+        with os.fdopen(handle, 'wb') as output_file_handle, \
+                ZipArchiveWriter(output_file_handle) as writer:
+            _zip_tree(writer, base_dir, compresslevel, max_workers, reuse)
+        os.replace(tmp_path, zip_file)
+    except BaseException:
+        remove_silent(tmp_path)
+        raise
+    finally:
+        if source is not None:
+            source.close()
+    update.removed.extend(sorted(existing))
+    return update
+
+
+class ZipArchiveWriter():
+    """Write zip archives strictly sequentially.
+
+    The target is a file path or any writable binary file object. Headers
+    are never rewritten, so non-seekable targets such as pipes work as well.
+    Members are either passed in compressed already, which allows to
+    compress them in parallel, or compressed from a stream of chunks.
+    """
+
+    def __init__(self, zip_file):
+        """Construct a new writer for the given path or file object."""
+        self.close_fileobj = not hasattr(zip_file, 'write')
+        self.fileobj = open(zip_file, 'wb') if self.close_fileobj \
+            else zip_file
+        self.offset = 0
+        self.members = []
+
+    def __enter__(self):  # noqa: D105
+        return self
+
+    def __exit__(self, *exc_info):  # noqa: D105
+        self.close()
+
+    def infolist(self):
+        """Return the ``ZipInfo`` objects of all written members."""
+        return self.members
+
+    def write_compressed(self, zinfo, data):
+        """Write a member with compressed ``data``.
+
+        ``CRC`` and ``file_size`` of ``zinfo`` must be set.
+        """
+        zinfo.compress_size = len(data)
+        self.write_raw(zinfo, [data])
+
+    def write_raw(self, zinfo, chunks):
+        """Write a member from an iterable of compressed chunks.
+
+        ``CRC``, ``file_size`` and ``compress_size`` of ``zinfo`` must be set.
+        """
+        zinfo.header_offset = self.offset
+        self._write(self._local_header(zinfo))
+        for chunk in chunks:
+            self._write(chunk)
+        self.members.append(zinfo)
+
+    def write_stream(self, zinfo, chunks, compresslevel=6):
+        """Compress and write a member from an iterable of chunks.
+
+        ``zinfo.file_size`` is used as size estimate to decide on ZIP64.
+        """
+        zinfo.flag_bits |= 0x08  # sizes and CRC follow in a data descriptor
+        zinfo.header_offset = self.offset
+        zip64 = self._local_header_needs_zip64(zinfo)
+        self._write(self._local_header(zinfo))
+        compressor = None
+        if zinfo.compress_type == zipfile.ZIP_DEFLATED:
+            compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, -15)
+        crc = file_size = compress_size = 0
+        for chunk in chunks:
+            crc = zlib.crc32(chunk, crc)
+            file_size += len(chunk)
+            if compressor is not None:
+                chunk = compressor.compress(chunk)
+            compress_size += len(chunk)
+            self._write(chunk)
+        if compressor is not None:
+            chunk = compressor.flush()
+            compress_size += len(chunk)
+            self._write(chunk)
+        if not zip64 and max(file_size, compress_size) > zipfile.ZIP64_LIMIT:
+            raise zipfile.LargeZipFile(
+                f'{zinfo.filename} grew beyond the ZIP64 limit.')
+        zinfo.CRC = crc
+        zinfo.file_size = file_size
+        zinfo.compress_size = compress_size
+        self._write(struct.pack('<IIQQ' if zip64 else '<IIII', 0x08074b50,
+                                crc, compress_size, file_size))
+        self.members.append(zinfo)
+
+    def close(self):
+        """Write the central directory and close the writer."""
+        if self.fileobj is None:
+            return
+        directory_offset = self.offset
+        for zinfo in self.members:
+            self._write(self._central_header(zinfo))
+        directory_size = self.offset - directory_offset
+        count = len(self.members)
+        if count > 0xFFFF or max(directory_offset, directory_size) \
+                > zipfile.ZIP64_LIMIT:
+            self._write(struct.pack(
+                '<IQHHIIQQQQ', 0x06064b50, 44, 45, 45, 0, 0, count, count,
+                directory_size, directory_offset))
+            self._write(struct.pack(
+                '<IIQI', 0x07064b50, 0, self.offset - 56, 1))
+            count = min(count, 0xFFFF)
+            directory_size = min(directory_size, 0xFFFFFFFF)
+            directory_offset = min(directory_offset, 0xFFFFFFFF)
+        self._write(struct.pack('<IHHHHIIH', 0x06054b50, 0, 0, count, count,
+                                directory_size, directory_offset, 0))
+        if self.close_fileobj:
+            self.fileobj.close()
+        else:
+            self.fileobj.flush()
+        self.fileobj = None
+
+    def _write(self, data):
+        self.fileobj.write(data)
+        self.offset += len(data)
+
+    def _local_header_needs_zip64(self, zinfo):
+        size = zinfo.file_size
+        if not zinfo.flag_bits & 0x08:
+            size = max(size, zinfo.compress_size)
+        return size * 1.05 > zipfile.ZIP64_LIMIT
+
+    def _local_header(self, zinfo):
+        filename, flag_bits = _encode_zip_filename(zinfo)
+        if zinfo.flag_bits & 0x08:
+            crc = compress_size = file_size = 0
+        else:
+            crc, compress_size, file_size = \
+                zinfo.CRC, zinfo.compress_size, zinfo.file_size
+        extra = b''
+        zinfo.extract_version = _zip_extract_version(zinfo, False)
+        if self._local_header_needs_zip64(zinfo):
+            extra = struct.pack('<HHQQ', 1, 16, file_size, compress_size)
+            compress_size = file_size = 0xFFFFFFFF
+            zinfo.extract_version = _zip_extract_version(zinfo, True)
+        dostime, dosdate = _zip_dos_date_time(zinfo)
+        return struct.pack(
+            '<IHHHHHIIIHH', 0x04034b50, zinfo.extract_version, flag_bits,
+            zinfo.compress_type, dostime, dosdate, crc, compress_size,
+            file_size, len(filename), len(extra)) + filename + extra
+
+    def _central_header(self, zinfo):
+        filename, flag_bits = _encode_zip_filename(zinfo)
+        fields = (zinfo.file_size, zinfo.compress_size, zinfo.header_offset)
+        extra = b''
+        if max(fields) > zipfile.ZIP64_LIMIT or zinfo.extract_version >= 45:
+            extra = struct.pack('<HH3Q', 1, 24, *fields)
+            fields = (0xFFFFFFFF,) * 3
+            zinfo.extract_version = _zip_extract_version(zinfo, True)
+        file_size, compress_size, header_offset = fields
+        dostime, dosdate = _zip_dos_date_time(zinfo)
+        return struct.pack(
+            '<IHHHHHHIIIHHHHHII', 0x02014b50,
+            zinfo.create_system << 8 | zinfo.create_version,
+            zinfo.extract_version, flag_bits, zinfo.compress_type, dostime,
+            dosdate, zinfo.CRC, compress_size, file_size, len(filename),
+            len(extra), 0, 0, zinfo.internal_attr, zinfo.external_attr,
+            header_offset) + filename + extra
+
+
+def _zip_tree(writer, base_dir, compresslevel, max_workers, reuse=None):
+    entries = sorted(scantree(base_dir), key=lambda entry: entry.path)
+    window = 2 * (max_workers or os.cpu_count() or 1)
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for entry in entries:
+            zinfo = _zipinfo_from_entry(
+                entry, os.path.relpath(entry.path, base_dir))
+            payload = None if reuse is None else reuse(zinfo, entry.path)
+            if payload is None and zinfo.file_size <= ZIP_STREAM_THRESHOLD:
+                payload = executor.submit(
+                    _zip_compress_file, entry.path, zinfo.compress_type,
+                    compresslevel)
+            pending.append((zinfo, entry.path, payload))
+            while len(pending) > window:
+                _zip_write_pending(writer, pending.popleft(), compresslevel)
+        while pending:
+            _zip_write_pending(writer, pending.popleft(), compresslevel)
+
+
+def _zipinfo_from_entry(entry, arcname):
+    file_stat = entry.stat()
+    date_time = max(time.localtime(file_stat.st_mtime)[:6],
+                    (1980, 1, 1, 0, 0, 0))
+    zinfo = zipfile.ZipInfo(arcname, date_time)
+    zinfo.external_attr = (file_stat.st_mode & 0xFFFF) << 16
+    zinfo.file_size = file_stat.st_size
+    if os.path.splitext(arcname)[1].lower() in ZIP_STORED_SUFFIXES:
+        zinfo.compress_type = zipfile.ZIP_STORED
+    else:
+        zinfo.compress_type = zipfile.ZIP_DEFLATED
+    return zinfo
+
+
+def _zip_compress_file(file_path, compress_type, compresslevel):
+    with open(file_path, 'rb') as input_file_handle:
+        data = input_file_handle.read()
+    crc = zlib.crc32(data)
+    file_size = len(data)
+    if compress_type == zipfile.ZIP_DEFLATED:
+        compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, -15)
+        data = compressor.compress(data) + compressor.flush()
+    return crc, file_size, data
+
+
+def _zip_write_pending(writer, pending, compresslevel):
+    zinfo, file_path, payload = pending
+    if payload is None:
+        with open(file_path, 'rb') as input_file_handle:
+            writer.write_stream(zinfo, iter(lambda: input_file_handle.read(
+                ZIP_CHUNK_SIZE), b''), compresslevel)
+    elif isinstance(payload, Future):
+        zinfo.CRC, zinfo.file_size, data = payload.result()
+        writer.write_compressed(zinfo, data)
+    else:
+        writer.write_raw(zinfo, payload)
+
+
+def _zip_member_unchanged(old_zinfo, zinfo, file_path):
+    if old_zinfo.flag_bits & 0x01 or old_zinfo.compress_type not in (
+            zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+        return False  # encrypted or not supported by the writer
+    if old_zinfo.file_size != zinfo.file_size:
+        return False
+    if old_zinfo.date_time == zinfo.date_time[:5] + (
+            zinfo.date_time[5] // 2 * 2,):
+        return True
+    crc = 0
+    with open(file_path, 'rb') as input_file_handle:
+        for chunk in iter(lambda: input_file_handle.read(
+                ZIP_CHUNK_SIZE), b''):
+            crc = zlib.crc32(chunk, crc)
+    return crc == old_zinfo.CRC
+
+
+def _zip_raw_chunks(source, zinfo):
+    source.seek(zinfo.header_offset)
+    header = source.read(30)
+    name_length, extra_length = struct.unpack('<HH', header[26:30])
+    source.seek(name_length + extra_length, os.SEEK_CUR)
+    remaining = zinfo.compress_size
+    while remaining > 0:
+        chunk = source.read(min(ZIP_CHUNK_SIZE, remaining))
+        if not chunk:
+            raise zipfile.BadZipFile(f'Truncated member {zinfo.filename}')
+        remaining -= len(chunk)
+        yield chunk
+
+
+def _encode_zip_filename(zinfo):
+    try:
+        return zinfo.filename.encode('ascii'), zinfo.flag_bits
+    except UnicodeEncodeError:
+        return zinfo.filename.encode('utf-8'), zinfo.flag_bits | 0x800
+
+
+def _zip_extract_version(zinfo, zip64):
+    if zip64:
+        return 45
+    return 20 if zinfo.compress_type == zipfile.ZIP_DEFLATED else 10
+
+
+def _zip_dos_date_time(zinfo):
+    year, month, day, hour, minute, second = zinfo.date_time
+    return (hour << 11 | minute << 5 | second // 2,
+            (year - 1980) << 9 | month << 5 | day)
 
 
 def remove_silent(file_path):
@@ -337,18 +1372,188 @@ def get_file_size(file_path):
     return os.path.getsize(file_path)
 
 
-def read_csv_to_array(csv_path, delimiter=';', quotechar='"'):
-    """Read a CSV - file to an array of arrays of input fields."""
+def read_csv_to_array(csv_path, delimiter=';', quotechar='"', processes=1):
+    """Read a CSV - file to an array of arrays of input fields.
+
+    With ``processes`` > 1 the file is parsed in parallel using
+    ``iter_csv_chunks_parallel``.
+    """
+    if processes > 1:
+        chunks = iter_csv_chunks_parallel(
+            csv_path, delimiter, quotechar, processes)
+    else:
+        chunks = iter_csv_chunks(csv_path, delimiter, quotechar)
     datasets = []
+    for chunk in chunks:
+        datasets.extend(chunk)
+    return datasets
+
+
+def iter_csv_chunks(csv_path, delimiter=';', quotechar='"', chunk_size=10000,
+                    columns=None, converters=None, columnar=None):
+    """Stream a CSV - file in batches of up to ``chunk_size`` rows.
+
+    ``columns`` is an optional list of column indices to keep, all other
+    fields are dropped right after parsing. ``converters`` maps column
+    indices to callables applied to the raw field, e.g. ``{0: int}``.
+
+    By default every batch is a list of rows. With ``columnar='array'`` a
+    batch is a list of columns instead, where columns converted by ``int``
+    or ``float`` are stored in ``array.array`` buffers. ``columnar='numpy'``
+    stores them as NumPy arrays.
+
+    With ``columns`` or ``columnar`` blank lines are skipped and rows too
+    short for the requested columns raise a ``ValueError``.
+    """
     if not file_exists(csv_path):
         raise IOError(f'Input file \'{csv_path}\' does not exist.')
-    with open(csv_path, 'rt') as csvfile:
+    if columnar not in (None, 'array', 'numpy'):
+        raise ValueError(f'Unsupported columnar mode "{columnar}".')
+    converters = converters or {}
+    convert_row = _csv_row_converter(columns, converters)
+    with open_compressed(csv_path, 'rt', newline='') as csvfile:
         csv_datasets = csv.reader(csvfile,
                                   delimiter=delimiter, quotechar=quotechar)
-        for csv_dataset in csv_datasets:
-            datasets.append(csv_dataset)
-    csvfile.close()
-    return datasets
+        for chunk in iter(lambda: list(islice(csv_datasets, chunk_size)), []):
+            if columns is not None or columnar is not None:
+                chunk = [row for row in chunk if row]
+                if not chunk:
+                    continue
+            if convert_row is not None:
+                chunk = [convert_row(row) for row in chunk]
+            if columnar is not None:
+                chunk = _csv_chunk_to_columns(
+                    chunk, columns, converters, columnar)
+            yield chunk
+
+
+def iter_csv_chunks_parallel(csv_path, delimiter=';', quotechar='"',
+                             processes=None, range_size=CSV_RANGE_SIZE,
+                             ordered=True, columns=None, converters=None):
+    """Parse a CSV - file in a process pool and yield the rows per range.
+
+    The file is split into newline-aligned byte ranges of roughly
+    ``range_size`` bytes. Newlines inside quoted fields are never used as
+    range boundaries, which assumes quotes are escaped by doubling them.
+    Each range is parsed by one of ``processes`` worker processes (default:
+    number of cpus). With ``ordered=False`` ranges are yielded as soon as
+    they are parsed. At most two ranges per process are in flight.
+
+    ``columns`` and ``converters`` work like in ``iter_csv_chunks`` but are
+    applied inside the workers, so dropped fields are never sent back to
+    the calling process. Converters must be picklable. Compressed files
+    have no random access and are parsed sequentially instead.
+    """
+    if not file_exists(csv_path):
+        raise IOError(f'Input file \'{csv_path}\' does not exist.')
+    if _detect_compression(csv_path) is not None:
+        yield from iter_csv_chunks(csv_path, delimiter, quotechar,
+                                   columns=columns, converters=converters)
+        return
+    ranges = _csv_byte_ranges(csv_path, range_size, quotechar)
+    window = 2 * (processes or os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        def submit(byte_range):
+            return executor.submit(_parse_csv_range, csv_path, *byte_range,
+                                   delimiter, quotechar, columns, converters)
+        pending = [submit(byte_range) for byte_range in islice(ranges, window)]
+        while pending:
+            if ordered:
+                future = pending.pop(0)
+            else:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                future = done.pop()
+                pending.remove(future)
+            pending.extend(submit(byte_range)
+                           for byte_range in islice(ranges, 1))
+            yield future.result()
+
+
+def _csv_byte_ranges(csv_path, range_size, quotechar):
+    quote = quotechar.encode() if quotechar else None
+    range_start = 0
+    target = range_size
+    offset = 0
+    odd_quotes = False
+    with open(csv_path, 'rb') as input_file_handle:
+        for block in iter(lambda: input_file_handle.read(
+                COUNT_CHUNK_SIZE), b''):
+            start = 0
+            while offset + len(block) > target:
+                newline = block.find(b'\n', max(start, target - offset))
+                if newline < 0:
+                    break
+                if quote is not None:
+                    odd_quotes ^= block.count(quote, start, newline) % 2 == 1
+                start = newline + 1
+                if not odd_quotes:
+                    yield range_start, offset + start
+                    range_start = offset + start
+                    target = range_start + range_size
+            if quote is not None:
+                odd_quotes ^= block.count(quote, start) % 2 == 1
+            offset += len(block)
+    if offset > range_start:
+        yield range_start, offset
+
+
+def _parse_csv_range(csv_path, start, end, delimiter, quotechar, columns,
+                     converters):
+    with open(csv_path, 'rb') as input_file_handle:
+        input_file_handle.seek(start)
+        data = input_file_handle.read(end - start)
+    text = data.decode(locale.getpreferredencoding(False))
+    csv_datasets = csv.reader(io.StringIO(text, newline=''),
+                              delimiter=delimiter, quotechar=quotechar)
+    convert_row = _csv_row_converter(columns, converters or {})
+    if convert_row is None:
+        return list(csv_datasets)
+    if columns is not None:
+        csv_datasets = filter(None, csv_datasets)
+    return [convert_row(row) for row in csv_datasets]
+
+
+def _csv_row_converter(columns, converters):
+    if columns is None and not converters:
+        return None
+    if columns is None:
+        def convert_row(row):
+            for index, converter in converters.items():
+                if index < len(row):
+                    row[index] = converter(row[index])
+            return row
+        return convert_row
+    spec = [(index, converters.get(index)) for index in columns]
+
+    def project_row(row):
+        try:
+            return [row[index] if converter is None
+                    else converter(row[index]) for index, converter in spec]
+        except IndexError:
+            raise ValueError(f'CSV row {row} has no column {max(columns)}.')
+    return project_row
+
+
+_CSV_TYPECODES = {int: 'q', float: 'd'}
+
+
+def _csv_chunk_to_columns(chunk, columns, converters, columnar):
+    if columnar == 'numpy':
+        import numpy
+    if len({len(row) for row in chunk}) > 1:
+        raise ValueError('CSV rows of different lengths cannot be stored '
+                         + 'in columns.')
+    result = []
+    for position, values in enumerate(zip(*chunk)):
+        index = position if columns is None else columns[position]
+        typecode = _CSV_TYPECODES.get(converters.get(index))
+        if typecode is None:
+            result.append(list(values))
+        elif columnar == 'numpy':
+            result.append(numpy.array(values, dtype=typecode))
+        else:
+            result.append(array(typecode, values))
+    return result
 
 
 def touch(fname):
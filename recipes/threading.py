@@ -1,50 +1,606 @@
 """This module contains tools for multi-threading operations."""
 
+import json
+import logging
 import multiprocessing
-from queue import Queue
+import os
+import pickle
+import subprocess
+import sys
+from collections import Counter, deque, namedtuple
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from itertools import count
+from multiprocessing.connection import wait
+from os import path
+from queue import Empty, Queue
 from random import randrange
-from threading import Thread
-from time import sleep
+from threading import Condition, Lock, Semaphore, Thread, local
+from time import monotonic, sleep
 from urllib import request
 
+PoolStats = namedtuple('PoolStats', [
+    'submitted', 'completed', 'failed', 'cancelled', 'wait_time', 'run_time',
+    'max_wait_time', 'max_run_time'])
+"""Task counters and accumulated task timings in seconds of a pool."""
+SHARED_RESULT_MIN_BYTES = 64 * 1024
+"""Minimum size of arrays ProcessPool returns through shared memory."""
+
+CommandSummary = namedtuple('CommandSummary', 'succeeded failed skipped')
+"""Numbers of commands run_commands_from_file_parallel ran or skipped."""
+COMMAND_POLL_INTERVAL = 0.05
+"""Seconds between checks for finished commands."""
+COMMAND_MIN_FREE_MEMORY = 512 * 1024 * 1024
+"""Default bytes of memory that must be available to start a command."""
+LOAD_AVERAGE_WINDOW = 60
+"""Seconds after which a started command is reflected in the load average."""
+
+_SharedArray = namedtuple('_SharedArray', 'name shape dtype')
+
+_SHUTDOWN = object()
+
+
+class TaskFuture(Future):
+    """Future of a pool task recording when it was queued, started, done."""
+
+    def __init__(self):
+        """Construct a new future queued right now."""
+        super().__init__()
+        self.queued = monotonic()
+        self.started = None
+        self.finished = None
+
+    @property
+    def wait_time(self):
+        """Return the seconds the task waited until it started running."""
+        return None if self.started is None else self.started - self.queued
+
+    @property
+    def run_time(self):
+        """Return the seconds the task was running."""
+        if self.finished is None:
+            return None
+        return self.finished - self.started
+
 
 class Worker(Thread):
-    """Thread executing tasks from a given tasks queue"""
+    """Thread executing tasks from a given tasks queue."""
 
-    def __init__(self, tasks):
+    def __init__(self, tasks, pool=None):
+        """Construct and start a new worker thread."""
         Thread.__init__(self)
         self.tasks = tasks
+        self.pool = pool
         self.daemon = True
         self.start()
 
     def run(self):
+        """Run queued tasks until the shutdown marker is received."""
         while True:
-            func, args, kargs = self.tasks.get()
+            task = self.tasks.get()
             try:
-                func(*args, **kargs)
-            except Exception as e:
-                print(e)
-            self.tasks.task_done()
+                if task is _SHUTDOWN:
+                    return
+                _run_task(self.pool, *task)
+            finally:
+                self.tasks.task_done()
 
 
-class ThreadPool:
-    """Pool of threads consuming tasks from a queue"""
+class _TaskPool():
+    """Task submission, result iteration and statistics shared by pools."""
 
-    def __init__(self, num_threads):
-        self.tasks = Queue(num_threads)
-        for _ in range(num_threads):
-            Worker(self.tasks)
+    def __init__(self, window):
+        self.window = window
+        self._shutdown = False
+        self._submit_lock = Lock()
+        self._stats_lock = Lock()
+        self._stats = dict.fromkeys(PoolStats._fields, 0)
+
+    def __enter__(self):  # noqa: D105
+        return self
+
+    def __exit__(self, *_):  # noqa: D105
+        self.shutdown()
 
     def add_task(self, func, *args, **kargs):
-        """Add a task to the queue"""
-        self.tasks.put((func, args, kargs))
+        """Add a task to the queue and return a future for its result."""
+        return self._add_task(0, func, args, kargs)
+
+    def _add_task(self, priority, func, args, kargs):
+        future = TaskFuture()
+        with self._submit_lock:
+            if self._shutdown:
+                raise RuntimeError('Cannot add tasks after shutdown.')
+            with self._stats_lock:
+                self._stats['submitted'] += 1
+            self._put((future, func, args, kargs), priority)
+        return future
+
+    def map(self, func, *iterables, window=None):
+        """Return an iterator applying func to the items of the iterables.
+
+        Results are yielded in order while at most ``window`` tasks are in
+        flight, by default the pool's ``window``. The exception of a failed
+        task is raised when its result is reached, tasks not started yet
+        are cancelled if the iterator is not consumed.
+        """
+        window = window or self.window
+        pending = deque()
+        try:
+            for args in zip(*iterables):
+                if len(pending) >= window:
+                    yield pending.popleft().result()
+                pending.append(self.add_task(func, *args))
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def imap_unordered(self, func, iterable, window=None):
+        """Return an iterator applying func to the items of the iterable.
+
+        Like ``map``, but results are yielded as soon as they are done.
+        """
+        window = window or self.window
+        done = Queue()
+        pending = set()
+        try:
+            for item in iterable:
+                if len(pending) >= window:
+                    yield self._next_done(done, pending).result()
+                future = self.add_task(func, item)
+                pending.add(future)
+                future.add_done_callback(done.put)
+            while pending:
+                yield self._next_done(done, pending).result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def shutdown(self, wait=True, cancel_pending=False):
+        """Stop accepting tasks and stop the workers once the queue drained.
+
+        With ``cancel_pending`` queued tasks are cancelled instead of run.
+        With ``wait`` the call blocks until all workers have finished.
+        """
+        with self._submit_lock:
+            if not self._shutdown:
+                self._shutdown = True
+                if cancel_pending:
+                    self._cancel_queued()
+                self._stop_workers()
+        if wait:
+            self._join_workers()
+
+    def stats(self):
+        """Return the task counters and timings as ``PoolStats``."""
+        with self._stats_lock:
+            return PoolStats(**self._stats)
+
+    def is_empty(self):
+        """Return whether no tasks are queued."""
+        return self.tasks.empty()
+
+    def _put(self, task, priority):
+        self.tasks.put(task)
+
+    def _next_done(self, done, pending):
+        while True:
+            future = done.get()
+            if future in pending:
+                pending.remove(future)
+                return future
+
+    def _cancel_queued(self):
+        while True:
+            try:
+                future = self.tasks.get_nowait()[0]
+            except Empty:
+                return
+            if future.cancel():
+                self._record_cancelled()
+            self.tasks.task_done()
+
+    def _record(self, future, failed):
+        wait_time = future.wait_time
+        run_time = future.run_time
+        with self._stats_lock:
+            stats = self._stats
+            stats['failed' if failed else 'completed'] += 1
+            stats['wait_time'] += wait_time
+            stats['run_time'] += run_time
+            stats['max_wait_time'] = max(stats['max_wait_time'], wait_time)
+            stats['max_run_time'] = max(stats['max_run_time'], run_time)
+
+    def _record_cancelled(self):
+        with self._stats_lock:
+            self._stats['cancelled'] += 1
+
+
+class ThreadPool(_TaskPool):
+    """Pool of threads consuming tasks from a queue.
+
+    ``add_task`` returns a ``TaskFuture`` for the result of the task. It
+    only blocks if ``max_pending`` tasks are already queued, by default the
+    queue is unbounded. ``map`` and ``imap_unordered`` submit tasks lazily
+    and keep a bounded window of them in flight, by default twice the
+    number of threads, so iterables of any length are processed in constant
+    memory. Use ``shutdown`` or a with-statement to drain the queue and
+    stop the threads.
+    """
+
+    def __init__(self, num_threads, max_pending=0):
+        """Construct a new pool and start its threads."""
+        super().__init__(2 * num_threads)
+        self.tasks = Queue(max_pending)
+        self.num_threads = num_threads
+        self.workers = [Worker(self.tasks, self) for _ in range(num_threads)]
 
     def wait_completion(self):
-        """Wait for completion of all the tasks in the queue"""
+        """Wait for completion of all the tasks in the queue."""
         self.tasks.join()
 
+    def _stop_workers(self):
+        for _ in self.workers:
+            self.tasks.put(_SHUTDOWN)
+
+    def _join_workers(self):
+        for worker in self.workers:
+            worker.join()
+
+
+class WorkStealingPool(_TaskPool):
+    """Pool of threads with one task deque per thread and work stealing.
+
+    Tasks added from outside the pool are spread round-robin over the
+    deques, tasks added by a running task go to the deque of its thread.
+    Threads take tasks from the front of their own deque and steal from
+    the back of the others when it is empty, so there is no single queue
+    lock to contend on and a thread stuck on a long task does not hold up
+    the tasks lined up behind it. Tasks added with ``add_priority_task``
+    run before all tasks with a higher priority value, like in
+    ``queue.PriorityQueue``; ``add_task`` uses priority 0. Otherwise the
+    interface is the one of ``ThreadPool``.
+    """
+
+    def __init__(self, num_threads):
+        """Construct a new pool and start its threads."""
+        super().__init__(2 * num_threads)
+        self.num_threads = num_threads
+        self._deques = {}
+        self._priorities = []
+        self._targets = count()
+        self._local = local()
+        self._sleepers = 0
+        self._wakeup = Condition()
+        # completions are counted per thread and additions under the submit
+        # lock, so running tasks takes no shared lock
+        self._added = 0
+        self._cancelled = 0
+        self._finished = [0] * num_threads
+        self._waiters = 0
+        self._idle = Condition()
+        self.workers = [Thread(target=self._work, args=(index,), daemon=True)
+                        for index in range(num_threads)]
+        for worker in self.workers:
+            worker.start()
+
+    def add_priority_task(self, priority, func, *args, **kargs):
+        """Add a task with a priority and return a future for its result."""
+        return self._add_task(priority, func, args, kargs)
+
+    def wait_completion(self):
+        """Wait for completion of all the tasks added so far."""
+        with self._idle:
+            self._waiters += 1
+            try:
+                self._idle.wait_for(lambda: not self._outstanding())
+            finally:
+                self._waiters -= 1
+
     def is_empty(self):
-        return self.tasks.empty()
+        """Return whether no tasks are queued."""
+        return not any(any(deques) for deques in self._deques.values())
+
+    def _put(self, task, priority):
+        deques = self._deques.get(priority)
+        if deques is None:
+            deques = [deque() for _ in range(self.num_threads)]
+            self._deques[priority] = deques
+            self._priorities = sorted(self._deques)
+        index = getattr(self._local, 'index', None)
+        if index is None:
+            index = next(self._targets) % self.num_threads
+        self._added += 1
+        deques[index].append(task)
+        if self._sleepers:
+            with self._wakeup:
+                self._wakeup.notify()
+
+    def _work(self, index):
+        self._local.index = index
+        while True:
+            task = self._next_task(index)
+            if task is None:
+                task = self._wait_for_task(index)
+                if task is None:
+                    return
+            _run_task(self, *task)
+            self._finished[index] += 1
+            self._notify_idle()
+
+    def _next_task(self, index):
+        size = self.num_threads
+        for priority in self._priorities:
+            deques = self._deques[priority]
+            if deques[index]:
+                try:
+                    return deques[index].popleft()
+                except IndexError:
+                    pass  # stolen in the meantime
+            for offset in range(1, size):
+                victim = deques[(index + offset) % size]
+                if victim:
+                    try:
+                        return victim.pop()
+                    except IndexError:
+                        pass
+        return None
+
+    def _wait_for_task(self, index):
+        with self._wakeup:
+            # tasks are appended before _sleepers is read, so a task added
+            # after this check notifies the condition
+            self._sleepers += 1
+            try:
+                task = self._next_task(index)
+                while task is None and not self._shutdown:
+                    self._wakeup.wait()
+                    task = self._next_task(index)
+                return task
+            finally:
+                self._sleepers -= 1
+
+    def _outstanding(self):
+        return self._added - self._cancelled - sum(self._finished)
+
+    def _notify_idle(self):
+        # waiters register before checking, so the last task done sees them
+        if self._waiters and not self._outstanding():
+            with self._idle:
+                self._idle.notify_all()
+
+    def _cancel_queued(self):
+        for deques in self._deques.values():
+            for tasks in deques:
+                while tasks:
+                    try:
+                        future = tasks.popleft()[0]
+                    except IndexError:
+                        break
+                    if future.cancel():
+                        self._record_cancelled()
+                    self._cancelled += 1
+        self._notify_idle()
+
+    def _stop_workers(self):
+        with self._wakeup:
+            self._wakeup.notify_all()
+
+    def _join_workers(self):
+        for worker in self.workers:
+            worker.join()
+
+
+class ProcessPool(_TaskPool):
+    """Pool of processes running tasks, for CPU-bound work.
+
+    Offers the same interface as ``ThreadPool``, but functions, arguments
+    and results must be picklable. Queued tasks are sent to the processes
+    in chunks of up to ``chunk_size`` to reduce the per-task IPC overhead.
+    With ``shared_results`` NumPy arrays of at least
+    ``SHARED_RESULT_MIN_BYTES`` are returned through
+    ``multiprocessing.shared_memory`` instead of being pickled. With
+    ``max_tasks_per_child`` a process is replaced by a fresh one after
+    running that many tasks, to contain memory leaks of long-running jobs.
+    Tasks of a process dying unexpectedly fail with ``BrokenProcessPool``.
+    """
+
+    def __init__(self, num_processes=None, chunk_size=16,
+                 max_tasks_per_child=None, shared_results=False,
+                 max_pending=0, context=None):
+        """Construct a new pool and start its processes."""
+        self.num_processes = num_processes or get_cpus()
+        super().__init__(2 * self.num_processes * chunk_size)
+        self.tasks = Queue(max_pending)
+        self.chunk_size = chunk_size
+        self.max_tasks_per_child = max_tasks_per_child
+        self.shared_results = shared_results
+        if shared_results:
+            from multiprocessing import resource_tracker
+            # share one tracker with the workers instead of one per process
+            resource_tracker.ensure_running()
+        self._context = multiprocessing.get_context(context)
+        self._calls = self._context.Queue()
+        self._chunks = {}
+        self._chunk_slots = Semaphore(2 * self.num_processes)
+        self._running_chunks = {}
+        self._unfinished = 0
+        self._idle = Condition()
+        self._stopped = 0
+        self._worker_ids = count()
+        self.workers = {}
+        for _ in range(self.num_processes):
+            self._spawn_worker()
+        self._feeder = Thread(target=self._feed, daemon=True)
+        self._feeder.start()
+        self._collector = Thread(target=self._collect, daemon=True)
+        self._collector.start()
+
+    def add_task(self, func, *args, **kargs):
+        """Add a task to the queue and return a future for its result."""
+        with self._idle:
+            self._unfinished += 1
+        try:
+            future = super().add_task(func, *args, **kargs)
+        except BaseException:
+            self._task_done(None)
+            raise
+        future.add_done_callback(self._task_done)
+        return future
+
+    def wait_completion(self):
+        """Wait for completion of all the tasks added so far."""
+        with self._idle:
+            self._idle.wait_for(lambda: not self._unfinished)
+
+    def _task_done(self, _):
+        with self._idle:
+            self._unfinished -= 1
+            if not self._unfinished:
+                self._idle.notify_all()
+
+    def _stop_workers(self):
+        self.tasks.put(_SHUTDOWN)
+
+    def _join_workers(self):
+        self._feeder.join()
+        self._collector.join()
+
+    def _spawn_worker(self):
+        # one pipe per process, its messages are sent synchronously so
+        # nothing is lost if the process dies
+        reader, writer = self._context.Pipe(duplex=False)
+        process = self._context.Process(
+            target=_process_worker, daemon=True,
+            args=(self._calls, writer, self.max_tasks_per_child,
+                  self.shared_results))
+        process.start()
+        writer.close()
+        self.workers[next(self._worker_ids)] = (process, reader)
+
+    def _feed(self):
+        chunk_ids = count()
+        while True:
+            tasks = [self.tasks.get()]
+            while len(tasks) < self.chunk_size and tasks[-1] is not _SHUTDOWN:
+                try:
+                    tasks.append(self.tasks.get_nowait())
+                except Empty:
+                    break
+            stop = tasks[-1] is _SHUTDOWN
+            if stop:
+                tasks.pop()
+                self.tasks.task_done()
+            futures = []
+            calls = []
+            for future, func, args, kargs in tasks:
+                self.tasks.task_done()
+                if future.set_running_or_notify_cancel():
+                    futures.append(future)
+                    calls.append((func, args, kargs))
+                else:
+                    self._record_cancelled()
+            payload = self._dump_calls(futures, calls)
+            if futures:  # unless all of them failed to pickle
+                self._chunk_slots.acquire()
+                chunk_id = next(chunk_ids)
+                self._chunks[chunk_id] = futures
+                self._calls.put((chunk_id, payload))
+            if stop:
+                for _ in range(self.num_processes):
+                    self._calls.put(None)
+                return
+
+    def _dump_calls(self, futures, calls):
+        try:
+            return pickle.dumps(calls)
+        except Exception:
+            pass
+        # fail the unpicklable tasks only, in place
+        for index in reversed(range(len(calls))):
+            try:
+                pickle.dumps(calls[index])
+            except Exception as e:
+                future = futures.pop(index)
+                del calls[index]
+                future.started = future.finished = monotonic()
+                self._record(future, failed=True)
+                future.set_exception(e)
+        return pickle.dumps(calls)
+
+    def _collect(self):
+        while self._stopped < self.num_processes:
+            waitables = {}
+            for worker_id, (process, reader) in self.workers.items():
+                waitables[reader] = waitables[process.sentinel] = worker_id
+            for ready in wait(list(waitables)):
+                worker_id = waitables[ready]
+                if worker_id not in self.workers:
+                    continue
+                reader = self.workers[worker_id][1]
+                if ready is not reader:
+                    self._worker_exited(worker_id)
+                    continue
+                try:
+                    self._handle(worker_id, *reader.recv())
+                except EOFError:
+                    self._worker_exited(worker_id)
+
+    def _worker_exited(self, worker_id):
+        process, reader = self.workers[worker_id]
+        try:
+            while worker_id in self.workers and reader.poll():
+                self._handle(worker_id, *reader.recv())
+        except EOFError:
+            pass
+        if worker_id not in self.workers:
+            return  # stopped or retired regularly
+        self._remove_worker(worker_id)
+        chunk_id = self._running_chunks.pop(worker_id, None)
+        if chunk_id is not None:
+            error = BrokenProcessPool(
+                f'Process {process.pid} exited with {process.exitcode}')
+            for future in self._chunks.pop(chunk_id):
+                future.started = future.finished = monotonic()
+                self._record(future, failed=True)
+                future.set_exception(error)
+            self._chunk_slots.release()
+        self._spawn_worker()
+
+    def _handle(self, worker_id, kind, data):
+        if kind == 'start':
+            self._running_chunks[worker_id] = data
+        elif kind == 'done':
+            del self._running_chunks[worker_id]
+            self._finish_chunk(*data)
+        elif kind == 'retire':
+            self._remove_worker(worker_id)
+            self._spawn_worker()
+        else:
+            self._remove_worker(worker_id)
+            self._stopped += 1
+
+    def _remove_worker(self, worker_id):
+        process, reader = self.workers.pop(worker_id)
+        process.join()
+        reader.close()
+
+    def _finish_chunk(self, chunk_id, payload):
+        futures = self._chunks.pop(chunk_id)
+        self._chunk_slots.release()
+        for future, (ok, value, started, finished) in zip(
+                futures, pickle.loads(payload)):
+            future.started = started
+            future.finished = finished
+            if ok and isinstance(value, _SharedArray):
+                value = _load_shared_array(value)
+            self._record(future, failed=not ok)
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
 
 
 def get_cpus():
@@ -62,24 +618,238 @@ def sleep_job():
     sleep(timespan)
 
 
-def run_commands_from_file_parallel(filepath, suppress_stdout=True,
-                                    suppress_stderr=True):
-    """This method reads a text file holding one command per line and runs
-    these commands parallelised according to the available number of cpu's on
-    the current machine"""
+def get_load_average():
+    """Return the system load average of the last minute, 0 if unknown."""
+    try:
+        return os.getloadavg()[0]
+    except (AttributeError, OSError):
+        return 0.0
+
+
+def get_available_memory():
+    """Return the memory available for new processes in bytes or None."""
+    try:
+        with open('/proc/meminfo') as meminfo:
+            for line in meminfo:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def execute_command(command, suppress_stdout=True, suppress_stderr=True):
+    """Run a shell command, wait for it and return its return code."""
+    return subprocess.run(
+        command, shell=True,
+        stdout=subprocess.DEVNULL if suppress_stdout else None,
+        stderr=subprocess.DEVNULL if suppress_stderr else None).returncode
+
+
+def run_commands_from_file_parallel(
+        filepath, suppress_stdout=True, suppress_stderr=True,
+        max_workers=None, log_dir=None, journal=None, max_load=None,
+        min_free_memory=COMMAND_MIN_FREE_MEMORY):
+    """Run the shell commands of a text file holding one per line in parallel.
 
-    input_file_handle = open(filepath, 'r')
-    commands = []
-    for line in input_file_handle:
+    Commands are read lazily, blank lines and lines starting with ``#`` are
+    skipped. With ``log_dir`` the output of every command is written to
+    ``<line number>.out`` and ``.err`` files in there, otherwise it is
+    discarded or passed through depending on ``suppress_stdout`` and
+    ``suppress_stderr``. At most ``max_workers`` commands (by default the
+    number of cpus) run at once. Fewer are started while the load average,
+    plus the commands started too recently to show in it, would exceed
+    ``max_load`` (by default the number of cpus) or less than
+    ``min_free_memory`` bytes are available. With a ``journal`` file every
+    finished command is recorded, and commands that succeeded according to
+    it are skipped, so an interrupted run can simply be repeated. Returns
+    a ``CommandSummary``.
+    """
+    max_workers = max_workers or get_cpus()
+    max_load = get_cpus() if max_load is None else max_load
+    succeeded = _read_command_journal(journal) if journal else Counter()
+    summary = dict.fromkeys(CommandSummary._fields, 0)
+    running = {}
+    journal_file = open(journal, 'a') if journal else None
+    try:
+        with open(filepath, 'r') as commands:
+            pending = _iter_commands(commands)
+            command = next(pending, None)
+            while command is not None or running:
+                slots = _command_slots(running, max_workers, max_load,
+                                       min_free_memory)
+                while command is not None and slots > 0:
+                    number, line = command
+                    command = next(pending, None)
+                    if succeeded[line]:
+                        succeeded[line] -= 1
+                        summary['skipped'] += 1
+                        continue
+                    process = _start_command(line, number, log_dir,
+                                             suppress_stdout, suppress_stderr)
+                    running[process] = (number, line, monotonic())
+                    slots -= 1
+                finished = [process for process in running
+                            if process.poll() is not None]
+                if not finished:
+                    sleep(COMMAND_POLL_INTERVAL)
+                for process in finished:
+                    number, line, started = running.pop(process)
+                    key = 'succeeded' if process.returncode == 0 else 'failed'
+                    summary[key] += 1
+                    logging.debug('Command %d exited with %d: %s', number,
+                                  process.returncode, line)
+                    if journal_file is not None:
+                        journal_file.write(json.dumps({
+                            'line': number, 'command': line,
+                            'returncode': process.returncode,
+                            'duration': monotonic() - started}) + '\n')
+                        journal_file.flush()
+    finally:
+        if journal_file is not None:
+            journal_file.close()
+    return CommandSummary(**summary)
+
+
+def _iter_commands(lines):
+    for number, line in enumerate(lines, 1):
         line = line.strip()
-        commands.append(line)
-    print('File {0} contains {1} commands'.format(filepath, len(commands)))
-    cpus = get_cpus()
-    print('Machine has {0} cpus'.format(cpus))
-    pool = ThreadPool(cpus)
-    for command in commands:
-        print('Adding command \'{}\' to thread pool...'.format(command))
-        pool.add_task(execute_command, command, suppress_stdout,
-                      suppress_stderr)
-    print('Waiting for jobs to be completed')
-    pool.wait_completion()
+        if line and not line.startswith('#'):
+            yield number, line
+
+
+def _read_command_journal(journal):
+    succeeded = Counter()
+    try:
+        with open(journal, 'r') as records:
+            for record in records:
+                try:
+                    record = json.loads(record)
+                except ValueError:
+                    continue  # torn write of an interrupted run
+                if record['returncode'] == 0:
+                    succeeded[record['command']] += 1
+    except FileNotFoundError:
+        pass
+    return succeeded
+
+
+def _command_slots(running, max_workers, max_load, min_free_memory):
+    if not running:
+        return 1 if max_workers > 0 else 0
+    now = monotonic()
+    # the load average lags behind, count recent commands on top of it
+    recent = sum(now - started < LOAD_AVERAGE_WINDOW
+                 for _, _, started in running.values())
+    slots = min(max_workers - len(running),
+                int(max_load - get_load_average() - recent))
+    if slots > 0 and min_free_memory:
+        available = get_available_memory()
+        if available is not None and available < min_free_memory:
+            return 0
+    return slots
+
+
+def _start_command(command, number, log_dir, suppress_stdout,
+                   suppress_stderr):
+    if log_dir is None:
+        return subprocess.Popen(
+            command, shell=True,
+            stdout=subprocess.DEVNULL if suppress_stdout else None,
+            stderr=subprocess.DEVNULL if suppress_stderr else None)
+    base = path.join(log_dir, f'{number:06d}')
+    with open(base + '.out', 'wb') as stdout, \
+            open(base + '.err', 'wb') as stderr:
+        return subprocess.Popen(command, shell=True, stdout=stdout,
+                                stderr=stderr)
+
+
+def _run_task(pool, future, func, args, kargs):
+    if not future.set_running_or_notify_cancel():
+        if pool is not None:
+            pool._record_cancelled()
+        return
+    future.started = monotonic()
+    try:
+        result = func(*args, **kargs)
+    except BaseException as e:
+        future.finished = monotonic()
+        if pool is not None:
+            pool._record(future, failed=True)
+        future.set_exception(e)
+    else:
+        future.finished = monotonic()
+        if pool is not None:
+            pool._record(future, failed=False)
+        future.set_result(result)
+
+
+def _process_worker(calls, results, max_tasks, shared_results):
+    done = 0
+    while max_tasks is None or done < max_tasks:
+        chunk = calls.get()
+        if chunk is None:
+            results.send(('stop', None))
+            return
+        chunk_id, payload = chunk
+        results.send(('start', chunk_id))
+        outcomes = []
+        for func, args, kargs in pickle.loads(payload):
+            started = monotonic()
+            try:
+                value = func(*args, **kargs)
+                outcome = (True, _share_array(value) if shared_results
+                           else value)
+            except Exception as e:
+                outcome = (False, e)
+            outcomes.append(outcome + (started, monotonic()))
+        done += len(outcomes)
+        results.send(('done', (chunk_id, _dump_outcomes(outcomes))))
+    results.send(('retire', None))
+
+
+def _dump_outcomes(outcomes):
+    try:
+        return pickle.dumps(outcomes)
+    except Exception:
+        pass
+    for index, (_, value, started, finished) in enumerate(outcomes):
+        try:
+            pickle.dumps(value)
+        except Exception as e:
+            outcomes[index] = (False, e, started, finished)
+    return pickle.dumps(outcomes)
+
+
+def _share_array(value):
+    # the value can only be an array if numpy has been imported already
+    numpy = sys.modules.get('numpy')
+    if numpy is None or not isinstance(value, numpy.ndarray) \
+            or value.dtype.hasobject or value.nbytes < SHARED_RESULT_MIN_BYTES:
+        return value
+    from multiprocessing import resource_tracker, shared_memory
+    block = shared_memory.SharedMemory(create=True, size=value.nbytes)
+    view = numpy.ndarray(value.shape, value.dtype, block.buf)
+    view[...] = value
+    del view
+    # the parent process takes over the block and unlinks it
+    resource_tracker.unregister(block._name, 'shared_memory')
+    block.close()
+    return _SharedArray(block.name, value.shape, value.dtype.str)
+
+
+def _load_shared_array(shared):
+    import numpy
+    from multiprocessing import shared_memory
+    block = shared_memory.SharedMemory(shared.name)
+    try:
+        view = numpy.ndarray(shared.shape, shared.dtype, block.buf)
+        array = view.copy()
+        del view
+    finally:
+        block.close()
+        block.unlink()
+    return array
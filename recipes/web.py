@@ -1,9 +1,35 @@
 # -*- coding: utf-8 -*-
 """This module contains tools for web connectivity etc."""
 
+import re
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, suppress
+from http.client import HTTPConnection, HTTPException, HTTPSConnection
+from os import path, remove, replace
+from tempfile import mkstemp
+from threading import Lock
+from urllib.error import HTTPError
+from urllib.parse import urljoin, urlsplit
+
 DEFAULT_USER_AGENT = ('Mozilla/5.0 (X11; U; Linux i686) Gecko/20071127'
                       + ' Firefox/2.0.0.11')
 DEFAULT_ACCEPT = 'text/html'
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+"""Default chunk size in bytes used to stream downloads to disk."""
+DOWNLOAD_MIN_RANGE_SIZE = 8 * 1024 * 1024
+"""Minimum size in bytes of the ranges of a parallel download."""
+DOWNLOAD_PART_SUFFIX = '.part'
+"""Suffix of the file a download is written to until it is complete."""
+DOWNLOAD_VALIDATOR_SUFFIX = '.part-validator'
+"""Suffix of the file keeping the ETag or date of a partial download."""
+DOWNLOAD_TIMEOUT = 60
+"""Default socket timeout in seconds of pooled connections."""
+DOWNLOAD_MAX_IDLE = 8
+"""Default number of idle connections kept per host."""
+DOWNLOAD_MAX_REDIRECTS = 5
+"""Number of redirects followed before a request fails."""
+REDIRECT_STATUSES = frozenset([301, 302, 303, 307, 308])
+"""HTTP status codes of redirect responses."""
 
 
 def download_webpage_to_list(webpage_url, *header_tupels):
@@ -34,14 +60,261 @@ def download_webpage_to_list(webpage_url, *header_tupels):
     return webpage_url
 
 
-def download_file(file_url, target_filepath):
-    """Download a file url to a given target filepath."""
-    from bptbx import b_legacy
-    urllib2 = b_legacy.b_urllib2()
-    remote_file = urllib2.urlopen(file_url)
-    output = open(target_filepath, 'wb')
-    output.write(remote_file.read())
-    output.close()
+class ConnectionPool():
+    """Keep-alive HTTP connections that are reused per host."""
+
+    def __init__(self, max_idle=DOWNLOAD_MAX_IDLE, timeout=DOWNLOAD_TIMEOUT):
+        """Create a pool keeping up to max_idle idle connections per host."""
+        self.max_idle = max_idle
+        self.timeout = timeout
+        self._idle = {}
+        self._lock = Lock()
+
+    def __enter__(self):  # noqa: D105
+        return self
+
+    def __exit__(self, *_):  # noqa: D105
+        self.close()
+
+    @contextmanager
+    def open(self, url, headers=None, method='GET'):
+        """Send a request and yield the response, following redirects.
+
+        The connection goes back to the pool if the body was read
+        completely, otherwise it is closed.
+        """
+        redirects = 0
+        while True:
+            key, connection, response = self._request(method, url, headers)
+            location = response.getheader('Location')
+            if response.status not in REDIRECT_STATUSES or not location:
+                break
+            response.read()
+            self._release(key, connection, response)
+            if redirects == DOWNLOAD_MAX_REDIRECTS:
+                raise HTTPError(url, response.status, 'Too many redirects',
+                                response.headers, None)
+            redirects += 1
+            url = urljoin(url, location)
+        try:
+            yield response
+        finally:
+            self._release(key, connection, response)
+
+    def close(self):
+        """Close all idle connections."""
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for connection in connections:
+                connection.close()
+
+    def _request(self, method, url, headers):
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https'):
+            raise ValueError(f'Unsupported URL "{url}".')
+        key = (parts.scheme, parts.netloc)
+        target = parts.path or '/'
+        if parts.query:
+            target += '?' + parts.query
+        headers = {'User-Agent': DEFAULT_USER_AGENT, **(headers or {})}
+        with self._lock:
+            connections = self._idle.get(key)
+            connection = connections.pop() if connections else None
+        if connection is not None:
+            try:
+                connection.request(method, target, headers=headers)
+                return key, connection, connection.getresponse()
+            except (ConnectionError, HTTPException):
+                # the server dropped the idle connection, use a fresh one
+                connection.close()
+        connection_class = (HTTPSConnection if parts.scheme == 'https'
+                            else HTTPConnection)
+        connection = connection_class(parts.netloc, timeout=self.timeout)
+        try:
+            connection.request(method, target, headers=headers)
+            return key, connection, connection.getresponse()
+        except BaseException:
+            connection.close()
+            raise
+
+    def _release(self, key, connection, response):
+        if not response.isclosed() or response.will_close:
+            connection.close()
+            return
+        with self._lock:
+            connections = self._idle.setdefault(key, [])
+            if len(connections) < self.max_idle:
+                connections.append(connection)
+                return
+        connection.close()
+
+
+_DEFAULT_POOL = ConnectionPool()
+
+
+def download_file(file_url, target_filepath, chunk_size=DOWNLOAD_CHUNK_SIZE,
+                  connections=1, resume=True, pool=None):
+    """Download a file url to a given target filepath.
+
+    The body is streamed to disk in chunks. With a single connection it is
+    written to a ``.part`` file next to the target that later calls resume
+    with a range request. The ETag or Last-Modified date of the file is
+    stored next to it and sent as ``If-Range``, so a partial download of an
+    older version of the file is started over. With several connections
+    the file is fetched in parallel ranges if the server supports them.
+    The target is replaced atomically once the download is complete.
+    Returns the file size.
+    """
+    pool = pool or _DEFAULT_POOL
+    target_filepath = path.abspath(target_filepath)
+    if connections > 1:
+        size, validator = _ranged_size(pool, file_url)
+        if size is not None and size >= 2 * DOWNLOAD_MIN_RANGE_SIZE:
+            return _download_ranges(pool, file_url, target_filepath, size,
+                                    validator, chunk_size, connections)
+    part_path = target_filepath + DOWNLOAD_PART_SUFFIX
+    validator_path = target_filepath + DOWNLOAD_VALIDATOR_SUFFIX
+    validator = _read_validator(validator_path) if resume else None
+    offset = path.getsize(part_path) if (
+        validator and path.isfile(part_path)) else 0
+    while True:  # runs twice at most, the second time without a range
+        headers = ({'Range': f'bytes={offset}-', 'If-Range': validator}
+                   if offset else {})
+        with pool.open(file_url, headers) as response:
+            if offset and not _resume_matches(response, offset, validator):
+                offset = 0  # the partial download is stale, start over
+                continue
+            if response.status == 416:
+                response.read()  # the partial download is already complete
+                break
+            _check_status(file_url, response, (200, 206))
+            if response.status == 200:
+                offset = 0
+                _write_validator(validator_path, _validator(response))
+            expected = response.getheader('Content-Length')
+            with open(part_path, 'r+b' if offset else 'wb') as handle:
+                handle.seek(offset)
+                written = _copy_chunks(response, handle, chunk_size)
+            if expected is not None and written != int(expected):
+                raise OSError(f'Incomplete download of {file_url}: got '
+                              + f'{written} of {expected} bytes.')
+        break
+    replace(part_path, target_filepath)
+    _write_validator(validator_path, None)
+    return path.getsize(target_filepath)
+
+
+def _download_ranges(pool, file_url, target_filepath, size, validator,
+                     chunk_size, connections):
+    count = min(connections, size // DOWNLOAD_MIN_RANGE_SIZE)
+    bounds = [size * index // count for index in range(count + 1)]
+    handle, tmp_path = mkstemp(suffix=DOWNLOAD_PART_SUFFIX,
+                               dir=path.dirname(target_filepath))
+    try:
+        with open(handle, 'wb') as tmp_file:
+            tmp_file.truncate(size)
+        with ThreadPoolExecutor(count) as executor:
+            futures = [executor.submit(
+                _download_range, pool, file_url, tmp_path, start, end - 1,
+                validator, chunk_size)
+                for start, end in zip(bounds, bounds[1:])]
+            for future in futures:
+                future.result()
+        replace(tmp_path, target_filepath)
+    except BaseException:
+        with suppress(OSError):
+            remove(tmp_path)
+        raise
+    return size
+
+
+def _download_range(pool, file_url, file_path, first, last, validator,
+                    chunk_size):
+    headers = {'Range': f'bytes={first}-{last}'}
+    if validator:
+        headers['If-Range'] = validator
+    with pool.open(file_url, headers) as response, \
+            open(file_path, 'r+b') as handle:
+        _check_status(file_url, response, (206,))
+        if not _resume_matches(response, first, validator):
+            raise OSError(f'{file_url} changed during the download.')
+        handle.seek(first)
+        written = _copy_chunks(response, handle, chunk_size)
+    if written != last - first + 1:
+        raise OSError(f'Incomplete range {first}-{last} of {file_url}: got '
+                      + f'{written} bytes.')
+
+
+def _ranged_size(pool, file_url):
+    """Return the size and validator if the server serves byte ranges."""
+    with pool.open(file_url, {'Range': 'bytes=0-0'}) as response:
+        response.read()
+        if response.status != 206:
+            return None, None
+        return _content_range_size(response), _validator(response)
+
+
+def _resume_matches(response, offset, validator):
+    """Return whether the response to a range request fits the part file."""
+    if response.status == 416:
+        return _content_range_size(response) == offset
+    if response.status != 206:
+        return True
+    start = _CONTENT_RANGE_START.match(
+        response.getheader('Content-Range') or '')
+    if start is None or int(start.group(1)) != offset:
+        return False
+    current = _validator(response)
+    return current is None or current == validator
+
+
+_CONTENT_RANGE_START = re.compile(r'bytes (\d+)-')
+
+
+def _content_range_size(response):
+    total = (response.getheader('Content-Range') or '').rpartition('/')[2]
+    return int(total) if total.isdigit() else None
+
+
+def _validator(response):
+    """Return the strong ETag or else the Last-Modified date if any."""
+    etag = response.getheader('ETag')
+    if etag and not etag.startswith('W/'):
+        return etag
+    return response.getheader('Last-Modified')
+
+
+def _read_validator(validator_path):
+    try:
+        with open(validator_path) as handle:
+            return handle.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def _write_validator(validator_path, validator):
+    if validator is None:
+        with suppress(FileNotFoundError):
+            remove(validator_path)
+        return
+    with open(validator_path, 'w') as handle:
+        handle.write(validator)
+
+
+def _copy_chunks(response, handle, chunk_size):
+    written = 0
+    for chunk in iter(lambda: response.read(chunk_size), b''):
+        handle.write(chunk)
+        written += len(chunk)
+    return written
+
+
+def _check_status(url, response, statuses):
+    if response.status not in statuses:
+        response.read()
+        raise HTTPError(url, response.status, response.reason,
+                        response.headers, None)
 
 
 def recursively_download_ftp(host, username, password, ftp_root_path,
@@ -35,7 +35,7 @@ setup(
         'Programming Language :: Python :: 3.8'
     ],
     # Package configuration
-    packages=find_packages(exclude=('tests',)),
+    packages=find_packages(exclude=('tests', 'benchmarks')),
     include_package_data=True,
     python_requires='>= 3.6',
     install_requires=[],
@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+"""Test suite for the extendable daemon."""
+
+import asyncio
+from datetime import datetime
+from threading import Lock
+from time import monotonic, sleep
+from unittest import TestCase
+
+from recipes import daemon
+
+
+class SleepDaemon(daemon.Daemon):
+    """Daemon whose ticks sleep for a given duration."""
+
+    def __init__(self, interval, duration, **kwargs):
+        """Construct a new daemon with ticks of the given duration."""
+        super().__init__(interval, **kwargs)
+        self.duration = duration
+        self.starts = []
+        self.concurrent = 0
+        self.max_concurrent = 0
+        self.lock = Lock()
+
+    def _run_daemon_process(self):
+        with self.lock:
+            self.starts.append(monotonic())
+            self.concurrent += 1
+            self.max_concurrent = max(self.max_concurrent, self.concurrent)
+        sleep(self.duration)
+        with self.lock:
+            self.concurrent -= 1
+
+
+class PollDaemon(daemon.AsyncDaemon):
+    """Asynchronous daemon whose ticks sleep for a given duration."""
+
+    def __init__(self, interval, duration, **kwargs):
+        """Construct a new daemon with ticks of the given duration."""
+        super().__init__(interval, **kwargs)
+        self.duration = duration
+        self.count = 0
+
+    async def _run_daemon_process(self):
+        self.count += 1
+        await asyncio.sleep(self.duration)
+
+
+class TestSuite(TestCase):  # noqa: D101
+
+    def run_daemon(self, runtime, *args, **kwargs):
+        """Run a SleepDaemon for the given time and return it."""
+        instance = SleepDaemon(*args, **kwargs)
+        instance.start()
+        sleep(runtime)
+        instance.stop()
+        return instance
+
+    def test_schedule_does_not_drift(self):
+        """Test that ticks follow their deadlines despite their runtime."""
+        instance = self.run_daemon(0.48, 0.1, 0.05)
+        self.assertEqual(len(instance.starts), 5)
+        # the 5th tick would start after 0.6s if every tick added 0.05s
+        self.assertLess(instance.starts[-1] - instance.starts[0], 0.45)
+        metrics = instance.metrics()
+        self.assertEqual((metrics.ticks, metrics.skipped), (5, 0))
+        self.assertLess(metrics.max_lag, 0.05)
+        self.assertGreaterEqual(metrics.mean_latency, 0.05)
+
+    def test_overrun_policies(self):
+        """Test skipping, queueing and coalescing of overrun ticks."""
+        skipping = self.run_daemon(0.5, 0.05, 0.12)
+        self.assertGreater(skipping.metrics().skipped, 3)
+        self.assertEqual(skipping.max_concurrent, 1)
+        queueing = self.run_daemon(0.5, 0.05, 0.12, overrun='queue')
+        self.assertEqual(queueing.metrics().skipped, 0)
+        self.assertGreater(queueing.metrics().max_lag, 0.1)
+        coalescing = self.run_daemon(0.5, 0.05, 0.12, overrun='coalesce')
+        metrics = coalescing.metrics()
+        self.assertGreater(metrics.coalesced, 0)
+        self.assertLess(metrics.max_lag, 0.25)
+        parallel = self.run_daemon(0.5, 0.05, 0.12, max_workers=3)
+        self.assertEqual(parallel.metrics().skipped, 0)
+        self.assertEqual(parallel.max_concurrent, 3)
+        # a full backlog drops its oldest tick instead of growing
+        bounded = self.run_daemon(0.5, 0.02, 0.3, overrun='queue',
+                                  max_backlog=2)
+        metrics = bounded.metrics()
+        self.assertGreater(metrics.skipped, 5)
+        self.assertLess(metrics.max_lag, 0.3)
+        with self.assertRaises(ValueError):
+            daemon.Daemon(1, overrun='drop')
+        with self.assertRaises(ValueError):
+            daemon.Daemon(1, overrun='queue', max_backlog=0)
+
+    def test_stop_wakes_up(self):
+        """Test that stop does not wait for the next deadline."""
+        instance = SleepDaemon(60, 0)
+        instance.start()
+        sleep(0.05)
+        start = monotonic()
+        instance.stop()
+        self.assertLess(monotonic() - start, 1)
+        self.assertTrue(instance.stopped)
+        self.assertEqual(len(instance.starts), 1)
+
+    def test_stopped_attribute(self):
+        """Test that subclasses can stop the daemon by setting stopped."""
+        class CountdownDaemon(SleepDaemon):
+            def _run_daemon_process(self):
+                super()._run_daemon_process()
+                if len(self.starts) == 2:
+                    self.stopped = True
+
+        instance = CountdownDaemon(0.01, 0)
+        self.assertFalse(instance.stopped)
+        instance.stopped = True
+        self.assertTrue(instance.stopped)
+        instance.stopped = False
+        self.assertFalse(instance.stopped)
+        instance.start()
+        instance.main_thread.join(1)
+        self.assertFalse(instance.main_thread.is_alive())
+        instance.stop()
+        self.assertEqual(len(instance.starts), 2)
+
+    def test_single_run(self):
+        """Test that a non-positive interval runs a single tick."""
+        instance = self.run_daemon(0.1, 0, 0.01)
+        self.assertEqual(len(instance.starts), 1)
+        self.assertEqual(instance.metrics().ticks, 1)
+
+    def test_cron_spec(self):
+        """Test finding the next match of cron-like specs."""
+        start = datetime(2021, 3, 1, 10, 7, 30)
+        for spec, expected in [
+                ('*/15 * * * *', datetime(2021, 3, 1, 10, 15)),
+                ('@hourly', datetime(2021, 3, 1, 11, 0)),
+                ('0 0 29 2 *', datetime(2024, 2, 29)),
+                ('30 9 * * 6,0', datetime(2021, 3, 6, 9, 30)),
+                ('0 0 13 * 5', datetime(2021, 3, 5)),  # Friday or 13th
+                ('5-10/5 10 1 3 1-5', datetime(2021, 3, 1, 10, 10))]:
+            self.assertEqual(daemon.CronSpec(spec).next_after(start),
+                             expected, spec)
+        for spec in ['* * * *', '60 * * * *', '0 0 31 2 *']:
+            with self.assertRaises(ValueError):
+                daemon.CronSpec(spec).next_after(start)
+
+    def test_daemon_host(self):
+        """Test running many jobs and daemons from a single host."""
+        host = daemon.DaemonHost(max_workers=4)
+        counts = [0] * 50
+        jobs = [host.add_job(lambda index=index: counts.__setitem__(
+            index, counts[index] + 1), interval=0.1) for index in range(50)]
+        slow = SleepDaemon(0.05, 0.12)
+        slow_job = host.add_job(slow, overrun='coalesce')
+        cancelled = host.add_job(print, interval=0.1)
+        cancelled.cancel()
+        host.add_job(print, cron='0 0 1 1 *')
+        host.start()
+        sleep(0.45)
+        host.stop()
+        self.assertTrue(all(4 <= count <= 5 for count in counts), counts)
+        self.assertEqual(jobs[0].metrics().ticks, counts[0])
+        self.assertLess(jobs[0].metrics().max_lag, 0.1)
+        self.assertEqual(slow.max_concurrent, 1)
+        self.assertGreater(slow_job.metrics().coalesced, 0)
+        self.assertEqual(cancelled.metrics().ticks, 0)
+        self.assertNotIn(cancelled, host.jobs)
+        with self.assertRaises(ValueError):
+            host.add_job(print)
+
+    def test_async_daemons_in_one_loop(self):
+        """Test hosting many asynchronous daemons in a single event loop."""
+        async def run_daemons():
+            daemons = [PollDaemon(0.05, 0.01) for _ in range(1000)]
+            tasks = [asyncio.ensure_future(instance.run())
+                     for instance in daemons]
+            await asyncio.sleep(0.27)
+            for instance in daemons:
+                instance.request_stop()
+            await asyncio.gather(*tasks)
+            return daemons
+
+        daemons = asyncio.run(run_daemons())
+        counts = {instance.count for instance in daemons}
+        self.assertTrue(counts <= {5, 6}, counts)
+        self.assertEqual(daemons[0].metrics().ticks, daemons[0].count)
+
+    def test_async_daemon_timeout_and_cancel(self):
+        """Test timeouts of ticks and cancelling them on stop."""
+        timing_out = PollDaemon(0.1, 10, timeout=0.05)
+        timing_out.start()
+        sleep(0.25)
+        start = monotonic()
+        timing_out.stop()
+        self.assertLess(monotonic() - start, 0.2)
+        metrics = timing_out.metrics()
+        self.assertEqual((metrics.ticks, metrics.failed), (0, 3))
+        self.assertLess(metrics.max_latency, 0.1)
+        hanging = PollDaemon(0.1, 10)
+        hanging.start()
+        sleep(0.05)
+        start = monotonic()
+        hanging.stop(cancel=True)
+        self.assertLess(monotonic() - start, 1)
+        self.assertEqual(hanging.metrics().failed, 1)
+
+    def test_async_daemon_sync_process(self):
+        """Test running a blocking process in the executor of the loop."""
+        class BlockingDaemon(daemon.AsyncDaemon):
+            count = 0
+
+            def _run_daemon_process(self):
+                sleep(0.01)
+                self.count += 1
+
+        instance = BlockingDaemon(0)
+        instance.start()
+        instance.stop()
+        self.assertEqual(instance.count, 1)
+
+    def test_async_daemon_sync_process_timeout(self):
+        """Test that timed out blocking processes keep their slot."""
+        class HangingDaemon(daemon.AsyncDaemon):
+            concurrent = 0
+            max_concurrent_threads = 0
+            lock = Lock()
+
+            def _run_daemon_process(self):
+                with self.lock:
+                    self.concurrent += 1
+                    self.max_concurrent_threads = max(
+                        self.max_concurrent_threads, self.concurrent)
+                sleep(0.2)
+                with self.lock:
+                    self.concurrent -= 1
+
+        instance = HangingDaemon(0.05, timeout=0.05)
+        instance.start()
+        sleep(0.5)
+        instance.stop()
+        self.assertEqual(instance.max_concurrent_threads, 1)
+        metrics = instance.metrics()
+        self.assertGreaterEqual(metrics.failed, 2)
+        self.assertGreater(metrics.skipped, 0)
+        self.assertGreaterEqual(metrics.max_latency, 0.2)
+
+    def test_async_daemon_stop_after_run(self):
+        """Test stopping daemons whose run has already returned."""
+        single_run = PollDaemon(0, 0)
+        single_run.start()
+        single_run.main_thread.join()
+        single_run.stop()
+        self.assertEqual(single_run.count, 1)
+        requested = PollDaemon(0.05, 0)
+
+        async def run_and_stop():
+            requested.start(asyncio.get_running_loop())
+            await asyncio.sleep(0.01)
+            requested.request_stop()
+            await asyncio.sleep(0.01)
+
+        asyncio.run(run_and_stop())
+        requested.stop()
+        self.assertTrue(requested.stopped)
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""Test suite for the date/time conversion tools."""
+
+import os
+import time
+from datetime import datetime, timedelta
+from random import Random
+from unittest import TestCase
+from unittest.mock import patch
+
+from recipes import date_tools
+
+
+class TestSuite(TestCase):  # noqa: D101
+
+    def setUp(self):  # noqa: D102
+        # Use a timezone with daylight saving time to cover transitions
+        environ = patch.dict(os.environ, {'TZ': 'Europe/Berlin'})
+        environ.start()
+        time.tzset()
+        self.addCleanup(time.tzset)
+        self.addCleanup(environ.stop)
+        # 2020-03-29 01:59:59 CET is followed by 03:00:00 CEST
+        self.epochs = [1585443599.25, 1585443600, 1585443600.5, 0.000001,
+                       1600000000.999999, 1585443600]
+
+    def test_batch_conversions(self):
+        """Test that batch conversions match the scalar functions."""
+        timestamps = [date_tools.epoch_to_timestamp(epoch)
+                      for epoch in self.epochs]
+        epochs = [date_tools.timestamp_to_epoch(timestamp)
+                  for timestamp in timestamps]
+        dtos = [date_tools.epoch_to_dto(epoch) for epoch in self.epochs]
+        for numpy in [None, date_tools._import_numpy()]:
+            with patch.object(date_tools, '_import_numpy', lambda: numpy):
+                self.assertEqual(
+                    date_tools.epochs_to_timestamps(self.epochs), timestamps)
+                self.assertEqual(
+                    date_tools.timestamps_to_epochs(timestamps), epochs)
+                self.assertEqual(
+                    date_tools.timestamps_to_epochs(iter(timestamps)), epochs)
+        self.assertEqual(date_tools.dtos_to_epochs(dtos), epochs)
+        self.assertEqual(date_tools.epochs_to_timestamps(
+            self.epochs[:2], '%d.%m.%Y %H:%M'),
+            ['29.03.2020 01:59', '29.03.2020 03:00'])
+
+    def test_batch_conversions_random(self):
+        """Test batch conversions of random epochs against the scalar one."""
+        random = Random(13)
+        epochs = [random.uniform(-3e9, 2.5e9) for _ in range(5000)]
+        # Amsterdam used local mean time with a +00:19:32 offset until 1937
+        for zone in ['Europe/Berlin', 'Europe/Amsterdam']:
+            with patch.dict(os.environ, {'TZ': zone}):
+                time.tzset()
+                timestamps = [date_tools.epoch_to_timestamp(epoch)
+                              for epoch in epochs]
+                for numpy in [None, date_tools._import_numpy()]:
+                    with patch.object(date_tools, '_import_numpy',
+                                      lambda: numpy):
+                        self.assertEqual(
+                            date_tools.epochs_to_timestamps(epochs),
+                            timestamps)
+
+    def test_compile_timestamp_parser(self):
+        """Test that compiled parsers behave like strptime."""
+        cases = [
+            (date_tools.DEFAULT_CONVERT_FORMAT, '2020-01-02 03:04:05.123456'),
+            (date_tools.DEFAULT_CONVERT_FORMAT, '2020-01-02 03:04:05.5'),
+            (date_tools.DEFAULT_CONVERT_FORMAT, '2020-1-2 3:04:05.5'),
+            (date_tools.DEFAULT_CONVERT_FORMAT, '2020-02-30 03:04:05.1'),
+            (date_tools.DEFAULT_CONVERT_FORMAT, '2020-01-02 03:04:05,123456'),
+            ('%d.%m.%Y %H:%M', '24.12.2019 18:30'),
+            ('%Y%m%d%%', '20191224%'),
+            ('%Y%m%d%%', '20191224'),
+            ('%b %d', 'Dec 24'),
+        ]
+        for formatstring, timestamp in cases:
+            parse = date_tools.compile_timestamp_parser(formatstring)
+            try:
+                expected = datetime.strptime(timestamp, formatstring)
+            except ValueError:
+                with self.assertRaises(ValueError):
+                    parse(timestamp)
+                continue
+            self.assertEqual(parse(timestamp), expected)
+        self.assertIs(date_tools.compile_timestamp_parser('%Y'),
+                      date_tools.compile_timestamp_parser('%Y'))
+
+    def test_interval_range(self):
+        """Test lazy intervals, their length and random access."""
+        intervals = date_tools.get_intervals_for_dtos(
+            datetime(2020, 1, 31), datetime(2020, 5, 1), 'month')
+        self.assertEqual(len(intervals), 4)
+        self.assertEqual(intervals[1][:2], (datetime(2020, 2, 29),
+                                            datetime(2020, 3, 30, 23, 59, 59)))
+        self.assertEqual(intervals[3][3], '2020-05-30 23:59:59.000000')
+        hours = date_tools.IntervalRange(
+            datetime(2000, 1, 1), datetime(2020, 1, 1, 0, 30), 'hour', None)
+        self.assertEqual(len(hours), 175321)
+        self.assertEqual(hours[-1], (datetime(2020, 1, 1),
+                                     datetime(2020, 1, 1, 0, 59, 59)))
+        self.assertEqual(list(hours)[1234], hours[1234])
+        self.assertEqual(hours[1234][0], datetime(2000, 1, 1)
+                         + timedelta(hours=1234))
+        with self.assertRaises(IndexError):
+            hours[len(hours)]
+        with self.assertRaises(ValueError):
+            date_tools.IntervalRange(datetime(2000, 1, 1), None, 'decade')
+
+    def test_interval_index(self):
+        """Test bucket lookups for uniform and non-uniform intervals."""
+        start = date_tools.timestamp_to_epoch('2020-03-28 00:00:00.0')
+        end = date_tools.timestamp_to_epoch('2020-03-31 00:00:00.0')
+        epochs = [start - 1, start, start + 86399.5, start + 86400,
+                  end - 1, end, start + 100000]
+        for numpy in [None, date_tools._import_numpy()]:
+            with patch.object(date_tools, '_import_numpy', lambda: numpy):
+                # daily intervals are not uniform across the DST switch
+                days = date_tools.IntervalIndex(
+                    date_tools.get_intervals_for_epochs(start, end, 'day'))
+                self.assertIsNone(days.width)
+                self.assertEqual(days.lookup(epochs),
+                                 [-1, 0, 0, 1, 2, -1, 1])
+                self.assertEqual(days.counts(epochs), [2, 2, 1])
+                self.assertEqual(days.sums(epochs, range(7)), [3, 9, 4])
+                self.assertEqual(days.aggregate(epochs, range(7), max),
+                                 [2, 6, 4])
+                hours = date_tools.IntervalIndex(date_tools.IntervalRange(
+                    datetime(2020, 1, 1), datetime(2020, 1, 2), 'hour'))
+                self.assertEqual(hours.width, 3600)
+                hour_epochs = [date_tools.dto_to_epoch(datetime(
+                    2020, 1, 1, hour)) + 1800 for hour in range(24)]
+                self.assertEqual(hours.lookup(iter(hour_epochs)),
+                                 list(range(24)))
+        numpy = date_tools._import_numpy()
+        if numpy is not None:
+            self.assertEqual(
+                days.counts(numpy.array(epochs)).tolist(), [2, 2, 1])
+            self.assertEqual(days.sums(numpy.array(epochs), numpy.arange(
+                7, dtype=numpy.int64) * 2**60).dtype, numpy.int64)
+
+    def test_interval_index_sum_types(self):
+        """Test that both sum implementations keep the type of values."""
+        days = date_tools.IntervalIndex(date_tools.get_intervals_for_epochs(
+            0, 3 * 86400, 'day'))
+        epochs = [0, 1, 86400, 2 * 86400 + 5, -1]
+        for values in [[1, 2, 3, 4, 5], [2**60, 1, 2, 3, 4],
+                       [0.5, 1.25, 2.0, 3.0, 4.0],
+                       [True, True, False, True, True]]:
+            results = []
+            for numpy in [None, date_tools._import_numpy()]:
+                with patch.object(date_tools, '_import_numpy', lambda: numpy):
+                    results.append(days.sums(epochs, values))
+            self.assertEqual(results[0], results[-1])
+            self.assertEqual([type(total) for total in results[0]],
+                             [type(total) for total in results[-1]])
+
+    def test_timezone_converter(self):
+        """Test conversions for an explicit zone independent of the host."""
+        converter = date_tools.TimezoneConverter('America/New_York')
+        self.assertIs(date_tools.get_timezone_converter('America/New_York'),
+                      date_tools.get_timezone_converter('America/New_York'))
+        # 2020-11-01 01:30 EDT is followed by 01:30 EST an hour later
+        ambiguous = datetime(2020, 11, 1, 1, 30)
+        self.assertEqual(converter.dto_to_epoch(ambiguous), 1604208600)
+        self.assertEqual(
+            converter.dto_to_epoch(ambiguous.replace(fold=1)), 1604212200)
+        # 2020-03-08 02:30 does not exist, fold=0 uses the EST offset
+        self.assertEqual(
+            converter.dto_to_epoch(datetime(2020, 3, 8, 2, 30)), 1583652600)
+        self.assertEqual(converter.utcoffset(1604212200), -18000)
+        dto = converter.epoch_to_dto(1604212200)
+        self.assertEqual((dto.hour, dto.minute, dto.fold), (1, 30, 1))
+        self.assertEqual(converter.epoch_to_timestamp(0),
+                         '1969-12-31 19:00:00.000000')
+        epochs = [1604208600, 1604212200, 1583652599, 1583652600, 0,
+                  1604208600.5, 1900000000]
+        for numpy in [None, date_tools._import_numpy()]:
+            with patch.object(date_tools, '_import_numpy', lambda: numpy):
+                timestamps = converter.epochs_to_timestamps(epochs)
+                self.assertEqual(timestamps, [
+                    converter.epoch_to_timestamp(epoch) for epoch in epochs])
+                # repeated wall times resolve to the earlier epoch
+                self.assertEqual(converter.timestamps_to_epochs(timestamps),
+                                 [1604208600, 1604208600, 1583652599,
+                                  1583652600, 0, 1604208600, 1900000000])
+        dtos = converter.epochs_to_dtos(epochs)
+        self.assertEqual(converter.dtos_to_epochs(
+            dto.replace(tzinfo=None) for dto in dtos),
+            [int(epoch) for epoch in epochs])
+        self.assertEqual(converter.dtos_to_epochs(dtos),
+                         [int(epoch) for epoch in epochs])
+
+    def test_timezone_converter_random(self):
+        """Test batch conversions of random epochs against scalar ones."""
+        random = Random(17)
+        epochs = [random.uniform(-3e9, 2.5e9) for _ in range(5000)]
+        for zone in ['America/New_York', 'Europe/Amsterdam']:
+            converter = date_tools.TimezoneConverter(zone)
+            timestamps = [converter.epoch_to_timestamp(epoch)
+                          for epoch in epochs]
+            self.assertEqual(timestamps, [
+                datetime.fromtimestamp(epoch, converter.zone).strftime(
+                    date_tools.DEFAULT_CONVERT_FORMAT) for epoch in epochs])
+            for numpy in [None, date_tools._import_numpy()]:
+                with patch.object(date_tools, '_import_numpy', lambda: numpy):
+                    self.assertEqual(converter.epochs_to_timestamps(epochs),
+                                     timestamps)
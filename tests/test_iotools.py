@@ -0,0 +1,383 @@
+# -*- coding: utf-8 -*-
+"""Test suite for the I/O tools."""
+
+import bz2
+import gzip
+import hashlib
+import lzma
+import zipfile
+from array import array
+from io import BytesIO
+from os import makedirs, path
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import patch
+
+from recipes import iotools
+
+
+class TestSuite(TestCase):  # noqa: D101
+
+    def setUp(self):  # noqa: D102
+        self.tmp_dir = TemporaryDirectory()
+        self.base_dir = self.tmp_dir.name
+        for sub_dir in ['a', path.join('a', 'b'), 'c']:
+            makedirs(path.join(self.base_dir, sub_dir))
+        for file_path in ['1.txt', '2.LOG', path.join('a', '3.txt'),
+                          path.join('a', 'b', '4.txt')]:
+            iotools.touch(path.join(self.base_dir, file_path))
+
+    def tearDown(self):  # noqa: D102
+        self.tmp_dir.cleanup()
+
+    def test_findfiles(self):
+        """Test recursive file search in sequential and parallel mode."""
+        expected = sorted(
+            path.join(self.base_dir, f) for f in
+            ['1.txt', '2.LOG', path.join('a', '3.txt'),
+             path.join('a', 'b', '4.txt')])
+        self.assertEqual(sorted(iotools.findfiles(self.base_dir)), expected)
+        self.assertEqual(
+            sorted(iotools.findfiles(self.base_dir, max_workers=4)), expected)
+        self.assertEqual(
+            len(iotools.findfiles(self.base_dir, r'.*\.TXT$')), 3)
+        self.assertEqual(
+            len(iotools.findfiles(self.base_dir, file_limit=2)), 2)
+
+    def test_finddirs(self):
+        """Test recursive directory search."""
+        expected = sorted(path.join(self.base_dir, d) for d in
+                          ['a', path.join('a', 'b'), 'c'])
+        self.assertEqual(sorted(iotools.finddirs(self.base_dir)), expected)
+        self.assertEqual(
+            sorted(iotools.finddirs(self.base_dir, max_workers=2)), expected)
+
+    def test_get_immediate_subfiles(self):
+        """Test listing of direct sub-files."""
+        self.assertEqual(iotools.get_immediate_subfiles(self.base_dir),
+                         ['1.txt', '2.LOG'])
+        self.assertEqual(
+            iotools.get_immediate_subfiles(self.base_dir, r'.*\.log'), [])
+        self.assertEqual(iotools.get_immediate_subfiles(
+            self.base_dir, r'.*\.log', ignorecase=True), ['2.LOG'])
+        with self.assertRaises(OSError):
+            iotools.get_immediate_subfiles(path.join(self.base_dir, 'x'))
+
+    def test_hash_tree(self):
+        """Test that the hash index only rehashes changed files."""
+        index_file = path.join(self.base_dir, 'c', 'index.db')
+        file_path = path.join(self.base_dir, '1.txt')
+        digests = iotools.hash_tree(self.base_dir, index_file, 'blake2b',
+                                    r'.*\.txt$', max_workers=2)
+        self.assertEqual(len(digests), 3)
+        self.assertEqual(digests[file_path], hashlib.blake2b().hexdigest())
+        with patch.object(iotools, 'filehash',
+                          wraps=iotools.filehash) as filehash:
+            self.assertEqual(iotools.hash_tree(
+                self.base_dir, index_file, 'blake2b', r'.*\.txt$',
+                max_workers=1), digests)
+            self.assertEqual(filehash.call_count, 0)
+            iotools.write_list_to_file(['modified'], file_path)
+            digests = iotools.hash_tree(self.base_dir, index_file, 'blake2b',
+                                        r'.*\.txt$', max_workers=1)
+            self.assertEqual([call.args[0] for call in filehash.mock_calls],
+                             [file_path])
+        self.assertEqual(digests[file_path],
+                         hashlib.blake2b(b'modified\n').hexdigest())
+        iotools.write_list_to_file(['changed'], file_path)
+        with iotools.HashIndex(index_file, 'blake2b') as index:
+            self.assertEqual(index.get(file_path),
+                             hashlib.blake2b(b'changed\n').hexdigest())
+        self.assertEqual(iotools.md5sum(file_path),
+                         hashlib.md5(b'changed\n').hexdigest())
+
+    def test_filehash_strategies(self):
+        """Test that all hashing strategies return identical digests."""
+        file_path = path.join(self.base_dir, 'data.bin')
+        content = bytes(range(256)) * 40
+        with open(file_path, 'wb') as file_handle:
+            file_handle.write(content)
+        expected = hashlib.sha256(content).hexdigest()
+        self.assertEqual(iotools.filehash(file_path, 'sha256'), expected)
+        self.assertEqual(
+            iotools.filehash(file_path, 'sha256', chunk_size=1000), expected)
+        with patch.object(iotools, 'HASH_MMAP_THRESHOLD', 4096):
+            self.assertEqual(iotools.filehash(
+                file_path, 'sha256', chunk_size=1000), expected)
+
+    def test_countlines(self):
+        """Test line counting with and without trailing newlines."""
+        files = {}
+        for name, content, lines in [('empty', b'', 0), ('one', b'a', 1),
+                                     ('trailing', b'a\nb\n' * 50, 100),
+                                     ('open', b'a\nb\n' * 50 + b'c', 101)]:
+            files[path.join(self.base_dir, name)] = lines
+            with open(path.join(self.base_dir, name), 'wb') as file_handle:
+                file_handle.write(content)
+        for file_path, lines in files.items():
+            self.assertEqual(iotools.countlines(file_path), lines)
+            self.assertEqual(iotools.countlines(
+                file_path, processes=3, chunk_size=7), lines)
+        self.assertEqual(iotools.countlines_many(files), files)
+
+    def test_iter_csv_chunks(self):
+        """Test chunked, projected and typed CSV streaming."""
+        csv_path = path.join(self.base_dir, 'data.csv')
+        iotools.write_list_to_file(
+            [f'{i};name {i};{i / 2};"x;y"' for i in range(25)], csv_path)
+        rows = iotools.read_csv_to_array(csv_path)
+        self.assertEqual(len(rows), 25)
+        self.assertEqual(rows[3], ['3', 'name 3', '1.5', 'x;y'])
+        chunks = list(iotools.iter_csv_chunks(
+            csv_path, chunk_size=10, columns=[2, 0],
+            converters={0: int, 2: float}))
+        self.assertEqual([len(chunk) for chunk in chunks], [10, 10, 5])
+        self.assertEqual(chunks[0][3], [1.5, 3])
+        chunks = list(iotools.iter_csv_chunks(
+            csv_path, chunk_size=10, columns=[0, 1], converters={0: int},
+            columnar='array'))
+        self.assertEqual(chunks[2][0], array('q', range(20, 25)))
+        self.assertEqual(chunks[2][1][0], 'name 20')
+
+    def test_iter_csv_chunks_blank_and_ragged(self):
+        """Test that blank lines are skipped and short rows are refused."""
+        csv_path = path.join(self.base_dir, 'data.csv')
+        with open(csv_path, 'w') as handle:
+            handle.write('1;a\n\n2;b\n')
+        chunks = list(iotools.iter_csv_chunks(
+            csv_path, converters={0: int}, columnar='array'))
+        self.assertEqual(chunks, [[array('q', [1, 2]), ['a', 'b']]])
+        chunks = list(iotools.iter_csv_chunks(csv_path, columns=[0]))
+        self.assertEqual(chunks, [[['1'], ['2']]])
+        self.assertEqual(next(iotools.iter_csv_chunks_parallel(
+            csv_path, processes=1, columns=[1])), [['a'], ['b']])
+        with open(csv_path, 'w') as handle:
+            handle.write('1;a\n2\n3;c\n')
+        with self.assertRaises(ValueError):
+            list(iotools.iter_csv_chunks(csv_path, columnar='array'))
+        with self.assertRaises(ValueError):
+            list(iotools.iter_csv_chunks(csv_path, columns=[1]))
+
+    def test_iter_csv_chunks_parallel(self):
+        """Test parallel CSV parsing with quoted newlines."""
+        csv_path = path.join(self.base_dir, 'data.csv')
+        iotools.write_list_to_file(
+            [f'{i};"multi\nline ""{i}""";end' for i in range(200)], csv_path)
+        expected = iotools.read_csv_to_array(csv_path)
+        self.assertEqual(expected[7], ['7', 'multi\nline "7"', 'end'])
+        chunks = list(iotools.iter_csv_chunks_parallel(
+            csv_path, processes=2, range_size=100))
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual([row for chunk in chunks for row in chunk], expected)
+        chunks = iotools.iter_csv_chunks_parallel(
+            csv_path, processes=2, range_size=100, ordered=False)
+        self.assertEqual(sorted(row for chunk in chunks for row in chunk),
+                         sorted(expected))
+        self.assertEqual(
+            iotools.read_csv_to_array(csv_path, processes=2), expected)
+        chunks = iotools.iter_csv_chunks_parallel(
+            csv_path, processes=2, range_size=100, columns=[0],
+            converters={0: int})
+        self.assertEqual([row for chunk in chunks for row in chunk],
+                         [[i] for i in range(200)])
+
+    def test_zip_dir_recursively(self):
+        """Test parallel zipping to a path and a non-seekable stream."""
+        with open(path.join(self.base_dir, 'a', 'big.bin'), 'wb') as fh:
+            fh.write(bytes(range(256)) * 4000)
+        iotools.write_list_to_file(['ä'], path.join(self.base_dir, 'ü.jpg'))
+        zip_path = path.join(self.base_dir, 'c', 'test.zip')
+        with patch.object(iotools, 'ZIP_STREAM_THRESHOLD', 1000):
+            iotools.zip_dir_recursively(
+                path.join(self.base_dir, 'a'), zip_path, max_workers=2)
+        with zipfile.ZipFile(zip_path) as zip_file:
+            self.assertIsNone(zip_file.testzip())
+            self.assertEqual(zip_file.namelist(),
+                             ['3.txt', 'b/4.txt', 'big.bin'])
+            self.assertEqual(zip_file.read('big.bin'),
+                             bytes(range(256)) * 4000)
+
+        class Pipe():
+            def __init__(self):
+                self.buffer = BytesIO()
+
+            def write(self, data):
+                return self.buffer.write(data)
+
+            def flush(self):
+                pass
+        pipe = Pipe()
+        iotools.zip_dir_recursively(self.base_dir, pipe, compresslevel=1)
+        with zipfile.ZipFile(BytesIO(pipe.buffer.getvalue())) as zip_file:
+            self.assertIsNone(zip_file.testzip())
+            zinfo = zip_file.getinfo('ü.jpg')
+            self.assertEqual(zinfo.compress_type, zipfile.ZIP_STORED)
+            self.assertEqual(zip_file.read(zinfo), 'ä\n'.encode())
+            self.assertEqual(zip_file.getinfo('a/big.bin').compress_type,
+                             zipfile.ZIP_DEFLATED)
+
+    def test_update_zip_dir_recursively(self):
+        """Test that incremental updates only recompress changed files."""
+        zip_dir = TemporaryDirectory()
+        self.addCleanup(zip_dir.cleanup)
+        zip_path = path.join(zip_dir.name, 'test.zip')
+        iotools.zip_dir_recursively(self.base_dir, zip_path)
+        iotools.remove_silent(path.join(self.base_dir, '2.LOG'))
+        iotools.write_list_to_file(['new'], path.join(self.base_dir, '5.txt'))
+        iotools.write_list_to_file(
+            ['modified'], path.join(self.base_dir, 'a', '3.txt'))
+        update = iotools.update_zip_dir_recursively(self.base_dir, zip_path)
+        self.assertEqual(update.added, ['5.txt'])
+        self.assertEqual(update.modified, ['a/3.txt'])
+        self.assertEqual(update.removed, ['2.LOG'])
+        self.assertEqual(update.unchanged, ['1.txt', 'a/b/4.txt'])
+        with zipfile.ZipFile(zip_path) as zip_file:
+            self.assertIsNone(zip_file.testzip())
+            self.assertEqual(zip_file.read('a/3.txt'), b'modified\n')
+            self.assertEqual(len(zip_file.namelist()), 4)
+
+    def test_iter_and_write_lines(self):
+        """Test lazy line reading and batched writing incl. compression."""
+        for name in ['lines.txt', 'lines.txt.gz', 'lines.bz2', 'lines.xz']:
+            file_path = path.join(self.base_dir, name)
+            count = iotools.write_lines(
+                (f' {i} ' if i % 3 else '' for i in range(10)), file_path,
+                batch_size=4)
+            self.assertEqual(count, 10)
+            self.assertEqual(list(iotools.iter_lines(
+                file_path, ignore_empty_lines=True)),
+                ['1', '2', '4', '5', '7', '8'])
+            self.assertEqual(len(list(iotools.iter_lines(
+                file_path, strip=False))), 10)
+        self.assertEqual(iotools.read_file_to_string(file_path, True),
+                         '1\n2\n4\n5\n7\n8')
+
+    def test_compressed_readers(self):
+        """Test that readers detect and decompress compressed input."""
+        content = b'1;a\n2;b\n3;c'
+        for name, compress in [('data.gz', gzip.compress),
+                               ('data.bz', bz2.compress),
+                               ('data.dat', lzma.compress)]:
+            file_path = path.join(self.base_dir, name)
+            with open(file_path, 'wb') as file_handle:
+                file_handle.write(compress(content))
+            self.assertEqual(iotools.read_file_to_list(file_path),
+                             ['1;a', '2;b', '3;c'])
+            self.assertEqual(iotools.countlines(file_path), 3)
+            self.assertEqual(iotools.read_csv_to_array(file_path)[2],
+                             ['3', 'c'])
+            self.assertEqual(
+                iotools.read_csv_to_array(file_path, processes=2)[2],
+                ['3', 'c'])
+            self.assertEqual(iotools.md5sum(file_path, decompress=True),
+                             hashlib.md5(content).hexdigest())
+            with iotools.open_compressed(file_path, threaded=False) as fh:
+                self.assertEqual(fh.read(), content)
+        self.assertEqual(iotools.countlines(file_path, chunk_size=2), 3)
+
+    def test_directory_snapshot(self):
+        """Test directory change detection by rescan and by inotify."""
+        for use_inotify in [False, True]:
+            snapshot = iotools.DirectorySnapshot(self.base_dir, use_inotify)
+            self.assertEqual(snapshot.subdirectories(), ['a', 'c'])
+            self.assertEqual(snapshot.subfiles(), ['1.txt', '2.LOG'])
+            self.assertEqual(snapshot.diff(), ([], [], []))
+            for name in ['n', '1.txt']:
+                iotools.write_list_to_file(
+                    [name], path.join(self.base_dir, name))
+            iotools.remove_silent(path.join(self.base_dir, '2.LOG'))
+            self.assertEqual(snapshot.diff(), (['n'], ['2.LOG'], ['1.txt']))
+            self.assertEqual(snapshot.subfiles(), ['1.txt', 'n'])
+            snapshot.close()
+            iotools.touch(path.join(self.base_dir, '2.LOG'))
+            iotools.remove_silent(path.join(self.base_dir, 'n'))
+        self.assertEqual(
+            iotools.get_immediate_subdirectories(self.base_dir, True),
+            ['c', 'a'])
+        # a failing initial scan must not leak the inotify watch
+        close = iotools._InotifyWatch.close
+        with patch.object(iotools.DirectorySnapshot, '_scan',
+                          side_effect=OSError('failed')), \
+                patch.object(iotools._InotifyWatch, 'close', autospec=True,
+                             side_effect=close) as watch_close:
+            with self.assertRaises(OSError):
+                iotools.DirectorySnapshot(self.base_dir, True)
+        self.assertEqual(watch_close.call_count, 1)
+
+    def test_appendzeros(self):
+        """Test the rename plan, execution, rollback and resume."""
+        work_dir = path.join(self.base_dir, 'c')
+        for name in ['1_x1', '2', '10', 'x']:
+            iotools.touch(path.join(work_dir, name))
+        makedirs(path.join(work_dir, '3'))
+        self.assertEqual(sorted(iotools.plan_appendzeros(work_dir)),
+                         [('1_x1', '01_x1'), ('2', '02')])
+        self.assertTrue(iotools.appendzeros(work_dir))
+        self.assertEqual(iotools.get_immediate_subfiles(work_dir),
+                         ['01_x1', '02', '10', 'x'])
+        self.assertTrue(iotools.appendzeros(work_dir, directories=True))
+        self.assertFalse(iotools.appendzeros(path.join(work_dir, '3')))
+
+        plan = [('01_x1', '02'), ('02', '01_x1'), ('x', 'y')]
+        journal_path = path.join(self.base_dir, 'journal')
+        rename_entry = iotools._rename_entry
+
+        def failing_rename(directory, source, target):
+            if target == 'y':
+                raise OSError('interrupted')
+            rename_entry(directory, source, target)
+        with patch.object(iotools, '_rename_entry', failing_rename):
+            with self.assertRaises(OSError):
+                iotools.execute_renames(work_dir, plan, journal_path, 1)
+        iotools.rollback_renames(journal_path)
+        self.assertEqual(iotools.get_immediate_subfiles(work_dir),
+                         ['01_x1', '02', '10', 'x'])
+        with patch.object(iotools, '_rename_entry', failing_rename):
+            with self.assertRaises(OSError):
+                iotools.execute_renames(work_dir, plan, journal_path, 1)
+        iotools.resume_renames(journal_path)
+        self.assertEqual(iotools.get_immediate_subfiles(work_dir),
+                         ['01_x1', '02', '10', 'y'])
+        self.assertFalse(path.exists(journal_path))
+        with self.assertRaises(FileExistsError):
+            iotools.execute_renames(work_dir, [('y', '10')])
+        # swapping names of the maximum length needs short temporary names
+        long_names = ['a' * 255, 'b' * 255]
+        for name in long_names:
+            iotools.touch(path.join(work_dir, name))
+        self.assertEqual(iotools.execute_renames(
+            work_dir, [tuple(long_names), tuple(reversed(long_names))]), 2)
+        self.assertEqual(iotools.get_immediate_subfiles(work_dir),
+                         ['01_x1', '02', '10', *long_names, 'y'])
+
+    def test_rollback_renames(self):
+        """Test rolling back renames interrupted in the first phase."""
+        work_dir = path.join(self.base_dir, 'c')
+        contents = {'a': 'A', 'b': 'B'}
+        for name, content in contents.items():
+            with open(path.join(work_dir, name), 'w') as handle:
+                handle.write(content)
+        plan = [('a', 'b'), ('b', 'a')]
+        journal_path = path.join(self.base_dir, 'journal')
+        rename_entry = iotools._rename_entry
+
+        def failing_rename(directory, source, target):
+            if source == 'a':
+                raise OSError('failed')
+            rename_entry(directory, source, target)
+
+        def interrupted_rename(directory, source, target):
+            if source == 'a':
+                rename_entry(directory, source, target)
+            raise OSError('interrupted')
+        for rename in [failing_rename, interrupted_rename]:
+            with patch.object(iotools, '_rename_entry', rename):
+                with self.assertRaises(OSError):
+                    iotools.execute_renames(work_dir, plan, journal_path, 1)
+            iotools.rollback_renames(journal_path)
+            self.assertEqual(iotools.get_immediate_subfiles(work_dir),
+                             ['a', 'b'])
+            for name, content in contents.items():
+                with open(path.join(work_dir, name)) as handle:
+                    self.assertEqual(handle.read(), content)
+        self.assertFalse(path.exists(journal_path))
@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+"""Test suite for the multi-threading tools."""
+
+import json
+import os
+from concurrent.futures import CancelledError
+from concurrent.futures.process import BrokenProcessPool
+from tempfile import TemporaryDirectory
+from threading import Event
+from time import monotonic, sleep
+from unittest import TestCase
+from unittest.mock import patch
+
+from recipes import threading
+
+
+class TestSuite(TestCase):  # noqa: D101
+
+    def test_add_task_futures(self):
+        """Test that results and exceptions end up in the futures."""
+        with threading.ThreadPool(2) as pool:
+            ok = pool.add_task(pow, 2, exp=10)
+            failed = pool.add_task(int, 'x')
+            self.assertEqual(ok.result(), 1024)
+            self.assertIsInstance(failed.exception(), ValueError)
+            self.assertGreaterEqual(ok.wait_time, 0)
+            self.assertGreaterEqual(ok.run_time, 0)
+        stats = pool.stats()
+        self.assertEqual((stats.submitted, stats.completed, stats.failed,
+                          stats.cancelled), (2, 1, 1, 0))
+        with self.assertRaises(RuntimeError):
+            pool.add_task(pow, 2, 2)
+
+    def test_map_window(self):
+        """Test ordered results with a bounded number of tasks in flight."""
+        consumed = []
+        in_flight = []
+
+        def items():
+            for item in range(100):
+                in_flight.append(item - len(consumed))
+                yield item
+
+        with threading.ThreadPool(4) as pool:
+            for result in pool.map(lambda x: x * x, items(), window=5):
+                consumed.append(result)
+            self.assertEqual(consumed, [x * x for x in range(100)])
+            self.assertLessEqual(max(in_flight), 5)
+            self.assertEqual(list(pool.map(pow, [2, 3], [3, 2])), [8, 9])
+            with self.assertRaises(ZeroDivisionError):
+                list(pool.map(lambda x: 1 / x, [1, 0, 2]))
+
+    def test_imap_unordered(self):
+        """Test that results are yielded as soon as they are done."""
+        def delayed(value):
+            sleep(0.2 if value == 0 else 0)
+            return value
+
+        with threading.ThreadPool(2) as pool:
+            results = list(pool.imap_unordered(delayed, range(6), window=3))
+        self.assertEqual(sorted(results), list(range(6)))
+        self.assertNotEqual(results[0], 0)
+
+    def test_shutdown(self):
+        """Test draining and cancelling queued tasks on shutdown."""
+        release = Event()
+        pool = threading.ThreadPool(1)
+        blocker = pool.add_task(release.wait)
+        queued = [pool.add_task(pow, 2, value) for value in range(3)]
+        pool.shutdown(wait=False)
+        release.set()
+        pool.shutdown()
+        self.assertTrue(blocker.result())
+        self.assertEqual([future.result() for future in queued], [1, 2, 4])
+        release.clear()
+        pool = threading.ThreadPool(1)
+        blocker = pool.add_task(release.wait)
+        queued = [pool.add_task(pow, 2, value) for value in range(3)]
+        while not blocker.running():
+            sleep(0.01)
+        pool.shutdown(wait=False, cancel_pending=True)
+        release.set()
+        pool.shutdown()
+        self.assertTrue(all(future.cancelled() for future in queued))
+        with self.assertRaises(CancelledError):
+            queued[0].result()
+        self.assertEqual(pool.stats().cancelled, 3)
+
+    def test_process_pool(self):
+        """Test chunked execution, recycling and failures in processes."""
+        with threading.ProcessPool(2, chunk_size=4,
+                                   max_tasks_per_child=3) as pool:
+            self.assertEqual(list(pool.map(pow, range(20), [2] * 20)),
+                             [x * x for x in range(20)])
+            failed = pool.add_task(int, 'x')
+            unpicklable = pool.add_task(lambda: None)
+            pids = [pool.add_task(os.getpid) for _ in range(12)]
+            pool.wait_completion()
+            self.assertIsInstance(failed.exception(), ValueError)
+            self.assertIsNotNone(unpicklable.exception())
+            self.assertGreater(len({pid.result() for pid in pids}), 2)
+            self.assertNotIn(os.getpid(), {pid.result() for pid in pids})
+            crashed = pool.add_task(os._exit, 1)
+            self.assertIsInstance(crashed.exception(), BrokenProcessPool)
+            self.assertEqual(pool.add_task(divmod, 7, 2).result(), (3, 1))
+        stats = pool.stats()
+        self.assertEqual((stats.completed, stats.failed), (33, 3))
+
+    def test_process_pool_shared_results(self):
+        """Test that large arrays are returned through shared memory."""
+        try:
+            import numpy
+        except ImportError:
+            self.skipTest('numpy not installed')
+        size = threading.SHARED_RESULT_MIN_BYTES
+        with threading.ProcessPool(1, shared_results=True) as pool:
+            with patch.object(threading, '_load_shared_array',
+                              wraps=threading._load_shared_array) as load:
+                small, large = pool.map(numpy.arange, [10, size])
+            self.assertEqual(load.call_count, 1)
+        self.assertEqual(small.tolist(), list(range(10)))
+        self.assertTrue((large == numpy.arange(size)).all())
+
+    def test_work_stealing_pool(self):
+        """Test stealing, priorities and nested tasks of the pool."""
+        release = Event()
+        release_other = Event()
+        order = []
+        with threading.WorkStealingPool(2) as pool:
+            # both threads block, so all further tasks are queued
+            blockers = [pool.add_task(release.wait),
+                        pool.add_task(release_other.wait)]
+            while not all(blocker.running() for blocker in blockers):
+                sleep(0.01)
+            for value in range(4):
+                pool.add_priority_task(1, order.append, ('low', value))
+            pool.add_priority_task(-1, order.append, ('high', 0))
+            release.set()
+            while len(order) < 5:
+                sleep(0.01)
+            release_other.set()
+            pool.wait_completion()
+            self.assertEqual(order[0], ('high', 0))
+            self.assertEqual(sorted(order[1:]),
+                             [('low', value) for value in range(4)])
+            # one thread is stuck, the other one steals its tasks
+            release.clear()
+            pool.add_task(release.wait)
+            squares = list(pool.map(pow, range(50), [2] * 50))
+            self.assertEqual(squares, [x * x for x in range(50)])
+            release.set()
+            nested = pool.add_task(
+                lambda: pool.add_task(pow, 3, 2).result())
+            self.assertEqual(nested.result(), 9)
+            self.assertEqual(
+                sum(pool.imap_unordered(abs, range(-5, 5))), 25)
+        self.assertTrue(pool.is_empty())
+        self.assertEqual(pool.stats().completed, 70)
+
+    def test_run_commands_from_file_parallel(self):
+        """Test logs, journal based resuming and throttling of commands."""
+        with TemporaryDirectory() as tmp:
+            commands = os.path.join(tmp, 'commands.txt')
+            journal = os.path.join(tmp, 'journal')
+            marker = os.path.join(tmp, 'marker')
+            with open(commands, 'w') as handle:
+                handle.write('echo out\n\n# comment\necho err >&2\n'
+                             + f'test -e {marker}\necho out\n')
+            summary = threading.run_commands_from_file_parallel(
+                commands, log_dir=tmp, journal=journal, max_workers=3)
+            self.assertEqual(summary, (3, 1, 0))
+            with open(os.path.join(tmp, '000001.out')) as handle:
+                self.assertEqual(handle.read(), 'out\n')
+            with open(os.path.join(tmp, '000004.err')) as handle:
+                self.assertEqual(handle.read(), 'err\n')
+            with open(journal) as handle:
+                records = [json.loads(line) for line in handle]
+            self.assertEqual(sorted(record['line'] for record in records),
+                             [1, 4, 5, 6])
+            # only the failed command runs again
+            open(marker, 'w').close()
+            summary = threading.run_commands_from_file_parallel(
+                commands, journal=journal)
+            self.assertEqual(summary, (1, 0, 3))
+            # with the machine overloaded commands run one after another
+            with open(commands, 'w') as handle:
+                handle.write('sleep 0.2\n' * 3)
+            start = monotonic()
+            with patch.object(threading, 'get_load_average',
+                              return_value=100.0):
+                summary = threading.run_commands_from_file_parallel(
+                    commands, max_workers=3)
+            self.assertEqual(summary, (3, 0, 0))
+            self.assertGreaterEqual(monotonic() - start, 0.6)
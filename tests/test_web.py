@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""Test suite for the web tools."""
+
+import os
+import re
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from tempfile import TemporaryDirectory
+from threading import Thread
+from unittest import TestCase
+from unittest.mock import patch
+from urllib.error import HTTPError
+
+from recipes import web
+
+CONTENT = bytes(range(256)) * 4096
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    """Serve the content of the server with keep-alive and byte ranges."""
+
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_GET(self):  # noqa: D102
+        self.server.requests.append((self.client_address, self.path,
+                                     self.headers.get('Range')))
+        if self.path in ('/moved', '/loop'):
+            self.send_response(302)
+            self.send_header('Location',
+                             '/file' if self.path == '/moved' else '/loop')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if self.path != '/file':
+            self.send_error(404)
+            return
+        content = self.server.content
+        etag = f'"{hash(content)}"'
+        first, last = 0, len(content) - 1
+        match = re.fullmatch(r'bytes=(\d+)-(\d*)',
+                             self.headers.get('Range', ''))
+        if_range = self.headers.get('If-Range')
+        if if_range and if_range != etag and not self.server.ignore_if_range:
+            match = None
+        if match and int(match.group(1)) >= len(content):
+            self.send_response(416)
+            self.send_header('Content-Range', f'bytes */{len(content)}')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if match:
+            first = int(match.group(1))
+            last = min(int(match.group(2) or last), last)
+            self.send_response(206)
+            self.send_header('Content-Range',
+                             f'bytes {first}-{last}/{len(content)}')
+        else:
+            self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(last - first + 1))
+        self.end_headers()
+        self.wfile.write(content[first:last + 1])
+
+    def log_message(self, *_):  # noqa: D102
+        pass
+
+
+class TestSuite(TestCase):  # noqa: D101
+
+    def setUp(self):  # noqa: D102
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), RangeHandler)
+        self.server.requests = []
+        self.server.content = CONTENT
+        self.server.ignore_if_range = False
+        Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+        self.tmp_dir = TemporaryDirectory()
+        self.target = os.path.join(self.tmp_dir.name, 'file.bin')
+        self.pool = web.ConnectionPool()
+
+    def tearDown(self):  # noqa: D102
+        self.pool.close()
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmp_dir.cleanup()
+
+    def read_target(self):  # noqa: D102
+        with open(self.target, 'rb') as handle:
+            return handle.read()
+
+    def test_download_file(self):
+        """Test chunked downloads over one reused connection."""
+        for url in [f'{self.url}/file', f'{self.url}/moved']:
+            size = web.download_file(url, self.target, chunk_size=1000,
+                                     pool=self.pool)
+            self.assertEqual(size, len(CONTENT))
+            self.assertEqual(self.read_target(), CONTENT)
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(len({address for address, _, _
+                              in self.server.requests}), 1)
+        self.assertEqual(os.listdir(self.tmp_dir.name), ['file.bin'])
+        with self.assertRaises(HTTPError) as context:
+            web.download_file(f'{self.url}/missing', self.target,
+                              pool=self.pool)
+        self.assertEqual(context.exception.code, 404)
+        self.assertEqual(self.read_target(), CONTENT)
+
+    def write_part(self, content, validator):  # noqa: D102
+        with open(self.target + web.DOWNLOAD_PART_SUFFIX, 'wb') as handle:
+            handle.write(content)
+        with open(self.target + web.DOWNLOAD_VALIDATOR_SUFFIX, 'w') as handle:
+            handle.write(validator)
+
+    def test_download_file_resume(self):
+        """Test that partial downloads are resumed with a range request."""
+        etag = f'"{hash(CONTENT)}"'
+        self.write_part(CONTENT[:1000], etag)
+        web.download_file(f'{self.url}/file', self.target, pool=self.pool)
+        self.assertEqual(self.read_target(), CONTENT)
+        self.assertEqual(os.listdir(self.tmp_dir.name), ['file.bin'])
+        self.assertEqual(self.server.requests[-1][2], 'bytes=1000-')
+        # an already complete partial download is just moved in place
+        self.write_part(CONTENT, etag)
+        os.remove(self.target)
+        web.download_file(f'{self.url}/file', self.target, pool=self.pool)
+        self.assertEqual(self.read_target(), CONTENT)
+        # without resuming the partial download is overwritten
+        self.write_part(b'x' * 1000, etag)
+        web.download_file(f'{self.url}/file', self.target, resume=False,
+                          pool=self.pool)
+        self.assertEqual(self.read_target(), CONTENT)
+        self.assertIsNone(self.server.requests[-1][2])
+
+    def test_download_file_stale_part(self):
+        """Test that partial downloads of other versions start over."""
+        parts = [(b'OLDOLD', '"old"'), (b'OLDOLD', ''),
+                 (CONTENT + b'OLD', f'"{hash(CONTENT)}"')]
+        for content, validator in parts:
+            for ignore_if_range in [False, True]:
+                self.server.ignore_if_range = ignore_if_range
+                self.write_part(content, validator)
+                web.download_file(f'{self.url}/file', self.target,
+                                  pool=self.pool)
+                self.assertEqual(self.read_target(), CONTENT)
+                self.assertEqual(os.listdir(self.tmp_dir.name), ['file.bin'])
+
+    def test_too_many_redirects(self):
+        """Test that redirect loops fail and release their connection."""
+        with self.assertRaises(HTTPError) as context:
+            with self.pool.open(f'{self.url}/loop'):
+                pass
+        self.assertEqual(context.exception.code, 302)
+        self.assertEqual(len(self.server.requests),
+                         web.DOWNLOAD_MAX_REDIRECTS + 1)
+        self.assertEqual(sum(map(len, self.pool._idle.values())), 1)
+
+    def test_download_file_parallel(self):
+        """Test fetching one file in parallel byte ranges."""
+        with patch.object(web, 'DOWNLOAD_MIN_RANGE_SIZE', 100000):
+            size = web.download_file(f'{self.url}/file', self.target,
+                                     chunk_size=4096, connections=4,
+                                     pool=self.pool)
+        self.assertEqual(size, len(CONTENT))
+        self.assertEqual(self.read_target(), CONTENT)
+        ranges = sorted(header for _, _, header in self.server.requests)
+        self.assertEqual(ranges, ['bytes=0-0', 'bytes=0-262143',
+                                  'bytes=262144-524287',
+                                  'bytes=524288-786431',
+                                  'bytes=786432-1048575'])
+        self.assertEqual(os.listdir(self.tmp_dir.name), ['file.bin'])